@@ -0,0 +1,86 @@
+"""
+Benchmark of lookups under a skewed (Zipf) workload, comparing the uniform TreapMap with the
+access-adaptive AdaptiveTreapMap.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_adaptive
+    python -m benchmarks.bench_adaptive --size 1000000 --lookups 1000000 --exponent 1.2
+
+Key i is looked up with probability proportional to 1 / rank(i) ** exponent, the ranks being shuffled
+over the keys so the hot keys are spread across the key range. Each treap is warmed up on a workload
+with the same hot keys before timing, and the mean depth of the keys looked up is reported next to the rate.
+"""
+
+from py_treaps.adaptive_treap_map import AdaptiveTreapMap
+from py_treaps.priority import RandomPriority
+from py_treaps.treap_map import TreapMap
+import argparse
+import itertools
+import random
+import time
+
+SEED = 2023
+
+
+def zipf_workload(n: int, count: int, exponent: float, rng: random.Random) -> list:
+    """
+    Returns `count` keys drawn from range(n) with Zipf distributed popularity.
+    The popularity ranks are shuffled over the keys with a fixed seed, so every workload shares the same hot keys.
+    """
+    keys = list(range(n))
+    random.Random(SEED).shuffle(keys)  # keys[r] is the key of rank r
+    cum_weights = list(itertools.accumulate(1 / (r + 1) ** exponent for r in range(n)))
+    return rng.choices(keys, cum_weights=cum_weights, k=count)
+
+
+def mean_depth(treap: TreapMap, probes: list) -> float:
+    total = 0
+    for key in probes:
+        node = treap.find_node(key)
+        while node.parent is not None:
+            node = node.parent
+            total += 1
+    return total / len(probes)
+
+
+def bench(treap: TreapMap, warmup: list, probes: list, repeat: int) -> tuple:
+    """
+    Warms treap up, then times the probes `repeat` times and keeps the best rate.
+    """
+    for key in warmup:
+        treap.lookup(key)
+    rate = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for key in probes:
+            treap.lookup(key)
+        rate = max(rate, len(probes) / (time.perf_counter() - start))
+    return rate, mean_depth(treap, probes[:10_000])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=200_000)
+    parser.add_argument('--exponent', type=float, default=1.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    warmup = zipf_workload(args.size, args.lookups, args.exponent, random.Random(SEED))
+    probes = zipf_workload(args.size, args.lookups, args.exponent, random.Random(SEED + 1))
+    items = [(k, k) for k in range(args.size)]
+
+    treaps = [
+        ('uniform', TreapMap.from_sorted(items, RandomPriority(SEED))),
+        ('count', AdaptiveTreapMap.from_sorted(items, RandomPriority(SEED), promotion='count')),
+        ('random', AdaptiveTreapMap.from_sorted(items, RandomPriority(SEED), promotion='random')),
+    ]
+    print(f"n={args.size:,}, {args.lookups:,} lookups, Zipf exponent {args.exponent}")
+    for name, treap in treaps:
+        rate, depth = bench(treap, warmup, probes, args.repeat)
+        print(f"{name:>8}: {rate:>12,.0f} lookups/sec, mean depth {depth:5.2f}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Multi-threaded stress and throughput benchmark of ConcurrentTreapMap.
+
+Reader threads look up random keys while one writer thread applies batches of inserts and removes.
+Run from the repository root:
+
+    python -m benchmarks.bench_concurrent
+    python -m benchmarks.bench_concurrent --readers 8 --seconds 5 --batch 64
+
+Each wrapped treap (a TreapMap behind the reader/writer lock, and a PersistentTreapMap read without
+locking) is checked for consistency at the end of its run.
+"""
+
+from py_treaps.concurrent_treap_map import ConcurrentTreapMap
+from py_treaps.persistent_treap_map import PersistentTreapMap
+from py_treaps.treap_map import TreapMap
+import argparse
+import random
+import threading
+import time
+
+
+def stress(cmap: ConcurrentTreapMap, n: int, readers: int, seconds: float, batch_size: int) -> dict:
+    """
+    Runs the readers and the writer against cmap for `seconds`, and returns the throughput and contention stats.
+    Keys below n are never removed, so every reader lookup of them must succeed.
+    """
+    with cmap.batch() as batch:
+        for k in range(n):
+            batch.insert(k, k)
+
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+    errors = []
+
+    def reader(i: int) -> None:
+        rng = random.Random(i)
+        count = 0
+        while not stop.is_set():
+            k = rng.randrange(n)
+            if cmap.lookup(k) != k:
+                errors.append(k)
+            count += 1
+        reads[i] = count
+
+    def writer() -> None:
+        rng = random.Random(-1)
+        while not stop.is_set():
+            with cmap.batch() as batch:
+                for _ in range(batch_size):
+                    k = n + rng.randrange(n)
+                    if rng.random() < 0.5:
+                        batch.insert(k, k)
+                    else:
+                        batch.remove(k)
+            writes[0] += batch_size
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    snapshot = cmap.snapshot()
+    keys = list(snapshot)
+    assert keys == sorted(keys) and len(keys) == len(snapshot), "Inconsistent treap after the run"
+    assert not errors, f"Readers missed {len(errors)} stable keys"
+
+    result = cmap.stats()
+    result['reads_per_sec'] = sum(reads) / seconds
+    result['writes_per_sec'] = writes[0] / seconds
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100_000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--batch', type=int, default=32)
+    args = parser.parse_args()
+
+    for name, treap in [('TreapMap', TreapMap()), ('PersistentTreapMap', PersistentTreapMap())]:
+        result = stress(ConcurrentTreapMap(treap), args.size, args.readers, args.seconds, args.batch)
+        print(f"{name} with {args.readers} readers and 1 writer (batches of {args.batch}):")
+        for key, value in result.items():
+            print(f"    {key:>20}: {value:,.3f}" if isinstance(value, float) else f"    {key:>20}: {value:,}")
+
+
+if __name__ == '__main__':
+    main()
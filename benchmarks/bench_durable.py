@@ -0,0 +1,51 @@
+"""
+Benchmark of the insert throughput of DurableTreapMap against the in-memory TreapMap, for several group sizes.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_durable
+    python -m benchmarks.bench_durable --inserts 100000 --groups 1 16 256 4096
+
+Every group commit is synced to disk with fsync, so the results depend heavily on the storage.
+"""
+
+from py_treaps.durable_treap_map import DurableTreapMap
+from py_treaps.treap_map import TreapMap
+import argparse
+import random
+import tempfile
+import time
+
+SEED = 2023
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--inserts', type=int, default=50_000)
+    parser.add_argument('--groups', type=int, nargs='+', default=[1, 16, 256, 4096])
+    args = parser.parse_args()
+
+    keys = random.Random(SEED).sample(range(10 * args.inserts), args.inserts)
+
+    treap = TreapMap()
+    start = time.perf_counter()
+    for k in keys:
+        treap.insert(k, k)
+    baseline = args.inserts / (time.perf_counter() - start)
+    print(f"{'in memory':>16}: {baseline:>10,.0f} inserts/sec")
+
+    for group_size in args.groups:
+        with tempfile.TemporaryDirectory() as directory:
+            durable = DurableTreapMap(directory, group_size=group_size)
+            start = time.perf_counter()
+            for k in keys:
+                durable.insert(k, k)
+            durable.commit()
+            rate = args.inserts / (time.perf_counter() - start)
+            durable.close()
+        label = f'group of {group_size}'
+        print(f"{label:>16}: {rate:>10,.0f} inserts/sec, {rate / baseline:4.0%} of in memory", flush=True)
+
+
+if __name__ == '__main__':
+    main()
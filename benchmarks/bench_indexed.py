@@ -0,0 +1,71 @@
+"""
+Benchmark of IndexedTreapMap against TreapMap: point lookups, inserts, removals and memory.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_indexed
+    python -m benchmarks.bench_indexed --size 1000000 --keys str
+
+Memory is measured with tracemalloc while building each map from the same keys and values,
+so it covers the nodes and the index but not the keys and values themselves.
+"""
+
+from py_treaps.indexed_treap_map import IndexedTreapMap
+from py_treaps.treap_map import TreapMap
+import argparse
+import random
+import time
+import tracemalloc
+
+SEED = 2023
+
+
+def rate(fn, items: list, repeat: int) -> float:
+    """
+    Calls fn on each item, `repeat` times, and returns the best rate in calls per second.
+    """
+    best = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = max(best, len(items) / (time.perf_counter() - start))
+    return best
+
+
+def footprint(cls, items: list) -> tuple:
+    tracemalloc.start()
+    treap = cls.from_items(items)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return treap, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=200_000)
+    parser.add_argument('--lookups', type=int, default=200_000)
+    parser.add_argument('--keys', choices=('int', 'str'), default='int')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(SEED)
+    sample = rng.sample(range(10 * args.size), args.size + args.lookups)
+    if args.keys == 'str':
+        sample = [f'key-{k:012}' for k in sample]
+    keys, fresh = sample[:args.size], sample[args.size:]  # The fresh keys are inserted, then removed
+    items = [(k, k) for k in keys]
+    probes = rng.choices(keys, k=args.lookups)
+
+    print(f"{'':>16} {'lookups/sec':>12} {'inserts/sec':>12} {'removes/sec':>12} {'bytes/key':>10}")
+    for cls in (TreapMap, IndexedTreapMap):
+        treap, size = footprint(cls, items)
+        lookups = rate(treap.lookup, probes, args.repeat)
+        inserts = rate(lambda k: treap.insert(k, k), fresh, 1)
+        removes = rate(treap.remove, fresh, 1)
+        print(f"{cls.__name__:>16} {lookups:>12,.0f} {inserts:>12,.0f} {removes:>12,.0f} {size / args.size:>10.0f}",
+              flush=True)
+
+
+if __name__ == '__main__':
+    main()
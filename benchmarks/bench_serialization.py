@@ -0,0 +1,63 @@
+"""
+Benchmark of saving and reloading a TreapMap, comparing `dump`/`load` with pickling the TreapMap.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --size 100000 --values str
+
+Reports the time to write and to read back the map, and the size of the file.
+Pickle recurses through the nodes, so the recursion limit is raised for it.
+"""
+
+from py_treaps.priority import RandomPriority
+from py_treaps.treap_map import TreapMap
+import argparse
+import io
+import pickle
+import sys
+import time
+
+SEED = 2023
+
+
+def timed(fn) -> tuple:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def bench_dump_load(treap: TreapMap) -> tuple:
+    buffer = io.BytesIO()
+    write, _ = timed(lambda: treap.dump(buffer))
+    data = buffer.getvalue()
+    read, loaded = timed(lambda: TreapMap.load(io.BytesIO(data)))
+    assert loaded.get_root_node().key == treap.get_root_node().key and len(loaded) == len(treap)
+    return write, read, len(data)
+
+
+def bench_pickle(treap: TreapMap) -> tuple:
+    write, data = timed(lambda: pickle.dumps(treap, pickle.HIGHEST_PROTOCOL))
+    read, loaded = timed(lambda: pickle.loads(data))
+    assert len(loaded) == len(treap)
+    return write, read, len(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1_000_000)
+    parser.add_argument('--values', choices=['int', 'str'], default='int')
+    args = parser.parse_args()
+
+    make_value = int if args.values == 'int' else str
+    treap = TreapMap.from_sorted(((k, make_value(k)) for k in range(args.size)), RandomPriority(SEED))
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100_000))
+
+    print(f"n={args.size:,}, {args.values} values")
+    for name, bench in [('dump/load', bench_dump_load), ('pickle', bench_pickle)]:
+        write, read, size = bench(treap)
+        print(f"{name:>10}: write {write:7.3f}s, read {read:7.3f}s, {size / 2 ** 20:8.1f} MiB", flush=True)
+
+
+if __name__ == '__main__':
+    main()
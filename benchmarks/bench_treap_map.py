@@ -0,0 +1,153 @@
+"""
+Micro-benchmarks of the TreapMap operations, reported in operations per second.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_treap_map
+    python -m benchmarks.bench_treap_map --sizes 1000 10000 --save baseline.json
+    python -m benchmarks.bench_treap_map --sizes 1000 10000 --baseline baseline.json
+
+With --baseline, any operation more than --tolerance slower than the saved run is reported
+and the script exits with status 1, so it can gate changes.
+"""
+
+from py_treaps.priority import RandomPriority
+from py_treaps.treap_map import TreapMap
+import argparse
+import json
+import random
+import sys
+import time
+
+SEED = 2023
+BATCH = 1_000  # Operations timed per repetition
+MELD_NODES = 200_000  # Bound on the nodes of the meld inputs built per repetition
+
+
+def build(keys) -> TreapMap:
+    """
+    Builds a treap holding `keys` with reproducible priorities.
+    """
+    return TreapMap.from_items(((k, k) for k in keys), priority_source=RandomPriority(SEED))
+
+
+def bench_lookup(n: int, rng: random.Random) -> float:
+    t = build(range(0, 2 * n, 2))
+    probes = [rng.randrange(2 * n) for _ in range(BATCH)]
+    start = time.perf_counter()
+    for k in probes:
+        t.lookup(k)
+    return BATCH / (time.perf_counter() - start)
+
+
+def bench_insert(n: int, rng: random.Random) -> float:
+    t = build(range(0, 2 * n, 2))
+    new_keys = [2 * rng.randrange(n) + 1 for _ in range(BATCH)]
+    start = time.perf_counter()
+    for k in new_keys:
+        t.insert(k, k)
+    return BATCH / (time.perf_counter() - start)
+
+
+def bench_remove(n: int, rng: random.Random) -> float:
+    t = build(range(n))
+    victims = rng.sample(range(n), min(BATCH, n))
+    start = time.perf_counter()
+    for k in victims:
+        t.remove(k)
+    return len(victims) / (time.perf_counter() - start)
+
+
+def bench_split(n: int, rng: random.Random) -> float:
+    t = build(range(n))
+    thresholds = [rng.randrange(n) + 0.5 for _ in range(BATCH)]
+    elapsed = 0.0
+    for threshold in thresholds:
+        start = time.perf_counter()
+        left, right = t.split(threshold)
+        elapsed += time.perf_counter() - start
+        # Keys and priorities fix the shape, so joining back rebuilds the same treap for the next split
+        left.join(right)
+        t = left
+    return BATCH / elapsed
+
+
+def bench_join(n: int, rng: random.Random) -> float:
+    left, right = build(range(n)), build(range(n, 2 * n))
+    elapsed = 0.0
+    for _ in range(BATCH):
+        start = time.perf_counter()
+        left.join(right)
+        elapsed += time.perf_counter() - start
+        left, right = left.split(n)  # Restores the same two treaps for the next join
+    return BATCH / elapsed
+
+
+def bench_meld(n: int, rng: random.Random) -> float:
+    # Meld a treap one tenth the size, with keys interleaved through the larger one.
+    # Melds consume their inputs, so enough copies for MELD_NODES nodes in total are built before timing.
+    big = build(range(0, 10 * n, 10))
+    small = build(range(5, 10 * n, 100))
+    count = max(1, min(BATCH, MELD_NODES // n))
+    pairs = [(big.copy(), small.copy()) for _ in range(count)]
+    start = time.perf_counter()
+    for big, small in pairs:
+        big.meld(small)
+    return count / (time.perf_counter() - start)
+
+
+BENCHMARKS = {
+    'lookup': bench_lookup,
+    'insert': bench_insert,
+    'remove': bench_remove,
+    'split': bench_split,
+    'join': bench_join,
+    'meld': bench_meld,
+}
+
+
+def run(sizes, operations, repeat: int) -> dict:
+    """
+    Runs each benchmark `repeat` times per size and keeps the best rate.
+    """
+    results = {}
+    for name in operations:
+        for n in sizes:
+            rng = random.Random(SEED)
+            rate = max(BENCHMARKS[name](n, rng) for _ in range(repeat))
+            results[f'{name}/{n}'] = rate
+            print(f'{name:>8} n={n:<9,} {rate:>14,.0f} ops/sec', flush=True)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--ops', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results against this JSON file.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown against the baseline.')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.ops, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = [
+            (name, baseline[name], rate) for name, rate in results.items()
+            if name in baseline and rate < baseline[name] * (1 - args.tolerance)
+        ]
+        for name, before, after in regressions:
+            print(f'REGRESSION {name}: {before:,.0f} -> {after:,.0f} ops/sec')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
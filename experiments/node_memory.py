@@ -0,0 +1,51 @@
+from py_treaps.treap_map import TreapMap
+from py_treaps.treap_node import TreapNode
+import tracemalloc
+
+"""
+Measure the memory used per entry by TreapNode, against a node storing the same attributes in a __dict__.
+"""
+
+
+class DictTreapNode:
+    """
+    The six attribute TreapNode layout, without __slots__.
+    """
+
+    def __init__(self, key, value, priority):
+        self.key = key
+        self.value = value
+        self.priority = priority
+        self.parent = None
+        self.left_child = None
+        self.right_child = None
+
+
+N = 100_000
+
+
+def bytes_per_node(make_node) -> float:
+    """
+    Average number of bytes allocated by make_node, not counting the keys and values themselves.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    nodes = [make_node(i) for i in range(N)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    list_size = 8 * len(nodes)  # The list holding the nodes is not part of a node
+    return (after - before - list_size) / N
+
+
+# Priorities are large ints, so they are counted as part of the node
+dict_bytes = bytes_per_node(lambda i: DictTreapNode(None, None, 2**61 + i))
+slot_bytes = bytes_per_node(lambda i: TreapNode(None, None, priority=2**61 + i))
+
+tracemalloc.start()
+t = TreapMap.from_sorted((i, i) for i in range(N))
+map_bytes = tracemalloc.get_traced_memory()[0] / N
+tracemalloc.stop()
+
+print(f"__dict__ node: {dict_bytes:.0f} bytes per entry")
+print(f"__slots__ node: {slot_bytes:.0f} bytes per entry")
+print(f"TreapMap built with from_sorted, including int keys and values: {map_bytes:.0f} bytes per entry")
@@ -0,0 +1,125 @@
+"""
+This module contains a TreapMap that moves frequently looked up keys towards the root.
+
+Every successful lookup promotes the node's priority, and `rebalance_heap`
+rotates it up past any parent with a lower priority. Two promotions are offered:
+
+- 'count' keeps an access count w per node, and sets the priority to u ** (1 / w)
+  scaled to the priority range, u being the node's original uniform draw.
+- 'random' draws a fresh priority on each access and keeps the larger one.
+
+Either way a node accessed w times holds a priority distributed as the largest of
+w uniform draws, which makes the treap a weighted treap with weights the access
+counts. The expected depth of a key accessed a fraction p of the time is
+O(log(1/p)), see karma.md.
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+from py_treaps.comparable import KT, VT
+from py_treaps.priority import MAX_PRIORITY, PrioritySource
+from py_treaps.treap_map import TreapMap
+from py_treaps.treap_node import TreapNode
+
+PROMOTIONS = ('count', 'random')
+
+
+class AdaptiveTreapNode(TreapNode):
+    """
+    A node of an AdaptiveTreapMap.
+
+    Added attributes:
+        count (int): The number of times the key was inserted or looked up.
+        base_priority (int): The priority drawn when the node was created.
+    """
+
+    __slots__ = ('count', 'base_priority')
+
+    def __init__(self, key: KT, value: VT, parent: Optional[TreapNode] = None, priority: Optional[int] = None):
+        super().__init__(key, value, parent, priority)
+        self.count: int = 1
+        self.base_priority: int = self.priority
+
+
+class AdaptiveTreapMap(TreapMap[KT, VT]):
+    """
+    A TreapMap whose lookups promote the priority of the key found, see the module docstring.
+    Lookups therefore rotate the treap, and must not run alongside other readers.
+
+    The 'random' promotion draws from `priority_source`, which should then be random rather than hash based.
+    """
+
+    reads_mutate = True  # Lookups rotate
+
+    def __init__(
+        self, root: AdaptiveTreapNode = None, priority_source: PrioritySource = None, promotion: str = 'count'
+    ):
+        if promotion not in PROMOTIONS:
+            raise ValueError(f"Unknown promotion {promotion!r}, expected one of {PROMOTIONS}.")
+        super().__init__(root, priority_source)
+        self.promotion = promotion
+        self.promote_always = promotion == 'random'  # Otherwise only when the count reaches a power of two
+
+    def new_node(self, key: KT, value: VT, parent: TreapNode = None, priority: int = None) -> AdaptiveTreapNode:
+        if priority is None:
+            priority = self.priority_source(key)
+        return AdaptiveTreapNode(key, value, parent, priority)
+
+    def empty_like(self, root: AdaptiveTreapNode = None) -> AdaptiveTreapMap[KT, VT]:
+        return type(self)(root, self.priority_source, self.promotion)
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        # Same descent as `TreapMap.lookup`, inlined as this is the hot path
+        x = self.root
+        candidate = None
+        while x is not None:
+            if key < x.key:
+                x = x.left_child
+            else:
+                candidate = x
+                x = x.right_child
+        if candidate is None or candidate.key != key:
+            return None
+        # Counted inline, as with the 'count' promotion most accesses stop there
+        count = candidate.count = candidate.count + 1
+        if self.promote_always or not count & (count - 1):
+            self.promote(candidate)
+        return candidate.value
+
+    def value_changed(self, node: AdaptiveTreapNode) -> None:
+        # Inserting a key already in the Treap counts as an access
+        node.count += 1
+        if self.promote_always or not node.count & (node.count - 1):
+            self.promote(node)
+
+    def promote(self, node: AdaptiveTreapNode) -> None:
+        """
+        Raises the priority of node after an access, and rotates it up to restore the heap property.
+        Priorities never decrease, so the rotations only move node towards the root.
+
+        With the 'count' promotion this is only called when the count reaches a power of two,
+        which keeps the weight within a factor of 2 of the count, and so the depth within an additive constant.
+        """
+        if self.promote_always:
+            priority = self.priority_source(node.key)
+        else:
+            priority = int(MAX_PRIORITY * (node.base_priority / MAX_PRIORITY) ** (1 / node.count))
+        if priority > node.priority:
+            node.priority = min(priority, MAX_PRIORITY - 1)
+            parent = node.parent
+            if parent is not None and node.priority > parent.priority:
+                self.rebalance_heap(node)
+
+    def depth(self, key: KT) -> Optional[int]:
+        """
+        Returns the number of edges between the root and the node holding key, or None if key is not in the Treap.
+        """
+        node = self.find_node(key)
+        if node is None:
+            return None
+        depth = 0
+        while node.parent is not None:
+            node = node.parent
+            depth += 1
+        return depth
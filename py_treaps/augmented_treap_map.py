@@ -0,0 +1,189 @@
+"""
+This module contains a TreapMap whose nodes also store an aggregate of their subtreap.
+
+The aggregate is described by a monoid: an associative `combine` function with
+an `identity` element, applied in key order to the `measure` of each node.
+Every node stores the combination over its own subtreap, recomputed by
+`update` wherever the sizes are, so it is kept through rotations, splits,
+joins and melds. The aggregate over any key range is then assembled from
+O(log n) stored subtreap aggregates.
+"""
+
+from __future__ import annotations
+import typing
+from typing import Any, Optional
+
+from py_treaps.comparable import KT, VT
+from py_treaps.priority import PrioritySource
+from py_treaps.treap_map import TreapMap
+from py_treaps.treap_node import TreapNode
+
+
+def take_value(key: KT, value: VT) -> VT:
+    return value
+
+
+class Monoid:
+    """
+    An associative `combine` function with an `identity` element, so that
+    combine(identity, a) == combine(a, identity) == a.
+
+    `measure(key, value)` gives the element a single node contributes, its value by default.
+    `combine` is always applied in key order, so it does not need to be commutative.
+    """
+
+    def __init__(
+        self, combine: typing.Callable[[Any, Any], Any], identity: Any,
+        measure: typing.Callable[[KT, VT], Any] = take_value
+    ):
+        self.combine = combine
+        self.identity = identity
+        self.measure = measure
+
+
+def add(left: Any, right: Any) -> Any:
+    return left + right
+
+
+def min_of(left: Any, right: Any) -> Any:
+    # None is the identity, an empty range has no minimum
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return right if right < left else left
+
+
+def max_of(left: Any, right: Any) -> Any:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return right if right > left else left
+
+
+SUM = Monoid(add, 0)
+MIN = Monoid(min_of, None)
+MAX = Monoid(max_of, None)
+COUNT = Monoid(add, 0, lambda key, value: 1)
+
+
+class AugmentedTreapNode(TreapNode):
+    """
+    A node of an AugmentedTreapMap.
+
+    Added attributes:
+        monoid (Monoid): The monoid aggregated by the treap holding this node.
+        aggregate: The combination of the measures of every node in the subtreap rooted at this node, in key order.
+    """
+
+    __slots__ = ('monoid', 'aggregate')
+
+    def __init__(
+        self, key: KT, value: VT, monoid: Monoid, parent: Optional[TreapNode] = None, priority: Optional[int] = None
+    ):
+        super().__init__(key, value, parent, priority)
+        self.monoid: Monoid = monoid
+        self.aggregate: Any = monoid.measure(key, value)
+
+    def update(self) -> None:
+        """
+        Recomputes the size and the aggregate of this node's subtreap from those of its children.
+        """
+        super().update()
+        monoid = self.monoid
+        total = monoid.measure(self.key, self.value)
+        if self.left_child is not None:
+            total = monoid.combine(self.left_child.aggregate, total)
+        if self.right_child is not None:
+            total = monoid.combine(total, self.right_child.aggregate)
+        self.aggregate = total
+
+
+class AugmentedTreapMap(TreapMap[KT, VT]):
+    """
+    A TreapMap answering `aggregate(lo, hi)` over any key range in O(log n).
+    Treaps joined or melded into this one must aggregate the same monoid.
+    """
+
+    def __init__(self, root: AugmentedTreapNode = None, priority_source: PrioritySource = None, monoid: Monoid = SUM):
+        super().__init__(root, priority_source)
+        self.monoid = monoid
+
+    def new_node(self, key: KT, value: VT, parent: TreapNode = None, priority: int = None) -> AugmentedTreapNode:
+        if priority is None:
+            priority = self.priority_source(key)
+        return AugmentedTreapNode(key, value, self.monoid, parent, priority)
+
+    def empty_like(self, root: AugmentedTreapNode = None) -> AugmentedTreapMap[KT, VT]:
+        return type(self)(root, self.priority_source, self.monoid)
+
+    def add_to_sizes(self, node: Optional[TreapNode], delta: int) -> None:
+        """
+        Recomputes the size and aggregate of node and each of its ancestors, after a child was linked or unlinked.
+        """
+        while node is not None:
+            node.update()
+            node = node.parent
+
+    def value_changed(self, node: TreapNode) -> None:
+        self.add_to_sizes(node, 0)
+
+    def aggregate(self, lo: KT = None, hi: KT = None, inclusive: typing.Tuple[bool, bool] = (True, False)) -> Any:
+        """
+        Returns the combination of the measures of the nodes with keys between lo and hi, in key order,
+        with the bounds treated as in `range`. Returns the identity of the monoid for an empty range.
+
+        Descends to the highest node in range, below which the whole range lies, then follows the paths to
+        both bounds. Each in range node on the path to lo brings its right subtreap along, and each one on the
+        path to hi its left subtreap, so O(log n) stored aggregates are combined.
+        """
+        monoid = self.monoid
+        combine, measure = monoid.combine, monoid.measure
+        lo_inclusive, hi_inclusive = inclusive
+
+        def above_lo(key: KT) -> bool:
+            return lo is None or key > lo or (lo_inclusive and key == lo)
+
+        def below_hi(key: KT) -> bool:
+            return hi is None or key < hi or (hi_inclusive and key == hi)
+
+        # Nodes are pushed before their children are read, for subclasses carrying lazy updates
+        x = self.root
+        while x is not None:
+            x.push()
+            if not above_lo(x.key):
+                x = x.right_child
+            elif not below_hi(x.key):
+                x = x.left_child
+            else:
+                break
+        if x is None:
+            return monoid.identity
+
+        # Every key in the left subtreap is below hi, so only lo bounds the walk down it, and only hi on the right
+        total = measure(x.key, x.value)
+        y = x.left_child
+        while y is not None:
+            y.push()
+            if above_lo(y.key):
+                part = measure(y.key, y.value)
+                if y.right_child is not None:
+                    part = combine(part, y.right_child.aggregate)
+                total = combine(part, total)
+                y = y.left_child
+            else:
+                y = y.right_child
+
+        y = x.right_child
+        while y is not None:
+            y.push()
+            if below_hi(y.key):
+                part = measure(y.key, y.value)
+                if y.left_child is not None:
+                    part = combine(y.left_child.aggregate, part)
+                total = combine(total, part)
+                y = y.right_child
+            else:
+                y = y.left_child
+        return total
@@ -0,0 +1,250 @@
+"""
+This module contains a thread safe wrapper around a Treap.
+
+Readers share a reader/writer lock, writers hold it alone, and writes can be
+batched so a group of updates costs one lock acquisition. Wrapping a
+PersistentTreapMap makes `snapshot` O(1), and a snapshot can be read without
+any locking while writers carry on.
+"""
+
+from __future__ import annotations
+import contextlib
+import threading
+import time
+import typing
+from typing import Dict, List, Optional, Tuple
+
+from py_treaps.comparable import KT, VT
+from py_treaps.persistent_treap_map import PersistentTreapMap
+from py_treaps.treap import Treap
+from py_treaps.treap_map import TreapMap
+
+
+class RWLock:
+    """
+    A reader/writer lock: any number of readers, or a single writer.
+
+    Writers are preferred, once a writer is waiting new readers wait behind it, so a steady stream
+    of readers cannot starve the writers. The lock is not reentrant.
+
+    Also counts acquisitions, how many of them had to wait, and the total time spent waiting.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+        self.read_acquisitions = 0
+        self.write_acquisitions = 0
+        self.contended_reads = 0
+        self.contended_writes = 0
+        self.read_wait_time = 0.0
+        self.write_wait_time = 0.0
+
+    def acquire_read(self) -> None:
+        with self._cond:
+            if self._writer or self._waiting_writers:
+                self.contended_reads += 1
+                start = time.perf_counter()
+                while self._writer or self._waiting_writers:
+                    self._cond.wait()
+                self.read_wait_time += time.perf_counter() - start
+            self._readers += 1
+            self.read_acquisitions += 1
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._cond:
+            if self._writer or self._readers:
+                self.contended_writes += 1
+                start = time.perf_counter()
+                self._waiting_writers += 1
+                while self._writer or self._readers:
+                    self._cond.wait()
+                self._waiting_writers -= 1
+                self.write_wait_time += time.perf_counter() - start
+            self._writer = True
+            self.write_acquisitions += 1
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def read_locked(self) -> typing.Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write_locked(self) -> typing.Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class WriteBatch:
+    """
+    Updates recorded by `ConcurrentTreapMap.batch`, applied together when the batch is committed.
+    """
+
+    def __init__(self):
+        self.operations: List[Tuple[str, tuple]] = []
+
+    def insert(self, key: KT, value: VT) -> None:
+        self.operations.append(('insert', (key, value)))
+
+    def remove(self, key: KT) -> None:
+        self.operations.append(('remove', (key,)))
+
+    def __len__(self) -> int:
+        return len(self.operations)
+
+
+class ConcurrentTreapMap:
+    """
+    Wraps a Treap so it can be shared between threads.
+
+    Lookups hold the read lock, so they run alongside each other but never see a writer half way
+    through a rotation. Updates hold the write lock. `read` and `write` hold a lock around
+    compound operations on the wrapped Treap, and `snapshot` hands out a copy to read without locking.
+
+    When wrapping a PersistentTreapMap, lookups skip the lock altogether: they read the root of the
+    current version once, and the nodes below it never change.
+
+    Treaps whose reads change the nodes, marked by `reads_mutate` (AdaptiveTreapMap rotates on lookup,
+    LazyTreapMap pushes tags), cannot have readers run alongside each other. For these every read,
+    including `read` blocks and `snapshot`, holds the write lock instead.
+    """
+
+    def __init__(self, treap: Treap[KT, VT] = None):
+        self.treap = TreapMap() if treap is None else treap
+        self.lock = RWLock()
+        self.lock_free_reads = isinstance(self.treap, PersistentTreapMap)
+        self.exclusive_reads = getattr(self.treap, 'reads_mutate', False)
+        self.batches = 0
+        self.batched_operations = 0
+
+    def read_locked(self) -> typing.ContextManager[None]:
+        """
+        Returns the lock to hold while reading: the write lock for treaps whose reads mutate, the read lock otherwise.
+        """
+        return self.lock.write_locked() if self.exclusive_reads else self.lock.read_locked()
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        if self.lock_free_reads:
+            return self.treap.lookup(key)
+        with self.read_locked():
+            return self.treap.lookup(key)
+
+    def __contains__(self, key: KT) -> bool:
+        if self.lock_free_reads:
+            return key in self.treap
+        with self.read_locked():
+            return key in self.treap
+
+    def __len__(self) -> int:
+        if self.lock_free_reads:
+            return len(self.treap)
+        with self.read_locked():
+            return len(self.treap)
+
+    def insert(self, key: KT, value: VT) -> None:
+        with self.lock.write_locked():
+            self.treap.insert(key, value)
+
+    def remove(self, key: KT) -> Optional[VT]:
+        with self.lock.write_locked():
+            return self.treap.remove(key)
+
+    @contextlib.contextmanager
+    def read(self) -> typing.Iterator[Treap[KT, VT]]:
+        """
+        Holds the read lock (the write lock if reads mutate) for the duration of the block, yielding the wrapped Treap.
+        The Treap must not be modified inside the block.
+        """
+        with self.read_locked():
+            yield self.treap
+
+    @contextlib.contextmanager
+    def write(self) -> typing.Iterator[Treap[KT, VT]]:
+        """
+        Holds the write lock for the duration of the block, yielding the wrapped Treap.
+        """
+        with self.lock.write_locked():
+            yield self.treap
+
+    @contextlib.contextmanager
+    def batch(self) -> typing.Iterator[WriteBatch]:
+        """
+        Records the inserts and removes made on the yielded WriteBatch, and commits them in order
+        under a single acquisition of the write lock when the block ends.
+        Nothing is applied if the block raises.
+        """
+        batch = WriteBatch()
+        yield batch
+        self.commit(batch)
+
+    def commit(self, batch: WriteBatch) -> None:
+        """
+        Applies the operations of a WriteBatch under a single acquisition of the write lock.
+        On a PersistentTreapMap the batch is applied to a private version which is then published at once,
+        so lock free readers see all of the batch or none of it.
+        """
+        if not batch.operations:
+            return
+        with self.lock.write_locked():
+            target = self.treap.snapshot() if self.lock_free_reads else self.treap
+            for name, args in batch.operations:
+                getattr(target, name)(*args)
+            if self.lock_free_reads:
+                self.treap.root = target.root
+            self.batches += 1
+            self.batched_operations += len(batch.operations)
+
+    def snapshot(self) -> Treap[KT, VT]:
+        """
+        Returns a copy of the current contents that can be read without any locking.
+        O(1) and lock free when wrapping a PersistentTreapMap,
+        otherwise the contents are copied in O(n) under the read lock (the write lock if reads mutate).
+        The copy keeps the priorities of the nodes, so no priority is drawn from the wrapped Treap's source.
+        """
+        if self.lock_free_reads:
+            return self.treap.snapshot()
+        with self.read_locked():
+            entries = ((node.key, node.value, node.priority) for node in self.treap.iter_nodes())
+            return PersistentTreapMap.from_entries(entries, self.treap.priority_source)
+
+    def __iter__(self) -> typing.Iterator[KT]:
+        """
+        Iterates over a snapshot, so the iteration neither holds the lock nor sees later updates.
+        """
+        return iter(self.snapshot())
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the lock contention and batching counters.
+        """
+        lock = self.lock
+        return {
+            'read_acquisitions': lock.read_acquisitions,
+            'write_acquisitions': lock.write_acquisitions,
+            'contended_reads': lock.contended_reads,
+            'contended_writes': lock.contended_writes,
+            'read_wait_time': lock.read_wait_time,
+            'write_wait_time': lock.write_wait_time,
+            'batches': self.batches,
+            'batched_operations': self.batched_operations,
+        }
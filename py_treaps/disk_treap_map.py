@@ -0,0 +1,555 @@
+"""
+This module contains a treap stored in a memory-mapped file, for maps larger than memory.
+
+Every node is a fixed-size record: priority, left and right child offsets, key and
+value, packed with `struct`. Child links are byte offsets into the file, 0 standing
+for no child, since the header occupies the start of the file. Keys and values are
+therefore fixed width, described by struct format codes ('q' for 64 bit integers,
+'d' for floats, '16s' for byte strings of up to 16 bytes, ...).
+
+Operations read and write the records in place through the mapping, so opening a
+file only reads its header. Records near the root are read by every operation, and
+are kept decoded in memory. Records of removed nodes are chained into a free list
+and reused by later inserts.
+
+There are no parent links, as updating them would touch every moved child's record.
+Insertion and removal are done top down along the search path instead: an insert
+splits the subtreap where the new node belongs and hangs the halves below it, a
+remove merges the children of the node in its place.
+
+`split` and `join` split and merge the records along a path in the same way, in
+O(log n). A map lives in a single file though, so the records crossing between
+files are copied: `split` copies the keys from the threshold on into a new file,
+which it refuses to create over an existing one, and `join` copies the other map's
+records into this one, in O(m) for m records. `meld` and `difference` are not supported.
+"""
+
+from __future__ import annotations
+import math
+import mmap
+import os
+import struct
+import typing
+from typing import Dict, List, Optional, Tuple
+
+from py_treaps.comparable import KT, VT
+from py_treaps.priority import DEFAULT_PRIORITY_SOURCE, PrioritySource
+from py_treaps.treap import Treap
+from py_treaps.treap_views import TreapItemsView, TreapKeysView, TreapValuesView
+
+MAGIC = b'TRPD'
+# magic, record size, root, number of nodes, end of the last record, head of the free list, key and value formats
+HEADER = struct.Struct('<4sIQQQQ16s16s')
+RECORDS_START = 128  # Records follow the header, at offsets which are never 0
+INITIAL_RECORDS = 1024
+
+Record = Tuple[int, int, int, typing.Any, typing.Any]  # priority, left, right, key, value
+
+
+class DiskNode:
+    """
+    A decoded copy of a record of a DiskTreapMap, as returned by `get_root_node` and `iter_nodes`.
+    Changing it does not change the file.
+
+    Attributes:
+        offset (int): The offset of the record in the file.
+        key (KT): The key of the node.
+        value (VT): The value associated with the key of the node.
+        priority (int): The priority of the node.
+        left (int): The offset of the left child's record, or 0.
+        right (int): The offset of the right child's record, or 0.
+    """
+
+    __slots__ = ('offset', 'key', 'value', 'priority', 'left', 'right')
+
+    def __init__(self, offset: int, record: Record):
+        self.offset = offset
+        self.priority, self.left, self.right, self.key, self.value = record
+
+
+def create_file(path: typing.Union[str, os.PathLike]) -> bool:
+    """
+    Creates an empty file at path, returns False without touching it if it already exists.
+    """
+    try:
+        open(path, 'xb').close()
+    except FileExistsError:
+        return False
+    return True
+
+
+class DiskTreapMap(Treap[KT, VT]):
+    """
+    A treap map stored in a memory-mapped file, see the module docstring.
+
+    `key_format` and `value_format` are struct format codes for a single field each, and are stored in the file.
+    Byte string fields are padded with NUL bytes, which are stripped when reading them back, so byte string
+    keys and values must not end with NUL bytes. `insert` raises a ValueError for those, and for byte strings
+    longer than their field, which `struct` would otherwise silently truncate.
+    The records of the top `cache_levels` levels are cached.
+
+    The map must be closed (or used as a context manager) for its contents to reach the file.
+    """
+
+    def __init__(
+        self, path: typing.Union[str, os.PathLike], key_format: str = None, value_format: str = None,
+        priority_source: PrioritySource = None, cache_levels: int = 10
+    ):
+        self.priority_source = DEFAULT_PRIORITY_SOURCE if priority_source is None else priority_source
+        self.cache_levels = cache_levels
+        self.cache: Dict[int, Record] = {}
+
+        self.path = os.fspath(path)
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        size = os.fstat(self.file.fileno()).st_size
+        if size:
+            self.mm = mmap.mmap(self.file.fileno(), size)
+            magic, record_size, self.root, self.num_nodes, self.end, self.free, stored_key, stored_value = \
+                HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC:
+                self.mm.close()
+                self.file.close()
+                raise ValueError(f"{path} is not a DiskTreapMap file.")
+            stored_key, stored_value = stored_key.rstrip(b'\0').decode(), stored_value.rstrip(b'\0').decode()
+            if key_format not in (None, stored_key) or value_format not in (None, stored_value):
+                self.mm.close()
+                self.file.close()
+                raise ValueError(f"{path} holds keys of format {stored_key!r} and values of format {stored_value!r}.")
+            key_format, value_format = stored_key, stored_value
+        else:
+            key_format = 'q' if key_format is None else key_format
+            value_format = 'q' if value_format is None else value_format
+            self.root = self.num_nodes = self.free = 0
+            self.end = RECORDS_START
+
+        self.key_format, self.value_format = key_format, value_format
+        self.record = struct.Struct('<QQQ' + key_format + value_format)
+        self.strip_key = key_format.endswith('s')
+        self.strip_value = value_format.endswith('s')
+        self.key_size = struct.calcsize('<' + key_format)
+        self.value_size = struct.calcsize('<' + value_format)
+        if not size:
+            self.file.truncate(RECORDS_START + INITIAL_RECORDS * self.record.size)
+            self.mm = mmap.mmap(self.file.fileno(), 0)
+            self.write_header()
+
+    def write_header(self) -> None:
+        HEADER.pack_into(
+            self.mm, 0, MAGIC, self.record.size, self.root, self.num_nodes, self.end, self.free,
+            self.key_format.encode(), self.value_format.encode()
+        )
+
+    def flush(self) -> None:
+        """
+        Writes the header and any modified records back to the file.
+        """
+        self.write_header()
+        self.mm.flush()
+
+    def close(self) -> None:
+        if not self.mm.closed:
+            self.flush()
+            self.mm.close()
+            self.file.close()
+
+    def __enter__(self) -> DiskTreapMap[KT, VT]:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def read(self, offset: int, depth: int = None) -> Record:
+        """
+        Returns the decoded record at offset. Records at a depth under `cache_levels` are cached.
+        """
+        cached = self.cache.get(offset)
+        if cached is not None:
+            return cached
+        record = self.record.unpack_from(self.mm, offset)
+        if self.strip_key or self.strip_value:
+            priority, left, right, key, value = record
+            if self.strip_key:
+                key = key.rstrip(b'\0')
+            if self.strip_value:
+                value = value.rstrip(b'\0')
+            record = (priority, left, right, key, value)
+        if depth is not None and depth < self.cache_levels:
+            if len(self.cache) >= 2 << self.cache_levels:  # Records that moved deeper linger, start over
+                self.cache.clear()
+            self.cache[offset] = record
+        return record
+
+    def write(self, offset: int, record: Record) -> None:
+        """
+        Writes a record at offset, keeping the cache in step.
+        """
+        self.record.pack_into(self.mm, offset, *record)
+        if offset in self.cache:
+            self.cache[offset] = record
+
+    def allocate(self) -> int:
+        """
+        Returns the offset of a free record, reusing removed records first, and growing the file by doubling.
+        """
+        if self.free:
+            offset = self.free
+            self.free = self.read(offset)[1]  # Free records are chained through their left links
+            return offset
+        offset = self.end
+        self.end += self.record.size
+        if self.end > len(self.mm):
+            self.mm.flush()
+            self.mm.close()
+            self.file.truncate(2 * self.end)
+            self.mm = mmap.mmap(self.file.fileno(), 0)
+        return offset
+
+    def release(self, offset: int) -> None:
+        self.cache.pop(offset, None)
+        self.write(offset, (0, self.free, 0, *self.read(offset)[3:]))
+        self.free = offset
+
+    def link(self, parent: Optional[Tuple[int, Record]], is_left: bool, child: int) -> None:
+        """
+        Makes child the left or right child of parent, or the root if parent is None.
+        """
+        if parent is None:
+            self.root = child
+            return
+        offset, (priority, left, right, key, value) = parent
+        if is_left:
+            self.write(offset, (priority, child, right, key, value))
+        else:
+            self.write(offset, (priority, left, child, key, value))
+
+    def check_field(self, name: str, data: bytes, size: int) -> None:
+        """
+        Raises a ValueError if the byte string data cannot be stored in a field of `size` bytes and read back.
+        """
+        if len(data) > size:
+            raise ValueError(f"The {name} {data!r} is longer than its {size} byte field.")
+        if data.endswith(b'\0'):
+            raise ValueError(f"The {name} {data!r} ends with a NUL byte, which would be stripped when read back.")
+
+    def get_root_node(self) -> Optional[DiskNode]:
+        return DiskNode(self.root, self.read(self.root)) if self.root else None
+
+    def get_num_elements(self) -> int:
+        return self.num_nodes
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        # The cached top levels are read inline, the rest through `read`
+        cached = self.cache.get
+        offset = self.root
+        depth = 0
+        while offset:
+            record = cached(offset)
+            if record is None:
+                record = self.read(offset, depth)
+            node_key = record[3]
+            if key < node_key:
+                offset = record[1]
+            elif key == node_key:
+                return record[4]
+            else:
+                offset = record[2]
+            depth += 1
+        return None
+
+    def search_path(self, key: KT) -> Tuple[List[Tuple[int, Record]], Optional[Tuple[int, Record]]]:
+        """
+        Returns the (offset, record) pairs on the search path for key, and the pair holding key (or None).
+        The path stops above the node holding key.
+        """
+        path = []
+        offset = self.root
+        while offset:
+            record = self.read(offset, len(path))
+            node_key = record[3]
+            if key == node_key:
+                return path, (offset, record)
+            path.append((offset, record))
+            offset = record[1] if key < node_key else record[2]
+        return path, None
+
+    def insert(self, key: KT, value: VT) -> None:
+        if self.strip_key:
+            self.check_field('key', key, self.key_size)
+        if self.strip_value:
+            self.check_field('value', value, self.value_size)
+        path, found = self.search_path(key)
+        if found is not None:
+            offset, (priority, left, right, _, _) = found
+            self.write(offset, (priority, left, right, key, value))
+            return
+
+        priority = self.priority_source(key)
+        i = 0
+        while i < len(path) and path[i][1][0] >= priority:
+            i += 1
+
+        # The search path below the new node splits into the nodes going left of it, each the right child of the
+        # last, and those going right of it, each the left child of the last
+        lesser, greater = [], []
+        for offset, record in path[i:]:
+            (lesser if record[3] < key else greater).append((offset, record))
+        for side, child_index in ((lesser, 2), (greater, 1)):
+            for j, (offset, record) in enumerate(side):
+                child = side[j + 1][0] if j + 1 < len(side) else 0
+                if record[child_index] != child:
+                    record = list(record)
+                    record[child_index] = child
+                    self.write(offset, tuple(record))
+
+        new = self.allocate()
+        self.write(new, (priority, lesser[0][0] if lesser else 0, greater[0][0] if greater else 0, key, value))
+        parent = path[i - 1] if i > 0 else None
+        self.link(parent, parent is not None and key < parent[1][3], new)
+        self.num_nodes += 1
+
+    def remove(self, key: KT) -> Optional[VT]:
+        path, found = self.search_path(key)
+        if found is None:
+            return None
+        offset, (_, left, right, _, value) = found
+
+        parent = path[-1] if path else None
+        self.link(parent, parent is not None and key < parent[1][3], self.merge_records(left, right))
+        self.release(offset)
+        self.num_nodes -= 1
+        return value
+
+    def merge_records(self, left: int, right: int) -> int:
+        """
+        Merges the subtreaps at offsets left and right, every key of left preceding every key of right,
+        down their inner spines with the higher priority root of each pair on top. Returns the merged root, in O(log n).
+        """
+        root = 0
+        parent, is_left = None, False
+        while left and right:
+            left_record, right_record = self.read(left), self.read(right)
+            if left_record[0] > right_record[0]:
+                child, next_parent, next_is_left = left, (left, left_record), False
+                left = left_record[2]
+            else:
+                child, next_parent, next_is_left = right, (right, right_record), True
+                right = right_record[1]
+            if parent is None:
+                root = child
+            else:
+                self.link(parent, is_left, child)
+            parent, is_left = next_parent, next_is_left
+        if parent is None:
+            return left or right
+        self.link(parent, is_left, left or right)
+        return root
+
+    def split_records(self, offset: int, key: KT) -> Tuple[int, int]:
+        """
+        Splits the subtreap at offset into the keys less than key and the others, top down along the search path:
+        the path nodes going to each side are chained, each the inner child of the last. Returns the two roots.
+        """
+        roots = [0, 0]
+        tails: List[Optional[Tuple[int, Record]]] = [None, None]  # The last node of each side, lesser first
+        while offset:
+            record = self.read(offset)
+            side = 0 if record[3] < key else 1
+            tail = tails[side]
+            if tail is None:
+                roots[side] = offset
+            elif tail[1][2 - side] != offset:  # The lesser side grows right, the greater side left
+                self.link(tail, side == 1, offset)
+            tails[side] = (offset, record)
+            offset = record[2] if side == 0 else record[1]
+        for side, tail in enumerate(tails):
+            if tail is not None and tail[1][2 - side]:
+                self.link(tail, side == 1, 0)
+        return roots[0], roots[1]
+
+    def build_records(self, entries: typing.Iterable[Tuple[KT, VT, int]]) -> int:
+        """
+        Writes (key, value, priority) triples, in increasing key order, as new records linked into the
+        Cartesian tree of their priorities with a stack holding the right spine, in O(m). Returns the root.
+        """
+        spine: List[Tuple[int, Record]] = []
+        for key, value, priority in entries:
+            offset = self.allocate()
+            last = 0
+            while spine and spine[-1][1][0] < priority:
+                last = spine.pop()[0]
+            record = (priority, last, 0, key, value)
+            self.write(offset, record)
+            if spine:
+                self.link(spine[-1], False, offset)
+                parent_offset, parent_record = spine[-1]
+                spine[-1] = (parent_offset, parent_record[:2] + (offset,) + parent_record[3:])
+            spine.append((offset, record))
+        return spine[0][0] if spine else 0
+
+    def iter_records(self, offset: int, reverse: bool = False) -> typing.Iterator[Tuple[int, Record]]:
+        """
+        Returns an iterator over the (offset, record) pairs of the subtreap at offset, in sorted order of their keys
+        or reversed, reading the records as it goes with a stack of the O(log n) records still to be visited.
+        """
+        near, far = (1, 2) if not reverse else (2, 1)
+        stack = []
+        while stack or offset:
+            while offset:
+                record = self.read(offset)
+                stack.append((offset, record))
+                offset = record[near]
+            offset, record = stack.pop()
+            yield offset, record
+            offset = record[far]
+
+    def iter_nodes(self, reverse: bool = False) -> typing.Iterator[DiskNode]:
+        """
+        Returns an iterator over the nodes in sorted order of their keys, or reversed.
+        """
+        for offset, record in self.iter_records(self.root, reverse):
+            yield DiskNode(offset, record)
+
+    def clear(self) -> None:
+        """
+        Removes every key, making all the records of the file free space again, in O(1).
+        """
+        self.root = self.num_nodes = self.free = 0
+        self.end = RECORDS_START
+        self.cache.clear()
+
+    def split(self, threshold: KT, path: typing.Union[str, os.PathLike] = None) -> List[Treap[KT, VT]]:
+        """
+        Splits the map into the keys less than threshold, which stay in this map and file, and the keys greater than
+        or equal to threshold, which are moved into a new DiskTreapMap at `path`. Returns [this map, the new map].
+        By default the new file is named after this map's path followed by '.split1', '.split2', ..., the first
+        of these which does not exist yet.
+
+        The records are split along the search path for threshold in O(log n), then the m records of the upper half
+        are copied into the new file, in O(m). Raises a ValueError if `path` already exists.
+        """
+        if path is None:
+            n = 1
+            while not create_file(f'{self.path}.split{n}'):
+                n += 1
+            path = f'{self.path}.split{n}'
+        elif not create_file(path):
+            raise ValueError(f"{os.fspath(path)} already exists, cannot split into it.")
+        other = DiskTreapMap(path, self.key_format, self.value_format, self.priority_source, self.cache_levels)
+        self.root, upper = self.split_records(self.root, threshold)
+
+        moved = list(self.iter_records(upper))
+        other.root = other.build_records((record[3], record[4], record[0]) for _, record in moved)
+        other.num_nodes = len(moved)
+        for offset, _ in moved:
+            self.release(offset)
+        self.num_nodes -= len(moved)
+        self.write_header()
+        other.write_header()
+        return [self, other]
+
+    def join(self, _other: Treap[KT, VT]) -> None:
+        """
+        Joins another DiskTreapMap with the same formats, whose keys all precede or all follow this map's keys.
+        Its records are copied into this file keeping their priorities, in O(m), then the two spines facing each
+        other are merged in O(log n). The other map is left empty. Raises a ValueError if the key ranges overlap.
+        """
+        if not isinstance(_other, DiskTreapMap) or \
+                (_other.key_format, _other.value_format) != (self.key_format, self.value_format):
+            raise ValueError("Can only join a DiskTreapMap holding keys and values of the same formats.")
+        if not _other.root:
+            return
+        self_first = True
+        if self.root:
+            if self.last_key() < _other.first_key():
+                self_first = True
+            elif _other.last_key() < self.first_key():
+                self_first = False
+            else:
+                raise ValueError("Cannot join Treaps with overlapping keys.")
+
+        joined = self.build_records((node.key, node.value, node.priority) for node in _other.iter_nodes())
+        self.root = self.merge_records(self.root, joined) if self_first else self.merge_records(joined, self.root)
+        self.num_nodes += _other.num_nodes
+        _other.clear()
+        self.write_header()
+        _other.write_header()
+
+    def first_key(self) -> KT:
+        offset, record = self.root, None
+        while offset:
+            record = self.read(offset)
+            offset = record[1]
+        return record[3]
+
+    def last_key(self) -> KT:
+        offset, record = self.root, None
+        while offset:
+            record = self.read(offset)
+            offset = record[2]
+        return record[3]
+
+    def keys(self) -> TreapKeysView:
+        return TreapKeysView(self)
+
+    def values(self) -> TreapValuesView:
+        return TreapValuesView(self)
+
+    def items(self) -> TreapItemsView:
+        return TreapItemsView(self)
+
+    def __contains__(self, key: KT) -> bool:
+        _, found = self.search_path(key)
+        return found is not None
+
+    def __iter__(self) -> typing.Iterator[KT]:
+        for node in self.iter_nodes():
+            yield node.key
+
+    def __reversed__(self) -> typing.Iterator[KT]:
+        for node in self.iter_nodes(reverse=True):
+            yield node.key
+
+    def __len__(self) -> int:
+        return self.num_nodes
+
+    def meld(self, other: Treap[KT, VT]) -> None:
+        raise AttributeError("DiskTreapMap does not support `meld`.")
+
+    def difference(self, other: Treap[KT, VT]) -> None:
+        raise AttributeError("DiskTreapMap does not support `difference`.")
+
+    def balance_factor(self) -> float:
+        """
+        Ratio between the height and the minimum possible height.
+        """
+        if not self.root:
+            return 1
+        height = 0
+        stack = [(self.root, 0)]
+        while stack:
+            offset, depth = stack.pop()
+            height = max(height, depth)
+            _, left, right, _, _ = self.read(offset)
+            for child in (left, right):
+                if child:
+                    stack.append((child, depth + 1))
+        hmin = math.floor(math.log(self.num_nodes, 2))
+        if hmin == 0:
+            return 1
+        return height / hmin
+
+    def __str__(self) -> str:
+        """
+        Constructs a string representation of the current tree, in the same format as TreapMap.
+        """
+        lines = []
+        stack = [(self.root, 0, 'Root')] if self.root else []
+        while stack:
+            offset, lvl, node_type = stack.pop()
+            priority, left, right, key, _ = self.read(offset)
+            lines.append('\t' * lvl + f'{node_type}: {(key, priority)}')
+            if right:
+                stack.append((right, lvl + 1, 'R'))
+            if left:
+                stack.append((left, lvl + 1, 'L'))
+        return '\n'.join(lines)
@@ -0,0 +1,337 @@
+"""
+This module contains a TreapMap wrapper that makes its updates durable with a write-ahead log.
+
+Each update is applied to the in-memory treap and appended to an operation log.
+Log records are buffered and written with a single write and fsync per group
+(group commit), so the cost of syncing is shared by `group_size` updates. An
+update is durable once its group is committed, by filling up, by `commit`, by the
+background flusher or by `close`.
+
+The directory holds a snapshot (a `TreapMap.dump` preceded by a generation number)
+and the logs of that generation and later ones. Recovery loads the snapshot and
+replays the logs in order, dropping a torn record at the end of the last log.
+Compaction starts a new log generation, lists the entries of the treap, and writes
+them as the new snapshot outside of the lock, after which the older logs are deleted.
+"""
+
+from __future__ import annotations
+import os
+import pickle
+import struct
+import threading
+import typing
+import zlib
+from typing import Any, List, Optional, Tuple
+
+from py_treaps.comparable import KT, VT
+from py_treaps.priority import PrioritySource
+from py_treaps.serialization import write_entries
+from py_treaps.treap_map import TreapMap
+from py_treaps.treap_views import TreapItemsView
+
+LOG_RECORD = struct.Struct('<II')  # payload length, crc32 of the payload
+GENERATION = struct.Struct('<Q')
+SNAPSHOT = 'snapshot.trp'
+LOG_PREFIX = 'log.'
+
+
+class DurableTreapMap:
+    """
+    Wraps a TreapMap, logging its updates so they survive a crash, see the module docstring.
+
+    Reads go straight to the in-memory treap. Updates must go through this wrapper to be logged,
+    changes made directly on `treap` are lost on recovery.
+
+    If `flush_interval` is given, a background thread commits the pending records that often,
+    and if `compact_bytes` is also given, compacts once the current log grows past that size.
+    """
+
+    def __init__(
+        self, directory: typing.Union[str, os.PathLike], group_size: int = 64, fsync: bool = True,
+        priority_source: PrioritySource = None, flush_interval: float = None, compact_bytes: int = None
+    ):
+        self.directory = os.fspath(directory)
+        self.group_size = group_size
+        self.fsync = fsync
+        self.priority_source = priority_source
+        self.compact_bytes = compact_bytes
+        self.lock = threading.RLock()
+        self.compaction_lock = threading.Lock()
+        self.pending: List[bytes] = []
+        self.commits = 0
+        self.logged_operations = 0
+        self.compactions = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.treap, self.generation = self.recover()
+        self.log = self.open_log(self.generation)
+
+        self.stop = threading.Event()
+        self.flusher = None
+        if flush_interval is not None:
+            self.flusher = threading.Thread(target=self.background, args=(flush_interval,), daemon=True)
+            self.flusher.start()
+
+    def log_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'{LOG_PREFIX}{generation:010}')
+
+    def open_log(self, generation: int) -> typing.BinaryIO:
+        """
+        Opens the log of a generation for appending, and syncs the directory so the entry of a newly created log
+        is durable before any record committed to it is.
+        """
+        log = open(self.log_path(generation), 'ab')
+        if self.fsync:
+            sync_directory(self.directory)
+        return log
+
+    def log_generations(self) -> List[int]:
+        return sorted(
+            int(name[len(LOG_PREFIX):]) for name in os.listdir(self.directory)
+            if name.startswith(LOG_PREFIX) and name[len(LOG_PREFIX):].isdigit()
+        )
+
+    # Recovery
+
+    def recover(self) -> Tuple[TreapMap[KT, VT], int]:
+        """
+        Loads the snapshot and replays the logs written since, returning the treap and the current generation.
+        A torn record at the end of a log, left by a crash during a write, is cut off.
+        """
+        snapshot = os.path.join(self.directory, SNAPSHOT)
+        if os.path.exists(snapshot):
+            with open(snapshot, 'rb') as fp:
+                generation, = GENERATION.unpack(fp.read(GENERATION.size))
+                treap = TreapMap.load(fp, self.priority_source)
+        else:
+            generation = 0
+            treap = TreapMap(priority_source=self.priority_source)
+
+        for log_generation in self.log_generations():
+            path = self.log_path(log_generation)
+            if log_generation < generation:  # Already in the snapshot, left by an interrupted compaction
+                os.remove(path)
+                continue
+            with open(path, 'r+b') as fp:
+                for operation, args in read_log(fp):
+                    treap = self.apply(treap, operation, args)
+                fp.truncate()  # `read_log` stops at the end of the last whole record
+            generation = log_generation
+        return treap, generation
+
+    def apply(self, treap: TreapMap[KT, VT], operation: str, args: tuple) -> TreapMap[KT, VT]:
+        """
+        Replays a logged operation on treap, and returns the treap holding the result.
+        """
+        if operation == 'insert':
+            treap.insert(*args)
+        elif operation == 'remove':
+            treap.remove(*args)
+        elif operation == 'insert_many':
+            for key, value in args[0]:
+                treap.insert(key, value)
+        elif operation == 'remove_many':
+            for key in args[0]:
+                treap.remove(key)
+        elif operation == 'delete_range':
+            treap.delete_range(*args)
+        elif operation == 'split':
+            treap = TreapMap(priority_source=self.priority_source)
+        else:
+            raise ValueError(f"Unknown operation {operation!r} in the log.")
+        return treap
+
+    # Logging
+
+    def append(self, operation: str, *args: Any) -> None:
+        """
+        Buffers a log record, committing the group once it holds `group_size` records. Called with the lock held.
+        """
+        payload = pickle.dumps((operation, args), pickle.HIGHEST_PROTOCOL)
+        self.pending.append(LOG_RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
+        self.logged_operations += 1
+        if len(self.pending) >= self.group_size:
+            self.commit()
+
+    def commit(self) -> None:
+        """
+        Writes the pending log records with a single write, and syncs them to disk.
+        Every update made before the call is durable once it returns.
+        """
+        with self.lock:
+            if not self.pending:
+                return
+            self.log.write(b''.join(self.pending))
+            self.log.flush()
+            if self.fsync:
+                os.fsync(self.log.fileno())
+            self.pending.clear()
+            self.commits += 1
+
+    # Updates
+
+    def insert(self, key: KT, value: VT) -> None:
+        with self.lock:
+            self.treap.insert(key, value)
+            self.append('insert', key, value)
+
+    def remove(self, key: KT) -> Optional[VT]:
+        with self.lock:
+            value = self.treap.remove(key)
+            if value is not None:
+                self.append('remove', key)
+            return value
+
+    def insert_many(self, items: typing.Iterable[typing.Tuple[KT, VT]]) -> None:
+        with self.lock:
+            items = list(items)
+            self.treap.insert_many(items)
+            self.append('insert_many', items)
+
+    def delete_range(self, lo: KT = None, hi: KT = None, inclusive: typing.Tuple[bool, bool] = (True, False)) -> int:
+        with self.lock:
+            removed = self.treap.delete_range(lo, hi, inclusive)
+            if removed:
+                self.append('delete_range', lo, hi, inclusive)
+            return removed
+
+    def split(self, threshold: KT) -> List[TreapMap[KT, VT]]:
+        """
+        Splits the contents into two plain TreapMaps, as `TreapMap.split` does, leaving this map empty.
+        """
+        with self.lock:
+            halves = self.treap.split(threshold)
+            self.append('split', threshold)
+            return halves
+
+    def join(self, other: TreapMap[KT, VT]) -> None:
+        """
+        Joins a TreapMap whose keys all precede or all follow this map's keys, as `TreapMap.join` does.
+        Its items are logged, so this costs O(m) for m items joined.
+        """
+        with self.lock:
+            items = list(other.items())
+            self.treap.join(other)
+            self.append('insert_many', items)
+
+    def meld(
+        self, other: TreapMap[KT, VT], on_conflict: typing.Union[str, typing.Callable[[VT, VT], VT]] = 'right'
+    ) -> None:
+        """
+        Melds a TreapMap in, as `TreapMap.meld` does. The resulting values of its keys are logged.
+        """
+        with self.lock:
+            keys = list(other)
+            self.treap.meld(other, on_conflict)
+            self.append('insert_many', list(zip(keys, self.treap.lookup_many(keys))))
+
+    def difference(self, other: TreapMap[KT, VT]) -> None:
+        with self.lock:
+            self.treap.difference(other)
+            self.append('remove_many', list(other))
+
+    # Reads
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        return self.treap.lookup(key)
+
+    def __contains__(self, key: KT) -> bool:
+        return key in self.treap
+
+    def __len__(self) -> int:
+        return len(self.treap)
+
+    def __iter__(self) -> typing.Iterator[KT]:
+        return iter(self.treap)
+
+    def items(self) -> TreapItemsView:
+        return self.treap.items()
+
+    # Compaction
+
+    def compact(self) -> None:
+        """
+        Replaces the snapshot and the logs by a snapshot of the current contents.
+
+        The lock is only held to commit, start a new log generation and list the entries, the snapshot is
+        written and synced outside of it. It is written to a temporary file and renamed into place, so a crash
+        at any point leaves either the old snapshot and all the logs, or the new snapshot and the new log.
+        """
+        with self.compaction_lock:
+            with self.lock:
+                self.commit()
+                entries = [(node.key, node.value, node.priority) for node in self.treap.iter_nodes()]
+                self.log.close()
+                self.generation += 1
+                self.log = self.open_log(self.generation)
+                generation = self.generation
+
+            snapshot = os.path.join(self.directory, SNAPSHOT)
+            with open(snapshot + '.tmp', 'wb') as fp:
+                fp.write(GENERATION.pack(generation))
+                write_entries(fp, len(entries), entries)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(snapshot + '.tmp', snapshot)
+            sync_directory(self.directory)
+            for log_generation in self.log_generations():
+                if log_generation < generation:
+                    os.remove(self.log_path(log_generation))
+            self.compactions += 1
+
+    def background(self, interval: float) -> None:
+        while not self.stop.wait(interval):
+            with self.lock:
+                self.commit()
+                log_size = self.log.tell()
+            if self.compact_bytes is not None and log_size > self.compact_bytes:
+                self.compact()
+
+    def close(self) -> None:
+        """
+        Stops the background thread, and commits the pending records.
+        """
+        self.stop.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        with self.lock:
+            self.commit()
+            self.log.close()
+
+    def __enter__(self) -> DurableTreapMap[KT, VT]:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def read_log(fp: typing.BinaryIO) -> typing.Iterator[Tuple[str, tuple]]:
+    """
+    Yields the (operation, args) records of a log, stopping at the first incomplete or corrupted record
+    with the file positioned at its start.
+    """
+    while True:
+        start = fp.tell()
+        header = fp.read(LOG_RECORD.size)
+        if len(header) == LOG_RECORD.size:
+            length, crc = LOG_RECORD.unpack(header)
+            payload = fp.read(length)
+            if len(payload) == length and zlib.crc32(payload) == crc:
+                yield pickle.loads(payload)
+                continue
+        fp.seek(start)
+        return
+
+
+def sync_directory(directory: str) -> None:
+    """
+    Syncs a directory, so a rename in it is durable. Not all platforms can open directories.
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,227 @@
+"""
+This module contains an implicit treap, a sequence container built on the TreapNode machinery.
+
+Nodes are ordered by position rather than by key: the position of a node is
+the number of nodes before it, found from the subtreap sizes. Inserting,
+deleting, splitting and concatenating all go through the rank split and merge
+used by TreapMap, so each costs O(log n) wherever it happens in the sequence.
+"""
+
+from __future__ import annotations
+import typing
+from typing import List, Optional
+
+from py_treaps.comparable import VT
+from py_treaps.priority import DEFAULT_PRIORITY_SOURCE, PrioritySource
+from py_treaps.treap_node import TreapNode, cartesian_tree, merge_nodes, split_nodes_at_rank
+
+
+class ImplicitTreapNode(TreapNode):
+    """
+    A node of an ImplicitTreap. The key is unused.
+
+    Added attributes:
+        reversed (bool): Whether the subtreap rooted at this node is pending a reversal,
+            including the swap of this node's own children.
+    """
+
+    __slots__ = ('reversed',)
+
+    def __init__(self, value: VT, priority: int):
+        super().__init__(None, value, priority=priority)
+        self.reversed: bool = False
+
+    def push(self) -> None:
+        """
+        Applies a pending reversal to this node by swapping its children, and passes it on to them.
+        """
+        if self.reversed:
+            left, right = self.right_child, self.left_child
+            self.left_child, self.right_child = left, right
+            if left is not None:
+                left.reversed = not left.reversed
+            if right is not None:
+                right.reversed = not right.reversed
+            self.reversed = False
+
+
+class ImplicitTreap:
+    """
+    A sequence supporting O(log n) insertion, deletion, indexing, splitting, concatenation and reversal
+    at any position.
+
+    Priorities are drawn from `priority_source` with a key of None, so hash based sources are not suitable.
+    """
+
+    def __init__(self, values: typing.Iterable[VT] = (), priority_source: PrioritySource = None):
+        """
+        Builds the sequence from `values` in O(n).
+        """
+        self.priority_source = DEFAULT_PRIORITY_SOURCE if priority_source is None else priority_source
+        self.root: Optional[ImplicitTreapNode] = cartesian_tree(self.new_node(value) for value in values)
+
+    def new_node(self, value: VT) -> ImplicitTreapNode:
+        return ImplicitTreapNode(value, self.priority_source(None))
+
+    @classmethod
+    def from_root(cls, root: Optional[ImplicitTreapNode], priority_source: PrioritySource) -> ImplicitTreap[VT]:
+        treap = cls(priority_source=priority_source)
+        treap.root = root
+        return treap
+
+    def get_root_node(self) -> Optional[ImplicitTreapNode]:
+        return self.root
+
+    def __len__(self) -> int:
+        return self.root.size if self.root is not None else 0
+
+    def normalize_index(self, index: int, inserting: bool = False) -> int:
+        """
+        Turns a negative index into a position from the start, and checks it is in range.
+        When inserting, the position just past the end is also in range.
+        """
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n + inserting:
+            raise IndexError("ImplicitTreap index out of range")
+        return index
+
+    def node_at(self, index: int) -> ImplicitTreapNode:
+        """
+        Returns the node at a position, pushing pending reversals on the way down.
+        """
+        x = self.root
+        while True:
+            x.push()
+            left_size = x.left_child.size if x.left_child is not None else 0
+            if index < left_size:
+                x = x.left_child
+            elif index > left_size:
+                index -= left_size + 1
+                x = x.right_child
+            else:
+                return x
+
+    def __getitem__(self, index: typing.Union[int, slice]) -> typing.Union[VT, List[VT]]:
+        """
+        Returns the value at a position, or a list of the values in a slice of positions.
+        A contiguous slice of k values costs O(log n + k).
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self.node_at(i).value for i in range(start, stop, step)]
+            return [node.value for node in self.iter_nodes(start, stop)]
+        return self.node_at(self.normalize_index(index)).value
+
+    def __setitem__(self, index: int, value: VT) -> None:
+        self.node_at(self.normalize_index(index)).value = value
+
+    def insert(self, index: int, value: VT) -> None:
+        """
+        Inserts a value before the position `index`, as `list.insert` does, in O(log n).
+        """
+        index = min(max(index + len(self) if index < 0 else index, 0), len(self))
+        left, right = split_nodes_at_rank(self.root, index)
+        self.root = merge_nodes(merge_nodes(left, self.new_node(value)), right)
+
+    def append(self, value: VT) -> None:
+        self.root = merge_nodes(self.root, self.new_node(value))
+
+    def pop(self, index: int = -1) -> VT:
+        """
+        Removes and returns the value at a position, in O(log n).
+        """
+        index = self.normalize_index(index)
+        left, rest = split_nodes_at_rank(self.root, index)
+        middle, right = split_nodes_at_rank(rest, 1)
+        self.root = merge_nodes(left, right)
+        return middle.value
+
+    def __delitem__(self, index: typing.Union[int, slice]) -> None:
+        """
+        Removes the value at a position, or the values in a slice of positions.
+        Contiguous slices are cut out with two splits and a merge, in O(log n).
+        """
+        if not isinstance(index, slice):
+            self.pop(index)
+            return
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            for i in sorted(range(start, stop, step), reverse=True):
+                self.pop(i)
+            return
+        if start >= stop:
+            return
+        left, rest = split_nodes_at_rank(self.root, start)
+        _, right = split_nodes_at_rank(rest, stop - start)
+        self.root = merge_nodes(left, right)
+
+    def split(self, index: int) -> List[ImplicitTreap[VT]]:
+        """
+        Splits the sequence before position `index` into two sequences, in O(log n).
+        The nodes are moved into the two new sequences, leaving this one empty.
+        """
+        left, right = split_nodes_at_rank(self.root, index)
+        self.root = None
+        return [type(self).from_root(left, self.priority_source), type(self).from_root(right, self.priority_source)]
+
+    def concat(self, other: ImplicitTreap[VT]) -> None:
+        """
+        Appends the values of another sequence, in O(log n).
+        The nodes of `other` are moved into this sequence, leaving it empty.
+        """
+        self.root = merge_nodes(self.root, other.root)
+        other.root = None
+
+    def reverse(self, start: int = 0, stop: Optional[int] = None) -> None:
+        """
+        Reverses the values in positions [start, stop), in O(log n).
+        The range is cut out and flagged as reversed, the flag is pushed down lazily when nodes below are visited.
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return
+        left, rest = split_nodes_at_rank(self.root, start)
+        middle, right = split_nodes_at_rank(rest, stop - start)
+        middle.reversed = not middle.reversed
+        self.root = merge_nodes(merge_nodes(left, middle), right)
+
+    def iter_nodes(self, start: int = 0, stop: Optional[int] = None) -> typing.Iterator[ImplicitTreapNode]:
+        """
+        Returns an iterator over the nodes in positions [start, stop), pushing pending reversals as it goes.
+        Descends directly to `start`, keeping a stack of the O(log n) nodes still to be visited.
+        """
+        remaining = len(self) - start if stop is None else stop - start
+        stack = []
+        x = self.root
+        index = start
+        while x is not None:  # Walk down to position `start`, stacking the nodes at or after it
+            x.push()
+            left_size = x.left_child.size if x.left_child is not None else 0
+            if index <= left_size:
+                stack.append(x)
+                if index == left_size:
+                    break
+                x = x.left_child
+            else:
+                index -= left_size + 1
+                x = x.right_child
+
+        while stack and remaining > 0:
+            x = stack.pop()
+            yield x
+            remaining -= 1
+            x = x.right_child
+            while x is not None:
+                x.push()
+                stack.append(x)
+                x = x.left_child
+
+    def __iter__(self) -> typing.Iterator[VT]:
+        for node in self.iter_nodes():
+            yield node.value
+
+    def __repr__(self) -> str:
+        return f"ImplicitTreap({list(self)})"
@@ -0,0 +1,161 @@
+"""
+This module contains a TreapMap with a companion dict index from each key to its node.
+
+Point lookups, membership tests and overwrites go through the dict in O(1)
+instead of descending the treap, and removals start from the node found there,
+rotating it down through the parent pointers. Ordered operations use the treap
+as before, and keep the index in step:
+
+- `insert` adds the new node, `remove` and `delete_range` drop the removed keys.
+- `split` moves the keys of the smaller half into a new dict, O(min(n, m)).
+- `join` and `meld` add the nodes of the smaller side to the larger index, O(min(n, m)).
+- `difference` drops the keys of the other treap, O(m).
+
+Any other change of root, by `intersection`, `symmetric_difference` or a slice
+deletion, rebuilds the index in O(n). Keys must be hashable, with equality agreeing
+with their ordering.
+"""
+
+from __future__ import annotations
+import typing
+from typing import Dict, List, Optional
+
+from py_treaps.comparable import KT, VT
+from py_treaps.treap import Treap
+from py_treaps.treap_map import TreapMap, conflict_resolver
+from py_treaps.treap_node import TreapNode, difference_nodes, merge_nodes, split_nodes, union_nodes
+
+
+def subtreap_nodes(node: Optional[TreapNode]) -> typing.Iterator[TreapNode]:
+    """
+    Yields the nodes of the subtreap at node, in no particular order.
+    """
+    stack = [node] if node is not None else []
+    while stack:
+        node = stack.pop()
+        yield node
+        if node.left_child is not None:
+            stack.append(node.left_child)
+        if node.right_child is not None:
+            stack.append(node.right_child)
+
+
+class IndexedTreapMap(TreapMap[KT, VT]):
+    """
+    A TreapMap keeping a dict from each key to its node, for O(1) point lookups, see the module docstring.
+    The index costs one dict entry per key on top of the node, see karma.md.
+    """
+
+    def set_root(self, root: Optional[TreapNode], index: Dict[KT, TreapNode] = None) -> None:
+        """
+        Replaces the contents of this Treap with the subtreap at `root`, as `TreapMap.set_root` does.
+        `index` must map the keys of the subtreap to their nodes, it is rebuilt in O(n) if not given.
+        """
+        super().set_root(root)
+        self.index: Dict[KT, TreapNode] = {node.key: node for node in subtreap_nodes(root)} if index is None else index
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        node = self.index.get(key)
+        return node.value if node is not None else None
+
+    def find_node(self, key: KT) -> Optional[TreapNode]:
+        return self.index.get(key)
+
+    def lookup_many(self, keys: typing.Iterable[KT]) -> List[Optional[VT]]:
+        get = self.index.get
+        return [node.value if node is not None else None for node in map(get, keys)]
+
+    def __contains__(self, key: KT) -> bool:
+        return key in self.index
+
+    def insert(self, key: KT, value: VT) -> None:
+        node = self.index.get(key)
+        if node is not None:
+            node.value = value
+            self.value_changed(node)
+        elif self.root is None:
+            self.set_root(self.new_node(key, value))
+        else:
+            parent = self.find_parent(key)  # The key is not in the Treap, so this is the parent of the new node
+            self.index[key] = self.add_leaf(parent, key < parent.key, key, value)
+
+    def remove(self, key: KT) -> Optional[VT]:
+        node = self.index.pop(key, None)
+        if node is None:
+            return None
+        return self.remove_node(node)
+
+    def delete_range(self, lo: KT = None, hi: KT = None, inclusive: typing.Tuple[bool, bool] = (True, False)) -> int:
+        """
+        Removes every key between lo and hi, as `TreapMap.delete_range` does, in O(log n + k) for k keys removed.
+        """
+        lo_inclusive, hi_inclusive = inclusive
+        left, rest = (None, self.root) if lo is None else split_nodes(self.root, lo, not lo_inclusive)
+        middle, right = (rest, None) if hi is None else split_nodes(rest, hi, hi_inclusive)
+        index = self.index
+        for node in subtreap_nodes(middle):
+            del index[node.key]
+        self.set_root(merge_nodes(left, right), index)
+        return middle.size if middle is not None else 0
+
+    def adopt_split(self, left: Optional[TreapNode], right: Optional[TreapNode]) -> List[Treap[KT, VT]]:
+        """
+        Helper for the splits. The larger half keeps this Treap's index, the keys of the smaller half are moved
+        into a new one, in O(min(n, m)) for halves of sizes n and m.
+        """
+        index, moved = self.index, {}
+        smaller = left if (left.size if left is not None else 0) <= (right.size if right is not None else 0) else right
+        for node in subtreap_nodes(smaller):
+            moved[node.key] = index.pop(node.key)
+        left_index, right_index = (moved, index) if smaller is left else (index, moved)
+
+        self.set_root(None, {})
+        halves = [self.empty_like(), self.empty_like()]
+        halves[0].set_root(left, left_index)
+        halves[1].set_root(right, right_index)
+        return halves
+
+    def larger_index(self, other: Treap[KT, VT]) -> typing.Tuple[Dict[KT, TreapNode], List[TreapNode]]:
+        """
+        Helper for `join` and `meld`, called before the nodes of other are moved into this Treap.
+        Returns the index of the larger side, and the nodes of the smaller side still to be added to it.
+        A Treap without an index counts as the smaller side.
+        """
+        if isinstance(other, IndexedTreapMap) and len(other.index) > len(self.index):
+            return other.index, list(self.index.values())
+        if isinstance(other, IndexedTreapMap):
+            return self.index, list(other.index.values())
+        return self.index, list(other.iter_nodes())
+
+    def join(self, _other: Treap[KT, VT], validate: bool = True) -> None:
+        index, nodes = self.larger_index(_other)
+        super().join(_other, validate)
+        for node in nodes:
+            index[node.key] = node
+        self.index = index
+
+    def meld(
+        self, other: Treap[KT, VT], on_conflict: typing.Union[str, typing.Callable[[VT, VT], VT]] = 'right'
+    ) -> None:
+        """
+        Merges two Treaps, as `TreapMap.meld` does. The index of the larger Treap is kept, and the nodes of the
+        smaller one are added to it, in O(min(n, m)), unless they were dropped as duplicates by the union.
+        """
+        if other is self:  # See `TreapMap.meld`
+            other = self.copy()
+        index, nodes = self.larger_index(other)
+        self.set_root(union_nodes(self.root, other.root, conflict_resolver(on_conflict)), index)
+        other.set_root(None)
+        root = self.root
+        for node in nodes:
+            if node.parent is not None or node is root:  # A dropped duplicate is left detached
+                index[node.key] = node
+
+    def difference(self, other: Treap[KT, VT]) -> None:
+        if other is self:
+            self.set_root(None)
+            return
+        index = self.index
+        self.set_root(difference_nodes(self.root, other.root), index)
+        for key in (other.index if isinstance(other, IndexedTreapMap) else other):
+            index.pop(key, None)
@@ -0,0 +1,357 @@
+"""
+This module contains a TreapMap that counts the work done by each of its operations.
+
+For every operation it records the key comparisons, the left and right rotations,
+the nodes visited and the time taken, in an OperationStats, and it keeps a
+histogram of the depths reached by the searches. An optional callback receives
+the OperationStats of each operation as it completes.
+
+Searches are counted in their own descent. The split, merge and set operation
+functions push every node they visit, and InstrumentedTreapNode counts each push
+as a visit. The keys given to `split` and `delete_range` are wrapped to count their comparisons.
+`meld`, `difference`, `intersection` and `symmetric_difference` compare stored keys
+with each other, which is not counted, only their nodes visited and time are.
+
+The instrumentation lives entirely in this subclass: TreapMap itself carries no
+counters or checks, so it costs nothing unless an InstrumentedTreapMap is used.
+"""
+
+from __future__ import annotations
+import collections
+import time
+import typing
+from typing import Any, Dict, List, Optional
+
+from py_treaps.comparable import KT, VT
+from py_treaps.priority import PrioritySource
+from py_treaps.treap import Treap
+from py_treaps.treap_map import TreapMap
+from py_treaps.treap_node import TreapNode
+
+COUNTS = ('comparisons', 'left_rotations', 'right_rotations', 'nodes_visited')
+
+
+class OperationStats:
+    """
+    The work done by one operation, or summed over several.
+
+    Attributes:
+        operation (str): The name of the operation.
+        calls (int): The number of operations summed up, 1 for a single operation.
+        comparisons (int): The key comparisons made.
+        left_rotations, right_rotations (int): The rotations performed.
+        nodes_visited (int): The nodes visited by searches, splits, merges and set operations.
+        depth (int): The depth of the deepest node reached by the last search, or None if none was made.
+        elapsed (float): The time taken, in seconds.
+    """
+
+    __slots__ = ('operation', 'calls') + COUNTS + ('depth', 'elapsed')
+
+    def __init__(self, operation: str, calls: int = 1):
+        self.operation = operation
+        self.calls = calls
+        self.comparisons = 0
+        self.left_rotations = 0
+        self.right_rotations = 0
+        self.nodes_visited = 0
+        self.depth: Optional[int] = None
+        self.elapsed = 0.0
+
+    def add(self, other: OperationStats) -> None:
+        """
+        Adds the counts and time of other to these.
+        """
+        self.calls += other.calls
+        for count in COUNTS:
+            setattr(self, count, getattr(self, count) + getattr(other, count))
+        self.elapsed += other.elapsed
+
+    def __repr__(self) -> str:
+        counts = ', '.join(f'{count}={getattr(self, count)}' for count in COUNTS)
+        return f'OperationStats({self.operation!r}, calls={self.calls}, {counts}, elapsed={self.elapsed:.6f})'
+
+
+class Instruments:
+    """
+    Collects the OperationStats of the InstrumentedTreapMaps sharing it, which are the maps split from,
+    copied from or otherwise created by the same map.
+
+    Attributes:
+        callback: Called with the OperationStats of each operation as it completes, or None.
+        totals (Dict[str, OperationStats]): The stats summed per operation.
+        depths (Counter): The number of searches that reached each depth.
+        current (OperationStats): The stats of the operation in progress, or None.
+    """
+
+    def __init__(self, callback: typing.Callable[[OperationStats], Any] = None):
+        self.callback = callback
+        self.current: Optional[OperationStats] = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.totals: Dict[str, OperationStats] = {}
+        self.depths: typing.Counter[int] = collections.Counter()
+
+    def measure(self, operation: str) -> Measurement:
+        """
+        Returns a context manager counting the work done in its block as one operation, and timing it.
+        An operation called by another one, such as `remove` by `pop_min`, is counted as part of the outer one.
+        """
+        return Measurement(self, operation)
+
+    def record(self, stats: OperationStats) -> None:
+        """
+        Adds the stats of a completed operation to the totals, and passes them to the callback.
+        """
+        total = self.totals.get(stats.operation)
+        if total is None:
+            self.totals[stats.operation] = total = OperationStats(stats.operation, 0)
+        total.add(stats)
+        if self.callback is not None:
+            self.callback(stats)
+
+    def search_depths(self) -> List[int]:
+        """
+        Returns the histogram of the search depths as a list, the count of searches reaching depth d at index d.
+        """
+        return [self.depths[d] for d in range(max(self.depths, default=-1) + 1)]
+
+
+class Measurement:
+    """
+    The context manager returned by `Instruments.measure`, whose `with` gives the OperationStats being counted.
+    A class rather than a generator based context manager, which costs several times more per operation.
+    """
+
+    __slots__ = ('instruments', 'operation', 'stats', 'start')
+
+    def __init__(self, instruments: Instruments, operation: str):
+        self.instruments = instruments
+        self.operation = operation
+        self.stats: Optional[OperationStats] = None
+
+    def __enter__(self) -> OperationStats:
+        current = self.instruments.current
+        if current is not None:  # Part of an outer operation
+            return current
+        self.stats = self.instruments.current = OperationStats(self.operation)
+        self.start = time.perf_counter()
+        return self.stats
+
+    def __exit__(self, *exc_info) -> None:
+        stats = self.stats
+        if stats is not None:
+            stats.elapsed = time.perf_counter() - self.start
+            self.instruments.current = None
+            self.instruments.record(stats)
+
+
+class CountingKey:
+    """
+    Wraps a key given to an operation, counting its comparisons with the stored keys into stats.
+    Comparisons from either side land here, as the stored key's comparison defers to the reflected one.
+    """
+
+    __slots__ = ('key', 'stats')
+
+    def __init__(self, key: KT, stats: OperationStats):
+        self.key = key
+        self.stats = stats
+
+    def __lt__(self, other: KT) -> bool:
+        self.stats.comparisons += 1
+        return self.key < other
+
+    def __le__(self, other: KT) -> bool:
+        self.stats.comparisons += 1
+        return self.key <= other
+
+    def __gt__(self, other: KT) -> bool:
+        self.stats.comparisons += 1
+        return self.key > other
+
+    def __ge__(self, other: KT) -> bool:
+        self.stats.comparisons += 1
+        return self.key >= other
+
+    def __eq__(self, other: KT) -> bool:
+        self.stats.comparisons += 1
+        return self.key == other
+
+    def __ne__(self, other: KT) -> bool:
+        self.stats.comparisons += 1
+        return self.key != other
+
+    __hash__ = None
+
+
+class InstrumentedTreapNode(TreapNode):
+    """
+    A node of an InstrumentedTreapMap.
+
+    Added attributes:
+        instruments (Instruments): The collector its visits are counted into.
+    """
+
+    __slots__ = ('instruments',)
+
+    def __init__(
+        self, key: KT, value: VT, instruments: Instruments, parent: Optional[TreapNode] = None,
+        priority: Optional[int] = None
+    ):
+        super().__init__(key, value, parent, priority)
+        self.instruments: Instruments = instruments
+
+    def push(self) -> None:
+        # Called on each node visited by the split, merge and set operation functions
+        stats = self.instruments.current
+        if stats is not None:
+            stats.nodes_visited += 1
+
+
+class InstrumentedTreapMap(TreapMap[KT, VT]):
+    """
+    A TreapMap counting the comparisons, rotations and nodes visited by each operation, see the module docstring.
+    The counts are collected by `instruments`, shared with the maps created from this one.
+
+    Counted operations: lookup, find_node, find_parent, insert, insert_many, remove, delete_range, split,
+    split_at_rank, join, meld, difference, intersection and symmetric_difference, and the methods built on them.
+    """
+
+    reads_mutate = True  # Lookups count into the shared Instruments
+
+    def __init__(
+        self, root: TreapNode = None, priority_source: PrioritySource = None, instruments: Instruments = None
+    ):
+        self.instruments = Instruments() if instruments is None else instruments
+        super().__init__(root, priority_source)
+
+    def new_node(self, key: KT, value: VT, parent: TreapNode = None, priority: int = None) -> InstrumentedTreapNode:
+        if priority is None:
+            priority = self.priority_source(key)
+        return InstrumentedTreapNode(key, value, self.instruments, parent, priority)
+
+    def empty_like(self, root: TreapNode = None) -> InstrumentedTreapMap[KT, VT]:
+        return type(self)(root, self.priority_source, self.instruments)
+
+    def descend(self, key: KT) -> typing.Tuple[Optional[TreapNode], Optional[TreapNode]]:
+        """
+        The descent of `lookup`, counted into the current operation, which records the depth reached.
+        Returns the node with the largest key not greater than key, and the last node visited, or None for either.
+        """
+        x = self.root
+        candidate = last = None
+        visited = 0
+        while x is not None:
+            visited += 1
+            last = x
+            if key < x.key:
+                x = x.left_child
+            else:
+                candidate = x
+                x = x.right_child
+        if visited:
+            stats = self.instruments.current
+            stats.nodes_visited += visited
+            stats.comparisons += visited
+            stats.depth = visited - 1
+            self.instruments.depths[visited - 1] += 1
+        return candidate, last
+
+    def find_node(self, key: KT) -> Optional[TreapNode]:
+        with self.instruments.measure('find_node') as stats:
+            candidate, _ = self.descend(key)
+            if candidate is None:
+                return None
+            stats.comparisons += 1
+            return candidate if candidate.key == key else None
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        with self.instruments.measure('lookup') as stats:
+            candidate, _ = self.descend(key)
+            if candidate is None:
+                return None
+            stats.comparisons += 1
+            return candidate.value if candidate.key == key else None
+
+    def find_parent(self, key: KT) -> TreapNode:
+        with self.instruments.measure('find_parent') as stats:
+            candidate, last = self.descend(key)
+            if candidate is not None:
+                stats.comparisons += 1
+                if candidate.key == key:
+                    return candidate
+            return last
+
+    def insert(self, key: KT, value: VT) -> None:
+        with self.instruments.measure('insert') as stats:
+            if self.root is None:
+                self.set_root(self.new_node(key, value))
+                return
+            candidate, parent = self.descend(key)
+            if candidate is not None:
+                stats.comparisons += 1
+                if candidate.key == key:
+                    candidate.value = value
+                    self.value_changed(candidate)
+                    return
+            stats.comparisons += 1
+            self.add_leaf(parent, key < parent.key, key, value)
+
+    def left_rotate(self, node: TreapNode) -> None:
+        stats = self.instruments.current
+        if stats is not None:
+            stats.left_rotations += 1
+        super().left_rotate(node)
+
+    def right_rotate(self, node: TreapNode) -> None:
+        stats = self.instruments.current
+        if stats is not None:
+            stats.right_rotations += 1
+        super().right_rotate(node)
+
+    def remove(self, key: KT) -> Optional[VT]:
+        with self.instruments.measure('remove'):
+            return super().remove(key)
+
+    def insert_many(self, items: typing.Iterable[typing.Tuple[KT, VT]]) -> None:
+        with self.instruments.measure('insert_many'):
+            super().insert_many(items)
+
+    def delete_range(self, lo: KT = None, hi: KT = None, inclusive: typing.Tuple[bool, bool] = (True, False)) -> int:
+        with self.instruments.measure('delete_range') as stats:
+            lo = CountingKey(lo, stats) if lo is not None else None
+            hi = CountingKey(hi, stats) if hi is not None else None
+            return super().delete_range(lo, hi, inclusive)
+
+    def split(self, threshold: KT) -> List[Treap[KT, VT]]:
+        with self.instruments.measure('split') as stats:
+            return super().split(CountingKey(threshold, stats))
+
+    def split_at_rank(self, k: int) -> List[Treap[KT, VT]]:
+        with self.instruments.measure('split_at_rank'):
+            return super().split_at_rank(k)
+
+    def join(self, _other: Treap[KT, VT], validate: bool = True) -> None:
+        with self.instruments.measure('join'):
+            super().join(_other, validate)
+
+    def meld(
+        self, other: Treap[KT, VT], on_conflict: typing.Union[str, typing.Callable[[VT, VT], VT]] = 'right'
+    ) -> None:
+        with self.instruments.measure('meld'):
+            super().meld(other, on_conflict)
+
+    def difference(self, other: Treap[KT, VT]) -> None:
+        with self.instruments.measure('difference'):
+            super().difference(other)
+
+    def intersection(
+        self, other: Treap[KT, VT], on_conflict: typing.Union[str, typing.Callable[[VT, VT], VT]] = 'left'
+    ) -> None:
+        with self.instruments.measure('intersection'):
+            super().intersection(other, on_conflict)
+
+    def symmetric_difference(self, other: Treap[KT, VT]) -> None:
+        with self.instruments.measure('symmetric_difference'):
+            super().symmetric_difference(other)
@@ -0,0 +1,232 @@
+"""
+This module contains an AugmentedTreapMap supporting updates of every value in a key range.
+
+An update is described by a tag, and an Action says how tags act: how a tag
+changes a value, how it changes the aggregate of a subtreap, and how two tags
+compose into one. `update_range` cuts the range out with two splits, applies
+the tag to the root of the middle subtreap only, and merges back, in O(log n).
+The tag stays pending on that root and is pushed one level down whenever the
+children are visited, by lookups, rotations, splits, merges and iteration.
+"""
+
+from __future__ import annotations
+import typing
+from typing import Any, Optional
+
+from py_treaps.augmented_treap_map import COUNT, MAX, MIN, SUM, AugmentedTreapMap, AugmentedTreapNode, Monoid
+from py_treaps.comparable import KT, VT
+from py_treaps.priority import PrioritySource
+from py_treaps.treap_node import TreapNode, merge_nodes, split_nodes
+
+
+class Action:
+    """
+    How update tags act on the values of a LazyTreapMap.
+
+    `apply(tag, value)` returns the updated value.
+    `compose(tag, pending)` returns a single tag with the effect of `pending` followed by `tag`.
+    `apply_aggregate(monoid, tag, aggregate, size)` returns the aggregate of a subtreap of `size` nodes
+    once `tag` has been applied to each of its values.
+
+    None is not a valid tag, it marks nodes without a pending update.
+    """
+
+    def __init__(
+        self, apply: typing.Callable[[Any, VT], VT], compose: typing.Callable[[Any, Any], Any],
+        apply_aggregate: typing.Callable[[Monoid, Any, Any, int], Any]
+    ):
+        self.apply = apply
+        self.compose = compose
+        self.apply_aggregate = apply_aggregate
+
+
+def add_to_aggregate(monoid: Monoid, tag: Any, aggregate: Any, size: int) -> Any:
+    if monoid is SUM:
+        return aggregate + tag * size
+    if monoid is MIN or monoid is MAX:
+        return aggregate + tag
+    if monoid is COUNT:
+        return aggregate
+    raise ValueError("ADD only updates the aggregates of the built-in monoids, define an Action for others.")
+
+
+def assign_to_aggregate(monoid: Monoid, tag: Any, aggregate: Any, size: int) -> Any:
+    if monoid is SUM:
+        return tag * size
+    if monoid is MIN or monoid is MAX:
+        return tag
+    if monoid is COUNT:
+        return aggregate
+    raise ValueError("ASSIGN only updates the aggregates of the built-in monoids, define an Action for others.")
+
+
+# Adds the tag to every value
+ADD = Action(lambda tag, value: value + tag, lambda tag, pending: pending + tag, add_to_aggregate)
+# Sets every value to the tag, the later of two assignments wins
+ASSIGN = Action(lambda tag, value: tag, lambda tag, pending: tag, assign_to_aggregate)
+
+
+class LazyTreapNode(AugmentedTreapNode):
+    """
+    A node of a LazyTreapMap.
+
+    Added attributes:
+        action (Action): How the tags of the treap holding this node act.
+        tag: An update applied to this node's value and aggregate, but not yet to its children, or None.
+    """
+
+    __slots__ = ('action', 'tag')
+
+    def __init__(
+        self, key: KT, value: VT, monoid: Monoid, action: Action, parent: Optional[TreapNode] = None,
+        priority: Optional[int] = None
+    ):
+        super().__init__(key, value, monoid, parent, priority)
+        self.action: Action = action
+        self.tag: Any = None
+
+    def apply_tag(self, tag: Any) -> None:
+        """
+        Applies an update to every value in this node's subtreap, in O(1).
+        This node's value and aggregate are updated now, the children are left to `push`.
+        """
+        action = self.action
+        self.value = action.apply(tag, self.value)
+        self.aggregate = action.apply_aggregate(self.monoid, tag, self.aggregate, self.size)
+        self.tag = tag if self.tag is None else action.compose(tag, self.tag)
+
+    def push(self) -> None:
+        """
+        Applies the pending tag to the children, leaving this node without one.
+        """
+        tag = self.tag
+        if tag is not None:
+            if self.left_child is not None:
+                self.left_child.apply_tag(tag)
+            if self.right_child is not None:
+                self.right_child.apply_tag(tag)
+            self.tag = None
+
+
+class LazyTreapMap(AugmentedTreapMap[KT, VT]):
+    """
+    An AugmentedTreapMap whose values can all be updated over a key range in O(log n), by `update_range`.
+
+    A node's value is only current once the tags of its ancestors have been pushed, so every method reading
+    values descends from the root pushing tags on the way. Lookups therefore cannot start from a finger, and
+    `finger_search` descends from the root.
+    """
+
+    reads_mutate = True  # Lookups and iteration push tags
+
+    def __init__(
+        self, root: LazyTreapNode = None, priority_source: PrioritySource = None, monoid: Monoid = SUM,
+        action: Action = ADD
+    ):
+        super().__init__(root, priority_source, monoid)
+        self.action = action
+
+    def new_node(self, key: KT, value: VT, parent: TreapNode = None, priority: int = None) -> LazyTreapNode:
+        if priority is None:
+            priority = self.priority_source(key)
+        return LazyTreapNode(key, value, self.monoid, self.action, parent, priority)
+
+    def empty_like(self, root: LazyTreapNode = None) -> LazyTreapMap[KT, VT]:
+        return type(self)(root, self.priority_source, self.monoid, self.action)
+
+    def update_range(
+        self, lo: KT = None, hi: KT = None, tag: Any = None, inclusive: typing.Tuple[bool, bool] = (True, False)
+    ) -> None:
+        """
+        Applies the update `tag` to every value with a key between lo and hi, with the bounds treated as in `range`.
+        The range is cut out with two splits, tagged at its root and merged back, in O(log n).
+        """
+        if tag is None:
+            raise ValueError("None is not a valid update tag.")
+        lo_inclusive, hi_inclusive = inclusive
+        left, rest = (None, self.root) if lo is None else split_nodes(self.root, lo, not lo_inclusive)
+        middle, right = (rest, None) if hi is None else split_nodes(rest, hi, hi_inclusive)
+        if middle is not None:
+            middle.apply_tag(tag)
+        self.root = merge_nodes(merge_nodes(left, middle), right)
+
+    def push_path(self, key: KT) -> Optional[LazyTreapNode]:
+        """
+        Pushes the pending tags off the search path for key.
+        Returns the node with the largest key not greater than key, or None.
+        """
+        x = self.root
+        candidate = None
+        while x is not None:
+            x.push()
+            if key < x.key:
+                x = x.left_child
+            else:
+                candidate = x
+                x = x.right_child
+        return candidate
+
+    def find_node(self, key: KT) -> Optional[LazyTreapNode]:
+        candidate = self.push_path(key)
+        if candidate is not None and candidate.key == key:
+            return candidate
+        return None
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        node = self.find_node(key)
+        return node.value if node is not None else None
+
+    def finger_search(
+        self, finger: Optional[TreapNode], key: KT
+    ) -> typing.Tuple[Optional[TreapNode], Optional[TreapNode]]:
+        candidate = self.push_path(key)
+        if candidate is not None and candidate.key == key:
+            return candidate, candidate
+        return None, candidate
+
+    def insert(self, key: KT, value: VT) -> None:
+        # The descent in `insert` follows the same path, which is then free of tags for the sizes and rotations
+        self.push_path(key)
+        super().insert(key, value)
+
+    def min_item(self) -> Optional[typing.Tuple[KT, VT]]:
+        # The cached node is found in O(1), but its value is only current once the path to it is pushed
+        if self.min_node is not None:
+            self.push_path(self.min_node.key)
+        return super().min_item()
+
+    def max_item(self) -> Optional[typing.Tuple[KT, VT]]:
+        if self.max_node is not None:
+            self.push_path(self.max_node.key)
+        return super().max_item()
+
+    def left_rotate(self, node: TreapNode) -> None:
+        node.push()
+        node.right_child.push()
+        super().left_rotate(node)
+
+    def right_rotate(self, node: TreapNode) -> None:
+        node.push()
+        node.left_child.push()
+        super().right_rotate(node)
+
+    def iter_nodes(self, reverse: bool = False) -> typing.Iterator[LazyTreapNode]:
+        """
+        Returns an iterator over the nodes in sorted order of their keys, or reversed.
+        Walks down from the root with a stack, pushing tags as it goes, so the values it yields are current.
+        """
+        near, far = ('left_child', 'right_child') if not reverse else ('right_child', 'left_child')
+        stack = []
+        x = self.root
+        while x is not None:
+            x.push()
+            stack.append(x)
+            x = getattr(x, near)
+        while stack:
+            x = stack.pop()
+            yield x
+            x = getattr(x, far)
+            while x is not None:
+                x.push()
+                stack.append(x)
+                x = getattr(x, near)
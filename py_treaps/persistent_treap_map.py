@@ -0,0 +1,401 @@
+"""
+This module contains a persistent TreapMap.
+
+Nodes are never modified once they are linked into a treap. Every update copies
+the nodes on the path it changes and shares every other subtreap with the
+previous version, so taking a snapshot of the map is O(1) and a snapshot never
+sees later updates.
+"""
+
+from __future__ import annotations
+import math
+import typing
+from typing import List, Optional
+
+from py_treaps.comparable import KT, VT
+from py_treaps.priority import DEFAULT_PRIORITY_SOURCE, PrioritySource
+from py_treaps.treap import Treap
+from py_treaps.treap_map import conflict_resolver
+from py_treaps.treap_views import TreapItemsView, TreapKeysView, TreapValuesView
+
+
+class PersistentTreapNode:
+    """
+    An immutable key-value node for the PersistentTreapMap.
+
+    There is no parent pointer, a node can be a child in many versions of the treap at once.
+
+    Attributes:
+        key (KT): The key of the node.
+        value (VT): The value associated with the key of the node.
+        priority (int): The priority of the node.
+        left_child (PersistentTreapNode): The left child of the node.
+        right_child (PersistentTreapNode): The right child of the node.
+        size (int): The number of nodes in the subtreap rooted at this node.
+    """
+
+    __slots__ = ('key', 'value', 'priority', 'left_child', 'right_child', 'size')
+
+    def __init__(
+        self, key: KT, value: VT, priority: int,
+        left_child: Optional[PersistentTreapNode] = None, right_child: Optional[PersistentTreapNode] = None
+    ):
+        self.key: KT = key
+        self.value: VT = value
+        self.priority: int = priority
+        self.left_child: Optional[PersistentTreapNode] = left_child
+        self.right_child: Optional[PersistentTreapNode] = right_child
+        self.size: int = 1 + (left_child.size if left_child is not None else 0) \
+            + (right_child.size if right_child is not None else 0)
+
+    def with_children(
+        self, left_child: Optional[PersistentTreapNode], right_child: Optional[PersistentTreapNode]
+    ) -> PersistentTreapNode:
+        """
+        Returns a copy of this node with new children.
+        """
+        return PersistentTreapNode(self.key, self.value, self.priority, left_child, right_child)
+
+    def has_left_child(self):
+        return self.left_child is not None
+
+    def has_right_child(self):
+        return self.right_child is not None
+
+
+def persistent_split(
+    node: Optional[PersistentTreapNode], key: KT
+) -> typing.Tuple[Optional[PersistentTreapNode], Optional[PersistentTreapNode], Optional[PersistentTreapNode]]:
+    """
+    Splits a subtreap into the keys less than `key`, the node with key `key` (if any) and the keys greater
+    than `key`, copying the O(log n) nodes on the search path. The middle node is returned as is.
+    """
+    if node is None:
+        return None, None, None
+    if key < node.key:
+        left, middle, right = persistent_split(node.left_child, key)
+        return left, middle, node.with_children(right, node.right_child)
+    if node.key < key:
+        left, middle, right = persistent_split(node.right_child, key)
+        return node.with_children(node.left_child, left), middle, right
+    return node.left_child, node, node.right_child
+
+
+def persistent_merge(
+    left: Optional[PersistentTreapNode], right: Optional[PersistentTreapNode]
+) -> Optional[PersistentTreapNode]:
+    """
+    Merges two subtreaps, where every key in `left` precedes every key in `right`,
+    copying the O(log n) nodes on the two merged spines.
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        return left.with_children(left.left_child, persistent_merge(left.right_child, right))
+    return right.with_children(persistent_merge(left, right.left_child), right.right_child)
+
+
+def persistent_insert(
+    node: Optional[PersistentTreapNode], new: PersistentTreapNode
+) -> PersistentTreapNode:
+    """
+    Inserts a childless node whose key is not in the subtreap, copying the nodes above its final position.
+    The new node goes where its priority fits, and the subtreap it lands on is split around its key.
+    """
+    if node is None or new.priority > node.priority:
+        left, _, right = persistent_split(node, new.key)
+        return new.with_children(left, right)
+    if new.key < node.key:
+        return node.with_children(persistent_insert(node.left_child, new), node.right_child)
+    return node.with_children(node.left_child, persistent_insert(node.right_child, new))
+
+
+def persistent_replace(node: PersistentTreapNode, key: KT, value: VT) -> PersistentTreapNode:
+    """
+    Replaces the value of `key`, which must be in the subtreap, copying the nodes on the search path.
+    """
+    if key < node.key:
+        return node.with_children(persistent_replace(node.left_child, key, value), node.right_child)
+    if node.key < key:
+        return node.with_children(node.left_child, persistent_replace(node.right_child, key, value))
+    return PersistentTreapNode(key, value, node.priority, node.left_child, node.right_child)
+
+
+def persistent_remove(node: Optional[PersistentTreapNode], key: KT) -> Optional[PersistentTreapNode]:
+    """
+    Removes `key`, which must be in the subtreap, copying the nodes on the search path
+    and merging the children of the removed node.
+    """
+    if key < node.key:
+        return node.with_children(persistent_remove(node.left_child, key), node.right_child)
+    if node.key < key:
+        return node.with_children(node.left_child, persistent_remove(node.right_child, key))
+    return persistent_merge(node.left_child, node.right_child)
+
+
+def persistent_union(
+    first: Optional[PersistentTreapNode], second: Optional[PersistentTreapNode],
+    resolve: typing.Callable[[VT, VT], VT], swapped: bool = False
+) -> Optional[PersistentTreapNode]:
+    """
+    Unions two subtreaps as `union_nodes` does, copying nodes instead of relinking them.
+    """
+    if first is None:
+        return second
+    if second is None:
+        return first
+    if first.priority < second.priority:
+        return persistent_union(second, first, resolve, not swapped)
+
+    lesser, duplicate, greater = persistent_split(second, first.key)
+    left = persistent_union(first.left_child, lesser, resolve, swapped)
+    right = persistent_union(first.right_child, greater, resolve, swapped)
+    value = first.value
+    if duplicate is not None:
+        value = resolve(duplicate.value, value) if swapped else resolve(value, duplicate.value)
+    return PersistentTreapNode(first.key, value, first.priority, left, right)
+
+
+def persistent_difference(
+    first: Optional[PersistentTreapNode], second: Optional[PersistentTreapNode]
+) -> Optional[PersistentTreapNode]:
+    """
+    Removes the keys of `second` from `first` as `difference_nodes` does, copying nodes instead of relinking them.
+    """
+    if first is None or second is None:
+        return first
+    lesser, _, greater = persistent_split(first, second.key)
+    return persistent_merge(
+        persistent_difference(lesser, second.left_child), persistent_difference(greater, second.right_child)
+    )
+
+
+class PersistentTreapMap(Treap[KT, VT]):
+    """
+    A TreapMap whose versions share structure.
+
+    Updates rebind this map to a new version of the treap. Old versions stay intact, so any
+    snapshot taken with `snapshot` can be read, even from another thread, while this map keeps changing.
+    """
+
+    def __init__(self, root: PersistentTreapNode = None, priority_source: PrioritySource = None):
+        self.root = root
+        self.priority_source = DEFAULT_PRIORITY_SOURCE if priority_source is None else priority_source
+
+    @classmethod
+    def from_sorted(
+        cls, items: typing.Iterable[typing.Tuple[KT, VT]], priority_source: PrioritySource = None
+    ) -> PersistentTreapMap[KT, VT]:
+        """
+        Builds a PersistentTreapMap from (key, value) pairs whose keys are strictly increasing, in O(n).
+        """
+        source = DEFAULT_PRIORITY_SOURCE if priority_source is None else priority_source
+        return cls.from_entries(((key, value, source(key)) for key, value in items), priority_source)
+
+    @classmethod
+    def from_entries(
+        cls, entries: typing.Iterable[typing.Tuple[KT, VT, int]], priority_source: PrioritySource = None
+    ) -> PersistentTreapMap[KT, VT]:
+        """
+        Builds a PersistentTreapMap from (key, value, priority) triples whose keys are strictly increasing, in O(n),
+        keeping the given priorities. Like `cartesian_tree`, but a node is only created once its subtreap is final.
+        """
+        treap = cls(priority_source=priority_source)
+        # Right spine of the tree built so far, as (key, value, priority, left subtreap) of nodes yet to be created
+        spine: List[list] = []
+        prev = None
+        for key, value, priority in entries:
+            if spine and not prev < key:
+                raise ValueError("Keys passed to `from_sorted` must be strictly increasing.")
+            prev = key
+            last = None
+            while spine and spine[-1][2] < priority:
+                k, v, p, left = spine.pop()
+                last = PersistentTreapNode(k, v, p, left, last)
+            spine.append([key, value, priority, last])
+
+        last = None
+        while spine:
+            k, v, p, left = spine.pop()
+            last = PersistentTreapNode(k, v, p, left, last)
+        treap.root = last
+        return treap
+
+    def snapshot(self) -> PersistentTreapMap[KT, VT]:
+        """
+        Returns the current version of this map, in O(1). Later updates to this map do not affect it.
+        """
+        return type(self)(self.root, self.priority_source)
+
+    def get_root_node(self) -> Optional[PersistentTreapNode]:
+        return self.root
+
+    def get_num_elements(self) -> int:
+        return self.root.size if self.root is not None else 0
+
+    def lookup(self, key: KT) -> Optional[VT]:
+        node = self.find_node(key)
+        return node.value if node is not None else None
+
+    def find_node(self, key: KT) -> Optional[PersistentTreapNode]:
+        """
+        Returns the node holding key, `key`, or None, with one `<` comparison per level as in TreapMap.
+        """
+        x = self.root
+        candidate = None
+        while x is not None:
+            if key < x.key:
+                x = x.left_child
+            else:
+                candidate = x
+                x = x.right_child
+        if candidate is not None and candidate.key == key:
+            return candidate
+        return None
+
+    def insert(self, key: KT, value: VT) -> None:
+        if self.find_node(key) is not None:
+            self.root = persistent_replace(self.root, key, value)
+        else:
+            new = PersistentTreapNode(key, value, self.priority_source(key))
+            self.root = persistent_insert(self.root, new)
+
+    def remove(self, key: KT) -> Optional[VT]:
+        node = self.find_node(key)
+        if node is None:
+            return None
+        self.root = persistent_remove(self.root, key)
+        return node.value
+
+    def split(self, threshold: KT) -> List[Treap[KT, VT]]:
+        """
+        Returns new maps with the keys less than, and greater than or equal to, the threshold.
+        Only the search path is copied, and this map is left unchanged.
+        """
+        left, middle, right = persistent_split(self.root, threshold)
+        if middle is not None:
+            right = persistent_merge(middle.with_children(None, None), right)
+        return [type(self)(left, self.priority_source), type(self)(right, self.priority_source)]
+
+    def join(self, other: Treap[KT, VT]) -> None:
+        """
+        Joins another map whose keys all precede, or all follow, the keys of this map.
+        `other` is left unchanged.
+        """
+        if other.root is None:
+            return
+        if self.root is None:
+            self.root = other.root
+        elif self.last_node().key < other.first_node().key:
+            self.root = persistent_merge(self.root, other.root)
+        elif other.last_node().key < self.first_node().key:
+            self.root = persistent_merge(other.root, self.root)
+        else:
+            raise ValueError("Cannot join Treaps with overlapping keys, use `meld` instead.")
+
+    def meld(
+        self, other: Treap[KT, VT], on_conflict: typing.Union[str, typing.Callable[[VT, VT], VT]] = 'right'
+    ) -> None:
+        """
+        Adds the keys of another map, resolving keys held by both as `TreapMap.meld` does.
+        `other` is left unchanged.
+        """
+        self.root = persistent_union(self.root, other.root, conflict_resolver(on_conflict))
+
+    def difference(self, other: Treap[KT, VT]) -> None:
+        """
+        Removes the keys of another map. `other` is left unchanged.
+        """
+        self.root = persistent_difference(self.root, other.root)
+
+    def balance_factor(self) -> float:
+        """
+        Ratio between the height and the minimum possible height.
+        """
+        if self.root is None:
+            return 1
+        height = 0
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            height = max(height, depth)
+            for child in (node.left_child, node.right_child):
+                if child is not None:
+                    stack.append((child, depth + 1))
+        hmin = math.floor(math.log(self.root.size, 2))
+        if hmin == 0:
+            return 1
+        return height / hmin
+
+    def __str__(self) -> str:
+        """
+        Constructs a string representation of the current tree, in the same format as TreapMap.
+        """
+        lines = []
+        stack = [(self.root, 0, 'Root')] if self.root is not None else []
+        while stack:
+            node, lvl, node_type = stack.pop()
+            lines.append('\t' * lvl + f'{node_type}: {(node.key, node.priority)}')
+            if node.right_child is not None:
+                stack.append((node.right_child, lvl + 1, 'R'))
+            if node.left_child is not None:
+                stack.append((node.left_child, lvl + 1, 'L'))
+        return '\n'.join(lines)
+
+    def first_node(self) -> Optional[PersistentTreapNode]:
+        x = self.root
+        if x is not None:
+            while x.left_child is not None:
+                x = x.left_child
+        return x
+
+    def last_node(self) -> Optional[PersistentTreapNode]:
+        x = self.root
+        if x is not None:
+            while x.right_child is not None:
+                x = x.right_child
+        return x
+
+    def iter_nodes(self, reverse: bool = False) -> typing.Iterator[PersistentTreapNode]:
+        """
+        Returns an iterator over the nodes in sorted order of their keys, or reversed.
+        Without parent pointers this keeps a stack of the O(log n) nodes still to be visited.
+        Iterating a map that is updated meanwhile walks the version current when iteration started.
+        """
+        near, far = ('left_child', 'right_child') if not reverse else ('right_child', 'left_child')
+        stack = []
+        x = self.root
+        while True:
+            while x is not None:
+                stack.append(x)
+                x = getattr(x, near)
+            if not stack:
+                return
+            x = stack.pop()
+            yield x
+            x = getattr(x, far)
+
+    def keys(self) -> TreapKeysView:
+        return TreapKeysView(self)
+
+    def values(self) -> TreapValuesView:
+        return TreapValuesView(self)
+
+    def items(self) -> TreapItemsView:
+        return TreapItemsView(self)
+
+    def __contains__(self, key: KT) -> bool:
+        return self.find_node(key) is not None
+
+    def __iter__(self) -> typing.Iterator[KT]:
+        for node in self.iter_nodes():
+            yield node.key
+
+    def __reversed__(self) -> typing.Iterator[KT]:
+        for node in self.iter_nodes(reverse=True):
+            yield node.key
+
+    def __len__(self) -> int:
+        return self.get_num_elements()
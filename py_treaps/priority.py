@@ -0,0 +1,72 @@
+"""
+This module contains the priority sources a TreapMap can draw node priorities from.
+
+A priority source is any callable taking the key of the node being created and
+returning an integer in the range [0, MAX_PRIORITY). MAX_PRIORITY itself is
+reserved so a node can always be given a priority larger than every other node.
+"""
+
+from __future__ import annotations
+import random
+
+from py_treaps.comparable import KT
+
+# Priorities are drawn from PRIORITY_BITS random bits.
+# With this many bits two nodes sharing a priority is vanishingly unlikely, even in maps with billions of nodes.
+PRIORITY_BITS = 62
+MAX_PRIORITY = 1 << PRIORITY_BITS
+
+_MASK_64 = (1 << 64) - 1
+
+
+class PrioritySource:
+    """
+    Base class for priority sources.
+    Subclasses only need to implement `__call__`.
+    """
+
+    def __call__(self, key: KT) -> int:
+        """
+        Returns the priority for a new node with key, `key`.
+        """
+        raise NotImplementedError("unimplemented method `__call__`")
+
+
+class RandomPriority(PrioritySource):
+    """
+    Draws priorities from a private pseudo random number generator.
+    Passing a seed makes the sequence of priorities, and so the shape of the treap built by
+    a fixed sequence of operations, reproducible.
+    """
+
+    def __init__(self, seed: int = None):
+        self.seed = seed
+        self._getrandbits = random.Random(seed).getrandbits
+
+    def __call__(self, key: KT) -> int:
+        return self._getrandbits(PRIORITY_BITS)
+
+
+class HashPriority(PrioritySource):
+    """
+    Derives priorities from the hash of the key, so the shape of the treap only depends on the set of keys it holds,
+    not on the order they were inserted in.
+
+    Note that python salts the hashes of `str` and `bytes` per process, set PYTHONHASHSEED for shapes
+    that are reproducible across runs.
+    """
+
+    def __init__(self, salt: int = 0):
+        self.salt = salt
+
+    def __call__(self, key: KT) -> int:
+        # Scramble the hash with the splitmix64 finalizer, hashes of small ints are the ints themselves
+        z = (hash(key) + self.salt * 0x9E3779B97F4A7C15) & _MASK_64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK_64
+        z ^= z >> 31
+        return z >> (64 - PRIORITY_BITS)
+
+
+# Shared by every TreapMap that is not given its own source
+DEFAULT_PRIORITY_SOURCE = RandomPriority()
@@ -0,0 +1,105 @@
+"""
+This module contains the compact binary format used by `TreapMap.dump` and `TreapMap.load`.
+
+A dump holds the (key, value, priority) triples of the nodes in key order, which
+is all that is needed to rebuild the exact shape of the treap: the Cartesian tree
+of a key ordered sequence of priorities is unique. The layout is
+
+    header:  magic (4 bytes), number of entries (uint64)
+    chunks:  codec (1 byte), number of entries (uint32), payload length (uint32),
+             payload, priorities (uint64 each)
+
+all little endian. The payload is the tuple (keys, values) of the chunk, written
+with `marshal` when the keys and values are all of the core built-in types, and
+with `pickle` otherwise. Chunks keep the memory used while writing and reading
+bounded, so both run in one streaming pass.
+"""
+
+from __future__ import annotations
+import array
+import marshal
+import pickle
+import struct
+import sys
+import typing
+from typing import BinaryIO
+
+from py_treaps.comparable import KT, VT
+
+MAGIC = b'TRP\x01'
+HEADER = struct.Struct('<4sQ')
+CHUNK_HEADER = struct.Struct('<cII')
+CHUNK_ENTRIES = 1 << 14
+
+MARSHAL = b'M'
+PICKLE = b'P'
+
+
+def encode(obj: typing.Any) -> typing.Tuple[bytes, bytes]:
+    """
+    Returns the codec and payload for obj, marshal when it can hold obj, pickle otherwise.
+    """
+    try:
+        return MARSHAL, marshal.dumps(obj)
+    except ValueError:  # An object of a type marshal does not support, including subclasses of the core types
+        return PICKLE, pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+
+def decode(codec: bytes, payload: bytes) -> typing.Any:
+    if codec == MARSHAL:
+        return marshal.loads(payload)
+    if codec == PICKLE:
+        return pickle.loads(payload)
+    raise ValueError(f"Unknown codec {codec!r} in treap dump.")
+
+
+def write_entries(fp: BinaryIO, count: int, entries: typing.Iterable[typing.Tuple[KT, VT, int]]) -> None:
+    """
+    Writes `count` (key, value, priority) triples, given in increasing key order, to the binary file fp.
+    """
+    fp.write(HEADER.pack(MAGIC, count))
+    keys, values, priorities = [], [], array.array('Q')
+    for key, value, priority in entries:
+        keys.append(key)
+        values.append(value)
+        priorities.append(priority)
+        if len(keys) == CHUNK_ENTRIES:
+            write_chunk(fp, keys, values, priorities)
+            keys, values, priorities = [], [], array.array('Q')
+    if keys:
+        write_chunk(fp, keys, values, priorities)
+
+
+def write_chunk(fp: BinaryIO, keys: list, values: list, priorities: array.array) -> None:
+    codec, payload = encode((keys, values))
+    if sys.byteorder == 'big':
+        priorities.byteswap()
+    fp.write(CHUNK_HEADER.pack(codec, len(keys), len(payload)))
+    fp.write(payload)
+    fp.write(priorities.tobytes())
+
+
+def read_entries(fp: BinaryIO) -> typing.Iterator[typing.Tuple[KT, VT, int]]:
+    """
+    Yields the (key, value, priority) triples written by `write_entries`, in increasing key order.
+    Raises a ValueError if fp does not hold a treap dump, or ends early.
+    """
+    magic, count = HEADER.unpack(read_exactly(fp, HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a treap dump.")
+    while count:
+        codec, n, length = CHUNK_HEADER.unpack(read_exactly(fp, CHUNK_HEADER.size))
+        keys, values = decode(codec, read_exactly(fp, length))
+        priorities = array.array('Q')
+        priorities.frombytes(read_exactly(fp, 8 * n))
+        if sys.byteorder == 'big':
+            priorities.byteswap()
+        yield from zip(keys, values, priorities)
+        count -= n
+
+
+def read_exactly(fp: BinaryIO, size: int) -> bytes:
+    data = fp.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated treap dump.")
+    return data
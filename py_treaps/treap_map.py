@@ -1,27 +1,154 @@
 from __future__ import annotations
+import contextlib
+import gc
 import random
 import typing
 from collections.abc import Iterator
 from typing import List, Optional, cast
 import math
 
+from py_treaps.priority import DEFAULT_PRIORITY_SOURCE, PrioritySource
+from py_treaps.serialization import read_entries, write_entries
 from py_treaps.stack import Stack
 from py_treaps.treap import KT, VT, Treap
-from py_treaps.treap_node import TreapNode
+from py_treaps.treap_views import TreapItemsView, TreapKeysView, TreapValuesView
+from py_treaps.treap_node import (
+    TreapNode, cartesian_tree, difference_nodes, intersection_nodes, merge_nodes, split_nodes, split_nodes_at_rank,
+    symmetric_difference_nodes, union_nodes
+)
+
+
+def keep_left(left: VT, right: VT) -> VT:
+    return left
+
+
+def keep_right(left: VT, right: VT) -> VT:
+    return right
+
+
+def conflict_resolver(on_conflict: typing.Union[str, typing.Callable[[VT, VT], VT]]) -> typing.Callable[[VT, VT], VT]:
+    """
+    Returns the function picking the value of a key held by two Treaps, for a conflict policy.
+    """
+    if on_conflict == 'left':
+        return keep_left
+    if on_conflict == 'right':
+        return keep_right
+    if callable(on_conflict):
+        return on_conflict
+    raise ValueError(f"Unknown conflict policy {on_conflict!r}, expected 'left', 'right' or a function.")
+
+
+def sorted_unique(items: typing.Iterable[typing.Tuple[KT, VT]]) -> List[typing.Tuple[KT, VT]]:
+    """
+    Sorts (key, value) pairs by key, keeping the last value given for a duplicated key.
+    """
+    pairs = sorted(items, key=lambda item: item[0])  # Stable, so duplicates keep their input order
+    deduped = []
+    for key, value in pairs:
+        if deduped and deduped[-1][0] == key:
+            deduped[-1] = (key, value)
+        else:
+            deduped.append((key, value))
+    return deduped
+
+
+@contextlib.contextmanager
+def gc_paused() -> typing.Iterator[None]:
+    """
+    Pauses the cyclic garbage collector for the block, if it was enabled.
+    Building n linked nodes otherwise sets off collections that traverse every node built so far,
+    which makes bulk builds several times slower.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
 
 # Example usage found in test_treaps.py
 class TreapMap(Treap[KT, VT]):
+    # True for subclasses whose lookups and iteration change the nodes, so concurrent readers must be excluded
+    reads_mutate = False
+
     # Add an __init__ if you want. Make the parameters optional, though.
-    def __init__(self, root: TreapNode = None):
+    def __init__(self, root: TreapNode = None, priority_source: PrioritySource = None):
         """
         Initializes the TreapMap. If a root is passed, that root's parent will be cleaved.
+        New nodes draw their priorities from `priority_source`, the shared random source by default.
+        """
+        self.priority_source = DEFAULT_PRIORITY_SOURCE if priority_source is None else priority_source
+        if root is not None:
+            root.parent = None
+        self.set_root(root)
+
+    @classmethod
+    def from_sorted(
+        cls, items: typing.Iterable[typing.Tuple[KT, VT]], priority_source: PrioritySource = None, **kwargs
+    ) -> TreapMap[KT, VT]:
+        """
+        Builds a TreapMap from (key, value) pairs whose keys are strictly increasing, in O(n).
+        Any other keyword arguments are passed on to the constructor.
+        """
+        treap = cls(priority_source=priority_source, **kwargs)
+        treap.load_sorted(items)
+        return treap
+
+    @classmethod
+    def from_items(
+        cls, items: typing.Iterable[typing.Tuple[KT, VT]], priority_source: PrioritySource = None, **kwargs
+    ) -> TreapMap[KT, VT]:
+        """
+        Builds a TreapMap from (key, value) pairs in any order. Runs in O(n log n) for the sort, then O(n).
+        As with repeated `insert` calls, the last value given for a duplicated key is kept.
+        """
+        return cls.from_sorted(sorted_unique(items), priority_source, **kwargs)
+
+    def load_sorted(self, items: typing.Iterable[typing.Tuple[KT, VT]]) -> None:
+        """
+        Replaces the contents of this Treap with (key, value) pairs whose keys are strictly increasing.
+        Runs in O(n) by building the Cartesian tree of the priorities with a stack holding the right spine,
+        so no `find_parent` descents or rotations are performed.
+        """
+        def nodes() -> typing.Iterator[TreapNode]:
+            prev = None
+            for key, value in items:
+                if prev is not None and not prev.key < key:
+                    raise ValueError("Keys passed to `from_sorted` must be strictly increasing.")
+                prev = self.new_node(key, value)
+                yield prev
+
+        with gc_paused():
+            self.set_root(cartesian_tree(nodes()))
+
+    def set_root(self, root: Optional[TreapNode]) -> None:
+        """
+        Replaces the contents of this Treap with the subtreap at `root`, whose parent must be None.
+        Recounts the nodes and finds the cached smallest and largest nodes, in O(log n).
         """
         self.root = root
-        self.num_nodes = 0
-        if self.root is not None:
-            self.root.parent = None
-            self.num_nodes += 1
+        self.num_nodes = root.size if root is not None else 0
+        self.min_node: Optional[TreapNode] = self.first_node()
+        self.max_node: Optional[TreapNode] = self.last_node()
+
+    def new_node(self, key: KT, value: VT, parent: TreapNode = None, priority: int = None) -> TreapNode:
+        """
+        Creates a node for this Treap, drawing its priority from the priority source unless one is given.
+        Subclasses storing more in their nodes override this.
+        """
+        if priority is None:
+            priority = self.priority_source(key)
+        return TreapNode(key, value, parent, priority)
+
+    def empty_like(self, root: TreapNode = None) -> TreapMap[KT, VT]:
+        """
+        Returns a Treap configured like this one, holding the subtreap at `root`, or empty.
+        Subclasses with more configuration override this.
+        """
+        return type(self)(root, self.priority_source)
 
     def get_root_node(self) -> Optional[TreapNode]:
         return self.root
@@ -33,20 +160,37 @@ class TreapMap(Treap[KT, VT]):
         """
         Returns the value for the given key.
 
-        Helper is utilized to ensure the inputs are the same as provided for testing.
+        Descends iteratively with a single `<` comparison per level, remembering the last node whose key is not
+        greater than `key`. That node is the only one which can hold `key`, so equality is checked once at the end.
         """
+        x = self.root
+        candidate = None
+        while x is not None:
+            if key < x.key:
+                x = x.left_child
+            else:
+                candidate = x
+                x = x.right_child
+        if candidate is not None and candidate.key == key:
+            return candidate.value
+        return None
 
-        def helper(node: TreapNode) -> Optional[VT]:
-            if node is None:
-                return None
-            if node.key == key:
-                return node.value
-            if key > node.key:
-                return helper(node.right_child)
-            if key < node.key:
-                return helper(node.left_child)
-
-        return helper(self.root)
+    def find_node(self, key: KT) -> Optional[TreapNode]:
+        """
+        Returns the node holding key, `key`, or None if the key is not in the Treap.
+        Searches the same way as `lookup`.
+        """
+        x = self.root
+        candidate = None
+        while x is not None:
+            if key < x.key:
+                x = x.left_child
+            else:
+                candidate = x
+                x = x.right_child
+        if candidate is not None and candidate.key == key:
+            return candidate
+        return None
 
     def find_parent(self, key: KT) -> TreapNode:
         """
@@ -54,39 +198,137 @@ class TreapMap(Treap[KT, VT]):
         If key is in the Treap, returns the corresponding node.
         """
         x = self.root
+        candidate = None
         # Perform the BST insertion
         while True:
-            if x.key > key:
+            if key < x.key:
                 if x.left_child is None:
-                    return x
+                    break
                 x = x.left_child
-            elif x.key < key:
+            else:
+                candidate = x
                 if x.right_child is None:
-                    return x
+                    break
                 x = x.right_child
-            elif x.key == key:
-                return x
+        if candidate is not None and candidate.key == key:
+            return candidate
+        return x
 
     def insert(self, key: KT, value: VT) -> None:
-        self.num_nodes += 1
-        if self.root is None:
-            self.root = TreapNode(key, value)
+        x = self.root
+        if x is None:
+            self.set_root(self.new_node(key, value))
+            return
+
+        # Same descent as `find_parent`, remembering which side of the parent the new node goes on
+        candidate = None
+        while True:
+            if key < x.key:
+                if x.left_child is None:
+                    is_left = True
+                    break
+                x = x.left_child
+            else:
+                candidate = x
+                if x.right_child is None:
+                    is_left = False
+                    break
+                x = x.right_child
+        if candidate is not None and candidate.key == key:
+            candidate.value = value
+            self.value_changed(candidate)
+            return
+        self.add_leaf(x, is_left, key, value)
+
+    def add_leaf(self, parent: TreapNode, is_left: bool, key: KT, value: VT) -> TreapNode:
+        """
+        Helper for `insert`. Attaches a new node as the left or right child of parent, which must be free and
+        the position of key in the BST order, then rotates it up to restore the heap property. Returns the new node.
+        """
+        new = self.new_node(key, value, parent)
+        if is_left:
+            parent.left_child = new
         else:
-            parent = self.find_parent(key)
-
-            if parent.key > key:
-                new = TreapNode(key, value, parent)
-                parent.make_left_child(new)
-            elif parent.key < key:
-                new = TreapNode(key, value, parent)
-                parent.make_right_child(new)
-            elif parent.key == key:
-                parent.value = value
-                return
+            parent.right_child = new
+        self.add_to_sizes(parent, 1)
+        self.num_nodes += 1
+        if parent is self.min_node and is_left:
+            self.min_node = new
+        elif parent is self.max_node and not is_left:
+            self.max_node = new
+
+        # Rebalance maxheap
+        if new.priority > parent.priority:  # The heap is imbalanced
+            self.rebalance_heap(new)
+        return new
+
+    def finger_search(
+        self, finger: Optional[TreapNode], key: KT
+    ) -> typing.Tuple[Optional[TreapNode], Optional[TreapNode]]:
+        """
+        Searches for `key` starting from `finger`, a node whose key is not greater than `key` (or None for the root).
+
+        Climbs through the parent pointers until the subtreap below holds `key`'s position, then descends as `lookup`
+        does. For nearby keys this visits O(log d) nodes, d being the number of keys between the finger and `key`.
+        Returns the node holding `key` (or None) and the node with the largest key not greater than `key`
+        (or None), which is a valid finger for any later, larger key.
+        """
+        x = self.root if finger is None else finger
+        if finger is not None:
+            while x.parent is not None and x.key < key:
+                parent = x.parent
+                if parent.left_child is x and key < parent.key:
+                    break
+                x = parent
+
+        candidate = None
+        while x is not None:
+            if key < x.key:
+                x = x.left_child
+            else:
+                candidate = x
+                x = x.right_child
+        if candidate is not None and candidate.key == key:
+            return candidate, candidate
+        return None, candidate
+
+    def lookup_many(self, keys: typing.Iterable[KT]) -> List[Optional[VT]]:
+        """
+        Returns the values of many keys at once, in the order of `keys`, with None for missing keys.
+        The keys are visited in sorted order, each search starting from the node found by the last one,
+        so m lookups cost O(m log(n/m)) rather than O(m log n).
+        """
+        keys = list(keys)
+        values: List[Optional[VT]] = [None] * len(keys)
+        finger = None
+        for i in sorted(range(len(keys)), key=keys.__getitem__):
+            node, finger = self.finger_search(finger, keys[i])
+            if node is not None:
+                values[i] = node.value
+        return values
 
-            # Rebalance maxheap
-            if new.priority > parent.priority:  # The heap is imbalanced
-                self.rebalance_heap(new)
+    def insert_many(self, items: typing.Iterable[typing.Tuple[KT, VT]]) -> None:
+        """
+        Inserts many (key, value) pairs at once. As with repeated `insert` calls, the last value given for a key wins.
+        The batch is built into a treap in O(m log m) and melded in, which costs O(m log(n/m)).
+        """
+        batch = self.empty_like()
+        batch.load_sorted(sorted_unique(items))
+        self.meld(batch, on_conflict='right')
+
+    def add_to_sizes(self, node: Optional[TreapNode], delta: int) -> None:
+        """
+        Adds delta to the size of node and each of its ancestors.
+        """
+        while node is not None:
+            node.size += delta
+            node = node.parent
+
+    def value_changed(self, node: TreapNode) -> None:
+        """
+        Called after the value of node is overwritten in place. Nothing depends on values here,
+        subclasses keeping data derived from the values refresh it.
+        """
 
     def left_rotate(self, node: TreapNode) -> None:
         """
@@ -95,24 +337,24 @@ class TreapMap(Treap[KT, VT]):
         # Get relational nodes
         child = node.right_child
         grandparent = node.parent
-        if grandparent is not None:
-            node_child_type = 'L' if node.is_left_child() else 'R'
 
-        node.right_child = child.left_child
-        node.correct_children()
+        inner = child.left_child
+        node.right_child = inner
+        if inner is not None:
+            inner.parent = node
         child.left_child = node
         node.parent = child
 
-        if grandparent is not None:
-            if node_child_type == 'L':
-                grandparent.left_child = child
-            elif node_child_type == 'R':
-                grandparent.right_child = child
-            child.parent = grandparent
-
-        elif grandparent is None:  # The child was rotated to the root
+        child.parent = grandparent
+        if grandparent is None:  # The child was rotated to the root
             self.root = child
-            child.parent = None
+        elif grandparent.left_child is node:
+            grandparent.left_child = child
+        else:
+            grandparent.right_child = child
+
+        node.update()
+        child.update()
 
     def right_rotate(self, node: TreapNode) -> None:
         """
@@ -121,312 +363,487 @@ class TreapMap(Treap[KT, VT]):
         # Get relational nodes
         child = node.left_child
         grandparent = node.parent
-        if grandparent is not None:
-            node_child_type = 'L' if node.is_left_child() else 'R'
 
-        node.left_child = child.right_child
-        node.correct_children()
+        inner = child.right_child
+        node.left_child = inner
+        if inner is not None:
+            inner.parent = node
         child.right_child = node
         node.parent = child
 
-        if grandparent is not None:
-            if node_child_type == 'L':
-                grandparent.left_child = child
-            elif node_child_type == 'R':
-                grandparent.right_child = child
-            child.parent = grandparent
-
-        elif grandparent is None:
+        child.parent = grandparent
+        if grandparent is None:  # The child was rotated to the root
             self.root = child
-            child.parent = None
+        elif grandparent.left_child is node:
+            grandparent.left_child = child
+        else:
+            grandparent.right_child = child
+
+        node.update()
+        child.update()
 
     def rebalance_heap(self, child: TreapNode) -> None:
-        grandparent = child.parent.parent
-        if child.is_left_child():
-            self.right_rotate(child.parent)
-        elif child.is_right_child():
-            self.left_rotate(child.parent)
-
-        # Check for new imbalances (first child had too large priority, check if this is still the case
-        # btw child & it's new parent
-        if grandparent is not None:
-            if child.priority > grandparent.priority:
-                self.rebalance_heap(child)
+        """
+        Rotates child up until its parent has a higher priority, restoring the heap property.
+        """
+        parent = child.parent
+        while parent is not None and child.priority > parent.priority:
+            if parent.left_child is child:
+                self.right_rotate(parent)
+            else:
+                self.left_rotate(parent)
+            parent = child.parent
 
     def remove(self, key: KT) -> Optional[VT]:
         """
         Removes the node with this key from the tree. Returns the value for that node. Returns None if not present.
         """
-        if self.get_root_node() is None:
+        victim = self.find_node(key)
+        if victim is None:  # The key is not in the Treap
             return None
+        return self.remove_node(victim)
 
-        victim = self.find_parent(key)  # Note, if key is in Treap `find_parent` returns that node
-        if victim.key != key:  # The key is not in the Treap
-            return None
+    def remove_node(self, victim: TreapNode) -> VT:
+        """
+        Removes a node of this Treap, rotating it down to a leaf and detaching it. Returns its value.
+        """
         val = victim.value
+        if victim is self.min_node:
+            self.min_node = victim.successor()
+        if victim is self.max_node:
+            self.max_node = victim.predecessor()
 
         # victim is now the node to be removed
         # The child taking its place should have the largest priority
         # We rotate the highest priority child to the victims spot
 
-        while victim.has_children():
-            if not victim.has_right_child() and victim.has_left_child():
-                self.right_rotate(victim)
-            elif not victim.has_left_child() and victim.has_right_child():
+        while True:
+            left, right = victim.left_child, victim.right_child
+            if left is None:
+                if right is None:
+                    break
                 self.left_rotate(victim)
-
-            elif victim.left_child.priority > victim.right_child.priority:
+            elif right is None or left.priority > right.priority:
                 self.right_rotate(victim)
-            elif victim.right_child.priority > victim.left_child.priority:
+            else:
                 self.left_rotate(victim)
 
         # Victim is now a leaf
-        victim.remove()
-
-        return val
-
-    def insert(self, key: KT, value: VT) -> None:
-        self.num_nodes += 1
-        if self.root is None:
-            self.root = TreapNode(key, value)
+        if victim.parent is None:  # Victim was the only node
+            self.root = None
         else:
-            parent = self.find_parent(key)
-
-            if parent.key > key:
-                new = TreapNode(key, value, parent)
-                parent.make_left_child(new)
-            elif parent.key < key:
-                new = TreapNode(key, value, parent)
-                parent.make_right_child(new)
-            elif parent.key == key:
-                parent.value = value
-                return
+            victim.remove()
+            self.add_to_sizes(victim.parent, -1)
+            victim.parent = None
+        self.num_nodes -= 1
 
-            # Rebalance maxheap
-            if new.priority > parent.priority:  # The heap is imbalanced
-                self.rebalance_heap(new)
+        return val
 
-    def insert_with_max_priority(self, key: KT) -> None:
+    def split(self, threshold: KT) -> List[Treap[KT, VT]]:
         """
-        Helper for `split`. Same function as insert, however sets the priority
-        of the new node to the max priority.
+        Splits the Treap into 2, one with keys less than, the other with keys greater than or equal to the threshold.
+        Performed directly on the search path to the threshold in O(log n), without inserting any extra node.
+        The nodes are moved into the two new Treaps, leaving this Treap empty.
         """
-        value = None
-        if self.root is None:
-            self.root = TreapNode(key, value)
-        else:
-            parent = self.find_parent(key)
+        left, right = split_nodes(self.root, threshold)
+        return self.adopt_split(left, right)
 
-            if parent.key >= key:
-                new = TreapNode(key, value, parent)
-                parent.make_left_child(new)
-            elif parent.key < key:
-                new = TreapNode(key, value, parent)
-                parent.make_right_child(new)
-
-            new.set_priority_to_max()
-            self.rebalance_heap(new)
-
-    def split(self, threshold: KT) -> List[Treap[KT, VT]]:
+    def split_at_rank(self, k: int) -> List[Treap[KT, VT]]:
         """
-        Splits the Treap into 2, one with keys less than, the other with keys greater than or equal to the threshold.
-        Performed by inserting a new node with key threshold and priority MAXPRIORITY.
-        The left subtree is the lesser keys, the right subtree is the greater/equal to keys.
+        Splits the Treap into 2, one with the k smallest keys, the other with the remaining keys, in O(log n).
+        The nodes are moved into the two new Treaps, leaving this Treap empty.
+        """
+        left, right = split_nodes_at_rank(self.root, k)
+        return self.adopt_split(left, right)
 
+    def adopt_split(self, left: Optional[TreapNode], right: Optional[TreapNode]) -> List[Treap[KT, VT]]:
+        """
+        Helper for the splits. Wraps the two subtreaps in new Treaps sharing this Treap's priority source,
+        and empties this Treap.
         """
-        # 1) Insert new entry x with key threshold, and priority = MAXPRIORITY
-        self.insert_with_max_priority(threshold)
-        # 2) T1 is the left subtree, T2 is the right
-        T1 = TreapMap(self.root.left_child)
-        T2 = TreapMap(self.root.right_child)
-        return [T1, T2]
+        self.set_root(None)
+        return [self.empty_like(left), self.empty_like(right)]
 
-    def join(self, _other: Treap[KT, VT]) -> None:
+    def join(self, _other: Treap[KT, VT], validate: bool = True) -> None:
         """
         Joins another Treap to this Treap.
-        Note it's assumed that all keys in T1 are smaller than keys in T2.
+        Every key of one Treap must precede every key of the other, either Treap may hold the smaller keys.
+        The two root to leaf spines facing each other are merged in O(log n), without creating any node.
 
+        If validate, the cached extreme keys of the two Treaps are checked (in O(1)) and a ValueError is raised
+        when the key ranges overlap. Otherwise the order is taken from the root keys and overlap is not detected.
+        The nodes of `_other` are moved into this Treap, leaving it empty.
         """
         if _other.root is None:
             return
         if self.root is None:
-            self.root = _other.root
+            self.root, self.num_nodes = _other.root, _other.num_nodes
+            self.min_node, self.max_node = _other.min_node, _other.max_node
+            _other.set_root(None)
             return
-        # Create new TreapMap with arbitrary root, x
-        T = TreapMap(TreapNode(0, None))
-        # Make T1 & T2 the subtreaps
-        T1, T2 = (self, _other) if self.root.key < _other.root.key else (_other, self)
-        T.root.left_child = T1.root
-        T.root.right_child = T2.root
-        T.root.correct_children()
-        self.root = T.root
-        # Delete x
-        self.remove(0)
-
-    def meld(self, other: Treap[KT, VT]) -> None:
+
+        if not validate:
+            self_first = self.root.key < _other.root.key
+        elif self.max_node.key < _other.min_node.key:
+            self_first = True
+        elif _other.max_node.key < self.min_node.key:
+            self_first = False
+        else:
+            raise ValueError("Cannot join Treaps with overlapping keys, use `meld` instead.")
+
+        if self_first:
+            self.root = merge_nodes(self.root, _other.root)
+            self.max_node = _other.max_node
+        else:
+            self.root = merge_nodes(_other.root, self.root)
+            self.min_node = _other.min_node
+        self.num_nodes = self.root.size
+        _other.set_root(None)
+
+    def meld(
+        self, other: Treap[KT, VT], on_conflict: typing.Union[str, typing.Callable[[VT, VT], VT]] = 'right'
+    ) -> None:
         """
         Merges two Treaps. Does not assume any relationship between keys.
 
         Must run in O(m log(n/m)). n, m are the Treap sizes. (m<n)
+        Done by a divide and conquer union, see karma.md.
+
+        `on_conflict` decides the value of a key held by both Treaps:
+        'left' keeps this Treap's value, 'right' keeps the other Treap's value (as inserting it would),
+        and a function is called with (this value, other value) and returns the value to keep.
+        The nodes of `other` are moved into this Treap, leaving it empty.
+        Melding a Treap with itself leaves its keys unchanged, with each value resolved against itself.
         """
+        if other is self:  # The union splits apart the nodes it is still reading from the other side
+            other = self.copy()
+        self.set_root(union_nodes(self.root, other.root, conflict_resolver(on_conflict)))
+        other.set_root(None)
 
-        if len(other) > len(self):
-            self, other = other, self
-
-        subtrees = [other.root]
-
-        while subtrees:
-            subtree = subtrees.pop()
-            # Start at the root
-            k = subtree.key
-            # Try to insert like a node
-            parent = self.find_parent(k)
-
-            if parent.key < k:
-                # We are moving right
-                # If you move right, check down the left child to see if also larger
-                y = subtree.left_child
-                while y is not None:
-                    if y.key < parent.key:
-                        y.split()
-                        subtrees.append(y)
-                        break
-                    else:
-                        y = y.left_child
-
-                if parent.parent is not None:
-                    z = subtree.right_child
-                    while z is not None:
-                        if z.key > parent.parent.key:
-                            z.split()
-                            subtrees.append(z)
-                            break
-                        else:
-                            z = z.right_child
-
-                parent.make_right_child(subtree)
-
-            elif parent.key > k:
-                # We are moving left
-                # If you move left, check down the right child to see if also larger
-                y = subtree.right_child
-                while y is not None:
-                    if y.key > parent.key:
-                        y.split()
-                        subtrees.append(y)
-                        break
-                    else:
-                        y = y.right_child
-
-                if parent.parent is not None:
-                    z = subtree.left_child
-                    while z is not None:
-                        if z.key < parent.parent.key:
-                            z.split()
-                            subtrees.append(z)
-                            break
-                        else:
-                            z = z.right_child
-
-                parent.make_left_child(subtree)
-
-            # Rebalance, BUT each time a section of the subtree is moved, check that subtree for imbalances
-            if subtree.priority > parent.priority:
-                self.rebalance_heap_rebalance_transplants(subtree)
-
-    def left_rotate_rebalance_transplants(self, node: TreapNode) -> None:
-        """
-        Helper for re-balancing for meld. Performs a left rotation around node.
-        Checks each transplanted section of tree for imbalances.
+    def difference(self, other: Treap[KT, VT]) -> None:
         """
-        # Get relational nodes
-        child = node.right_child
-        grandparent = node.parent
-        if grandparent is not None:
-            node_child_type = 'L' if node.is_left_child() else 'R'
+        Removes keys contained in Treap 'other' from this treap.
 
-        node.right_child = child.left_child
-        node.correct_children()
-        child.left_child = node
-        node.parent = child
+        Runs in O(m log(n/m)) by splitting this Treap around the root key of `other`
+        and recursing on both halves with the children of that root, see karma.md.
+        `other` is only read, and is left unchanged.
+        """
+        if other is self:
+            self.set_root(None)
+            return
+        self.set_root(difference_nodes(self.root, other.root))
 
-        if grandparent is not None:
-            if node_child_type == 'L':
-                grandparent.left_child = child
-            elif node_child_type == 'R':
-                grandparent.right_child = child
-            child.parent = grandparent
+    def intersection(
+        self, other: Treap[KT, VT], on_conflict: typing.Union[str, typing.Callable[[VT, VT], VT]] = 'left'
+    ) -> None:
+        """
+        Removes keys not contained in Treap 'other' from this treap, in O(m log(n/m)).
+        Each remaining key gets its value from `on_conflict`, as in `meld`. By default this Treap's value is kept.
+        The nodes of `other` are dropped, leaving it empty.
+        The intersection of a Treap with itself leaves its keys unchanged, with each value resolved against itself.
+        """
+        if other is self:  # As in `meld`, the nodes must not be split apart while they are read
+            other = self.copy()
+        self.set_root(intersection_nodes(self.root, other.root, conflict_resolver(on_conflict)))
+        other.set_root(None)
 
-        elif grandparent is None:  # The child was rotated to the root
-            self.root = child
-            child.parent = None
+    def symmetric_difference(self, other: Treap[KT, VT]) -> None:
+        """
+        Keeps the keys contained in exactly one of this Treap and Treap 'other', in O(m log(n/m)).
+        The nodes of `other` are moved into this Treap, leaving it empty.
+        """
+        if other is self:
+            self.set_root(None)
+            return
+        self.set_root(symmetric_difference_nodes(self.root, other.root))
+        other.set_root(None)
 
-        # node.right_child may have a priority imbalance
-        if node.right_child is not None:
-            if node.right_child.priority > node.priority:
-                self.rebalance_heap_rebalance_transplants(node.right_child)
+    def copy(self) -> TreapMap[KT, VT]:
+        """
+        Returns a copy of this Treap with the same shape and priorities, in O(n).
+        Keys and values are shared, not copied.
+        """
+        nodes = (self.new_node(node.key, node.value, priority=node.priority) for node in self.iter_nodes())
+        return self.empty_like(cartesian_tree(nodes))
 
-    def right_rotate_rebalance_transplants(self, node: TreapNode) -> None:
+    def dump(self, fp: typing.BinaryIO) -> None:
         """
-        Helper for re-balancing for meld. Performs a right rotation around node.
-        Checks each transplanted section of tree for imbalances.
+        Writes the keys, values and priorities to the binary file fp in one pass, in the compact format
+        of py_treaps.serialization. Keys and values are written with marshal when possible, pickle otherwise.
         """
-        # Get relational nodes
-        child = node.left_child
-        grandparent = node.parent
-        if grandparent is not None:
-            node_child_type = 'L' if node.is_left_child() else 'R'
+        write_entries(fp, self.num_nodes, ((node.key, node.value, node.priority) for node in self.iter_nodes()))
 
-        node.left_child = child.right_child
-        node.correct_children()
-        child.right_child = node
-        node.parent = child
+    @classmethod
+    def load(cls, fp: typing.BinaryIO, priority_source: PrioritySource = None, **kwargs) -> TreapMap[KT, VT]:
+        """
+        Reads a Treap written by `dump` from the binary file fp.
+        The nodes keep their priorities and are linked as a Cartesian tree, which rebuilds the exact shape
+        of the dumped Treap in O(n), without searches or rotations. The garbage collector is paused meanwhile.
+        Any other keyword arguments are passed on to the constructor, as in `from_sorted`.
+        """
+        treap = cls(priority_source=priority_source, **kwargs)
+        new_node = treap.new_node
+        nodes = (new_node(key, value, priority=priority) for key, value, priority in read_entries(fp))
+        with gc_paused():
+            treap.set_root(cartesian_tree(nodes))
+        return treap
 
-        if grandparent is not None:
-            if node_child_type == 'L':
-                grandparent.left_child = child
-            elif node_child_type == 'R':
-                grandparent.right_child = child
-            child.parent = grandparent
+    # The operators leave both operands untouched and return a new Treap
 
-        elif grandparent is None:
-            self.root = child
-            child.parent = None
+    def __or__(self, other: TreapMap[KT, VT]) -> TreapMap[KT, VT]:
+        result = self.copy()
+        result.meld(other.copy())
+        return result
+
+    def __and__(self, other: TreapMap[KT, VT]) -> TreapMap[KT, VT]:
+        result = self.copy()
+        result.intersection(other.copy())
+        return result
+
+    def __sub__(self, other: TreapMap[KT, VT]) -> TreapMap[KT, VT]:
+        result = self.copy()
+        result.difference(other)  # `other` is only read
+        return result
+
+    def __xor__(self, other: TreapMap[KT, VT]) -> TreapMap[KT, VT]:
+        result = self.copy()
+        result.symmetric_difference(other.copy())
+        return result
+
+    def select(self, k: int) -> KT:
+        """
+        Returns the k-th smallest key (counting from 0) in O(log n), using the subtreap sizes.
+        """
+        if not 0 <= k < self.num_nodes:
+            raise IndexError("TreapMap index out of range")
+        x = self.root
+        while True:
+            left_size = x.left_child.size if x.left_child is not None else 0
+            if k < left_size:
+                x = x.left_child
+            elif k > left_size:
+                k -= left_size + 1
+                x = x.right_child
+            else:
+                return x.key
 
-        # node.left_child may have a priority imbalance
-        if node.left_child is not None:
-            if node.left_child.priority > node.priority:
-                self.rebalance_heap_rebalance_transplants(node.left_child)
+    def rank(self, key: KT, inclusive: bool = False) -> int:
+        """
+        Returns the number of keys less than `key` (or equal to, if inclusive) in O(log n), using the subtreap sizes.
+        `key` does not have to be in the Treap.
+        """
+        rank = 0
+        x = self.root
+        while x is not None:
+            if key > x.key or (inclusive and key == x.key):
+                rank += 1 + (x.left_child.size if x.left_child is not None else 0)
+                x = x.right_child
+            else:
+                x = x.left_child
+        return rank
 
-    def rebalance_heap_rebalance_transplants(self, child: TreapNode) -> None:
+    def floor_node(self, key: KT, inclusive: bool = True) -> Optional[TreapNode]:
         """
-        Rebalance function for the meld method. Works same as `rebalance_heap` except checks transplanted sections of
-        the new subtree for imbalances.
+        Returns the node with the largest key less than or equal to `key` (less than, if not inclusive),
+        or None if there is no such node. Descends once with a single comparison per level, in O(log n).
         """
-        grandparent = child.parent.parent
-        if child.is_left_child():
-            self.right_rotate_rebalance_transplants(child.parent)
-        elif child.is_right_child():
-            self.left_rotate_rebalance_transplants(child.parent)
+        x = self.root
+        candidate = None
+        if inclusive:
+            while x is not None:
+                if key < x.key:
+                    x = x.left_child
+                else:
+                    candidate = x
+                    x = x.right_child
+        else:
+            while x is not None:
+                if x.key < key:
+                    candidate = x
+                    x = x.right_child
+                else:
+                    x = x.left_child
+        return candidate
 
-        # Check for new imbalances (first child had too large priority, check if this is still the case
-        # btw child & it's new parent
-        if grandparent is not None:
-            if child.priority > grandparent.priority:
-                self.rebalance_heap_rebalance_transplants(child)
+    def ceiling_node(self, key: KT, inclusive: bool = True) -> Optional[TreapNode]:
+        """
+        Returns the node with the smallest key greater than or equal to `key` (greater than, if not inclusive),
+        or None if there is no such node. The mirror image of `floor_node`.
+        """
+        x = self.root
+        candidate = None
+        if inclusive:
+            while x is not None:
+                if x.key < key:
+                    x = x.right_child
+                else:
+                    candidate = x
+                    x = x.left_child
+        else:
+            while x is not None:
+                if key < x.key:
+                    candidate = x
+                    x = x.left_child
+                else:
+                    x = x.right_child
+        return candidate
 
-    def difference(self, other: Treap[KT, VT]) -> None:
+    def floor(self, key: KT) -> Optional[KT]:
         """
-        Removes keys contained in Treap 'other' from this treap
+        Returns the largest key less than or equal to `key`, or None.
         """
-        # Just parse through the other treap, removing each key
-        # Should run in O(m log(n/m)) time.
+        node = self.floor_node(key)
+        return node.key if node is not None else None
 
-        # Parse through other, remove() each key
-        # This runs in O(m log(n)) time:
-        # Optimize somehow
-        for key in other:
-            self.remove(key)
+    def lower(self, key: KT) -> Optional[KT]:
+        """
+        Returns the largest key strictly less than `key`, or None.
+        """
+        node = self.floor_node(key, inclusive=False)
+        return node.key if node is not None else None
+
+    def ceiling(self, key: KT) -> Optional[KT]:
+        """
+        Returns the smallest key greater than or equal to `key`, or None.
+        """
+        node = self.ceiling_node(key)
+        return node.key if node is not None else None
+
+    def higher(self, key: KT) -> Optional[KT]:
+        """
+        Returns the smallest key strictly greater than `key`, or None.
+        """
+        node = self.ceiling_node(key, inclusive=False)
+        return node.key if node is not None else None
+
+    def min_item(self) -> Optional[typing.Tuple[KT, VT]]:
+        """
+        Returns the (key, value) pair with the smallest key, or None if the Treap is empty, in O(1).
+        The smallest and largest nodes are cached, and kept up to date by every operation changing the keys.
+        """
+        node = self.min_node
+        return (node.key, node.value) if node is not None else None
+
+    def max_item(self) -> Optional[typing.Tuple[KT, VT]]:
+        """
+        Returns the (key, value) pair with the largest key, or None if the Treap is empty, in O(1).
+        """
+        node = self.max_node
+        return (node.key, node.value) if node is not None else None
+
+    def pop_min(self) -> typing.Tuple[KT, VT]:
+        """
+        Removes and returns the (key, value) pair with the smallest key, in O(log n).
+        Raises a KeyError if the Treap is empty.
+        """
+        if self.min_node is None:
+            raise KeyError("pop_min from an empty TreapMap")
+        key = self.min_node.key
+        return key, self.remove(key)
+
+    def pop_max(self) -> typing.Tuple[KT, VT]:
+        """
+        Removes and returns the (key, value) pair with the largest key, in O(log n).
+        Raises a KeyError if the Treap is empty.
+        """
+        if self.max_node is None:
+            raise KeyError("pop_max from an empty TreapMap")
+        key = self.max_node.key
+        return key, self.remove(key)
+
+    def __getitem__(self, index: typing.Union[int, slice]) -> typing.Union[KT, List[KT]]:
+        """
+        Returns the key at a position in sorted order, or a list of keys for a slice of positions.
+        Negative positions count from the largest key, as for lists.
+        """
+        if isinstance(index, slice):
+            return [self.select(i) for i in range(*index.indices(self.num_nodes))]
+        if index < 0:
+            index += self.num_nodes
+        return self.select(index)
+
+    def __delitem__(self, index: typing.Union[int, slice]) -> None:
+        """
+        Removes the key at a position in sorted order, or every key in a slice of positions.
+        Contiguous slices are cut out with two rank splits and a merge, in O(log n).
+        """
+        if not isinstance(index, slice):
+            if index < 0:
+                index += self.num_nodes
+            self.remove(self.select(index))
+            return
+
+        start, stop, step = index.indices(self.num_nodes)
+        if step != 1:
+            for key in [self.select(i) for i in range(start, stop, step)]:
+                self.remove(key)
+            return
+        if start >= stop:
+            return
+        left, rest = split_nodes_at_rank(self.root, start)
+        _, right = split_nodes_at_rank(rest, stop - start)
+        self.set_root(merge_nodes(left, right))
+
+    def range(
+        self, lo: KT = None, hi: KT = None, inclusive: typing.Tuple[bool, bool] = (True, False), reverse: bool = False
+    ) -> typing.Iterator[KT]:
+        """
+        Returns an iterator over the keys between lo and hi, in sorted order or reversed.
+        `inclusive` says whether lo and hi themselves are included, by default the range is [lo, hi).
+        A bound of None leaves that side of the range open.
+
+        Descends directly to the first key in range, so iterating k keys costs O(log n + k).
+        """
+        lo_inclusive, hi_inclusive = inclusive
+
+        def above_lo(key: KT) -> bool:
+            return lo is None or key > lo or (lo_inclusive and key == lo)
+
+        def below_hi(key: KT) -> bool:
+            return hi is None or key < hi or (hi_inclusive and key == hi)
+
+        # Walk towards the start bound, keeping the in range nodes whose near subtree is still to be visited
+        in_range, beyond = (above_lo, below_hi) if not reverse else (below_hi, above_lo)
+        near, far = ('left_child', 'right_child') if not reverse else ('right_child', 'left_child')
+        stack = []
+        x = self.root
+        while x is not None:
+            if in_range(x.key):
+                stack.append(x)
+                x = getattr(x, near)
+            else:
+                x = getattr(x, far)
+
+        while stack:
+            x = stack.pop()
+            if not beyond(x.key):
+                return
+            yield x.key
+            x = getattr(x, far)
+            while x is not None:
+                stack.append(x)
+                x = getattr(x, near)
+
+    def count_range(self, lo: KT = None, hi: KT = None, inclusive: typing.Tuple[bool, bool] = (True, False)) -> int:
+        """
+        Returns the number of keys between lo and hi in O(log n), with the bounds treated as in `range`.
+        """
+        lo_inclusive, hi_inclusive = inclusive
+        below_hi = self.num_nodes if hi is None else self.rank(hi, hi_inclusive)
+        below_lo = 0 if lo is None else self.rank(lo, not lo_inclusive)
+        return max(below_hi - below_lo, 0)
+
+    def delete_range(self, lo: KT = None, hi: KT = None, inclusive: typing.Tuple[bool, bool] = (True, False)) -> int:
+        """
+        Removes every key between lo and hi, with the bounds treated as in `range`.
+        The range is cut out with two splits and a merge, so this runs in O(log n) however many keys are removed.
+        Returns the number of keys removed.
+        """
+        lo_inclusive, hi_inclusive = inclusive
+        left, rest = (None, self.root) if lo is None else split_nodes(self.root, lo, not lo_inclusive)
+        middle, right = (rest, None) if hi is None else split_nodes(rest, hi, hi_inclusive)
+        self.set_root(merge_nodes(left, right))
+        return middle.size if middle is not None else 0
 
     def balance_factor(self) -> float:
         """
@@ -469,19 +886,68 @@ class TreapMap(Treap[KT, VT]):
 
         return '\n'.join(lines)
 
+    def first_node(self) -> Optional[TreapNode]:
+        """
+        Returns the node with the smallest key, or None if the Treap is empty.
+        """
+        x = self.root
+        if x is not None:
+            while x.left_child is not None:
+                x = x.left_child
+        return x
+
+    def last_node(self) -> Optional[TreapNode]:
+        """
+        Returns the node with the largest key, or None if the Treap is empty.
+        """
+        x = self.root
+        if x is not None:
+            while x.right_child is not None:
+                x = x.right_child
+        return x
+
+    def iter_nodes(self, reverse: bool = False) -> typing.Iterator[TreapNode]:
+        """
+        Returns an iterator over the nodes in sorted order of their keys, or reversed.
+        Steps from node to node with the parent pointers, so it needs O(1) extra memory and no recursion.
+        """
+        if not reverse:
+            x = self.first_node()
+            while x is not None:
+                yield x
+                x = x.successor()
+        else:
+            x = self.last_node()
+            while x is not None:
+                yield x
+                x = x.predecessor()
+
+    def keys(self) -> TreapKeysView:
+        return TreapKeysView(self)
+
+    def values(self) -> TreapValuesView:
+        return TreapValuesView(self)
+
+    def items(self) -> TreapItemsView:
+        return TreapItemsView(self)
+
+    def __contains__(self, key: KT) -> bool:
+        return self.find_node(key) is not None
+
     def __iter__(self) -> typing.Iterator[KT]:
         """
         Returns an iterator object of the trees keys.
         Uses in-order traversal, ie keys are from low to high.
         """
-        def helper(node):
-            if node is None:
-                return
-            yield from helper(node.left_child)
+        for node in self.iter_nodes():
             yield node.key
-            yield from helper(node.right_child)
 
-        yield from helper(self.root)
+    def __reversed__(self) -> typing.Iterator[KT]:
+        """
+        Returns an iterator object of the trees keys, from high to low.
+        """
+        for node in self.iter_nodes(reverse=True):
+            yield node.key
 
     def __len__(self) -> int:
-        return len(list(iter(self)))
\ No newline at end of file
+        return self.num_nodes
\ No newline at end of file
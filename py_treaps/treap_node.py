@@ -1,19 +1,20 @@
 from __future__ import annotations
-import random
 import typing
 from collections.abc import Iterator
 from typing import List, Optional, cast, Set
 
 from py_treaps.comparable import KT, VT
+from py_treaps.priority import DEFAULT_PRIORITY_SOURCE, MAX_PRIORITY
 
 
 class TreapNode:
 
-    unused_priorities: Optional[List[int]] = None
+    # Nodes store their attributes in slots instead of a per instance __dict__, see karma.md for the savings.
+    __slots__ = ('key', 'value', 'priority', 'parent', 'left_child', 'right_child', 'size')
 
     # The maximum priority that a node can have.
     # Access this with TreapNode.MAX_PRIORITY
-    MAX_PRIORITY = 65535
+    MAX_PRIORITY = MAX_PRIORITY
 
     """A key-value node for the TreapMap.
 
@@ -29,37 +30,55 @@ class TreapNode:
         parent (TreapNode): The parent of the node.
         left_child (TreapNode): The left child of the node.
         right_child (TreapNode): The right child of the node.
+
+    Added attributes:
+        size (int): The number of nodes in the subtreap rooted at this node.
     """
 
     def __init__(
-        self, key: KT, value: VT, parent: Optional[TreapNode] = None
+        self, key: KT, value: VT, parent: Optional[TreapNode] = None, priority: Optional[int] = None
     ):
         self.key: KT = key
         self.value: VT = value
-        self.priority: int = self.get_priority()
+        self.priority: int = self.get_priority() if priority is None else priority
 
         self.parent: Optional[TreapNode] = parent
         self.left_child: Optional[TreapNode] = None
         self.right_child: Optional[TreapNode] = None
+        self.size: int = 1
 
     def get_priority(self):
         """Generate a new priority for a treap node.
-    
-        Please do not touch this function, and use it on the creation of a standard treap node.
-        You do not need to worry about running out of priorities.
+
+        Used when a node is created without an explicit priority. Priorities are
+        drawn from the shared default priority source, so they never run out.
 
         Returns:
-            An unused integer priority.
+            An integer priority less than MAX_PRIORITY.
         """
-
-        if TreapNode.unused_priorities is None:
-            TreapNode.unused_priorities = list(range(0, TreapNode.MAX_PRIORITY))
-            random.shuffle(TreapNode.unused_priorities)
-        return TreapNode.unused_priorities.pop()
+        return DEFAULT_PRIORITY_SOURCE(self.key)
 
     def set_priority_to_max(self):
         self.priority = TreapNode.MAX_PRIORITY
 
+    def update(self) -> None:
+        """
+        Recomputes the size of this node's subtreap from the sizes of its children.
+        """
+        size = 1
+        if self.left_child is not None:
+            size += self.left_child.size
+        if self.right_child is not None:
+            size += self.right_child.size
+        self.size = size
+
+    def push(self) -> None:
+        """
+        Pushes pending lazy updates of this node down to its children.
+        Plain nodes have none, subclasses carrying lazy updates override this.
+        The node-level split, merge and set operation functions push each node before looking at its children.
+        """
+
     def is_leaf(self):
         return (self.left_child is None) and (self.right_child is None)
 
@@ -89,6 +108,36 @@ class TreapNode:
     def has_children(self):
         return self.has_left_child() or self.has_right_child()
 
+    def successor(self) -> Optional[TreapNode]:
+        """
+        Returns the node with the next larger key, found through the child and parent pointers
+        without any extra memory. Returns None for the node with the largest key.
+        """
+        if self.right_child is not None:
+            x = self.right_child
+            while x.left_child is not None:
+                x = x.left_child
+            return x
+        x = self
+        while x.parent is not None and x.parent.right_child is x:
+            x = x.parent
+        return x.parent
+
+    def predecessor(self) -> Optional[TreapNode]:
+        """
+        Returns the node with the next smaller key, the mirror image of `successor`.
+        Returns None for the node with the smallest key.
+        """
+        if self.left_child is not None:
+            x = self.left_child
+            while x.right_child is not None:
+                x = x.right_child
+            return x
+        x = self
+        while x.parent is not None and x.parent.left_child is x:
+            x = x.parent
+        return x.parent
+
     def make_right_child(self, node: TreapNode) -> None:
         self.right_child = node
         node.parent = self
@@ -119,3 +168,280 @@ class TreapNode:
             self.parent.right_child = None
 
         self.parent = None
+
+
+def cartesian_tree(nodes: typing.Iterable[TreapNode]) -> Optional[TreapNode]:
+    """
+    Links nodes given in increasing key order into a treap, in O(n).
+    Builds the Cartesian tree of the priorities with a stack holding the right spine,
+    so no searches or rotations are performed. Any existing links of the nodes are overwritten.
+    Returns the root, with no parent.
+    """
+    spine: List[TreapNode] = []  # Right spine of the tree built so far, root at the bottom
+    for node in nodes:
+        node.left_child = node.right_child = node.parent = None
+
+        # Every spine node with a lower priority than the new node becomes its left subtree
+        last = None
+        while spine and spine[-1].priority < node.priority:
+            last = spine.pop()
+            last.update()  # The subtreap of a node leaving the spine is final
+        if last is not None:
+            node.make_left_child(last)
+        if spine:
+            spine[-1].make_right_child(node)
+        spine.append(node)
+
+    for node in reversed(spine):
+        node.update()
+    if not spine:
+        return None
+    spine[0].parent = None
+    return spine[0]
+
+
+def merge_nodes(left: Optional[TreapNode], right: Optional[TreapNode]) -> Optional[TreapNode]:
+    """
+    Merges two subtreaps, where every key in `left` precedes every key in `right`, in O(log n).
+    The higher priority root stays on top and the inner spines are merged below it.
+    Returns the root of the merged subtreap, with no parent.
+    """
+    # Either side may be a child of a node the caller is dropping, so it is detached before being returned
+    if left is None:
+        if right is not None:
+            right.parent = None
+        return right
+    if right is None:
+        left.parent = None
+        return left
+    if left.priority > right.priority:
+        left.push()
+        child = merge_nodes(left.right_child, right)
+        left.right_child = child
+        child.parent = left
+        left.update()
+        left.parent = None
+        return left
+    right.push()
+    child = merge_nodes(left, right.left_child)
+    right.left_child = child
+    child.parent = right
+    right.update()
+    right.parent = None
+    return right
+
+
+def split_nodes_at_rank(node: Optional[TreapNode], k: int) -> typing.Tuple[Optional[TreapNode], Optional[TreapNode]]:
+    """
+    Splits a subtreap into its first `k` nodes and the remaining nodes in O(log n), using the subtreap sizes.
+    Returns the roots of the two subtreaps, with no parents.
+    """
+    if node is None:
+        return None, None
+    node.push()
+    left_size = node.left_child.size if node.left_child is not None else 0
+    if k <= left_size:
+        left, right = split_nodes_at_rank(node.left_child, k)
+        node.left_child = right
+        if right is not None:
+            right.parent = node
+        node.update()
+        node.parent = None
+        return left, node
+    left, right = split_nodes_at_rank(node.right_child, k - left_size - 1)
+    node.right_child = left
+    if left is not None:
+        left.parent = node
+    node.update()
+    node.parent = None
+    return node, right
+
+
+def split_nodes(
+    node: Optional[TreapNode], key: KT, inclusive: bool = False
+) -> typing.Tuple[Optional[TreapNode], Optional[TreapNode]]:
+    """
+    Splits a subtreap into the nodes with keys less than `key` and the nodes with keys greater than or equal
+    to `key` in O(log n). If inclusive, a node with key `key` goes to the left subtreap instead.
+    Returns the roots of the two subtreaps, with no parents.
+    """
+    if node is None:
+        return None, None
+    node.push()
+    if key < node.key or (not inclusive and key == node.key):
+        left, right = split_nodes(node.left_child, key, inclusive)
+        node.left_child = right
+        if right is not None:
+            right.parent = node
+        node.update()
+        node.parent = None
+        return left, node
+    left, right = split_nodes(node.right_child, key, inclusive)
+    node.right_child = left
+    if left is not None:
+        left.parent = node
+    node.update()
+    node.parent = None
+    return node, right
+
+
+def split_out_node(
+    node: Optional[TreapNode], key: KT
+) -> typing.Tuple[Optional[TreapNode], Optional[TreapNode], Optional[TreapNode]]:
+    """
+    Splits a subtreap into the nodes with keys less than `key`, the node with key `key` (if there is one),
+    and the nodes with keys greater than `key`, in O(log n).
+    Returns the three roots, with no parents. The middle node is returned without children.
+    """
+    if node is None:
+        return None, None, None
+    node.push()
+    if key < node.key:
+        left, middle, right = split_out_node(node.left_child, key)
+        node.left_child = right
+        if right is not None:
+            right.parent = node
+        node.update()
+        node.parent = None
+        return left, middle, node
+    if node.key < key:
+        left, middle, right = split_out_node(node.right_child, key)
+        node.right_child = left
+        if left is not None:
+            left.parent = node
+        node.update()
+        node.parent = None
+        return node, middle, right
+
+    left, right = node.left_child, node.right_child
+    if left is not None:
+        left.parent = None
+    if right is not None:
+        right.parent = None
+    node.left_child = node.right_child = node.parent = None
+    node.update()
+    return left, node, right
+
+
+def union_nodes(
+    first: Optional[TreapNode], second: Optional[TreapNode], resolve: typing.Callable[[VT, VT], VT],
+    swapped: bool = False
+) -> Optional[TreapNode]:
+    """
+    Unions two subtreaps with no assumed key relationship, in expected O(m log(n/m + 1)) for sizes m <= n.
+
+    The higher priority root stays on top, the other subtreap is split around its key, and the two halves
+    are unioned with its children. When both subtreaps hold a key, one node is kept with value
+    resolve(value in first, value in second). `swapped` tracks whether first and second have traded places.
+    Returns the root of the union, with no parent.
+    """
+    if first is None:
+        return second
+    if second is None:
+        return first
+    if first.priority < second.priority:
+        return union_nodes(second, first, resolve, not swapped)
+    first.push()
+
+    lesser, duplicate, greater = split_out_node(second, first.key)
+    if duplicate is not None:
+        if swapped:
+            first.value = resolve(duplicate.value, first.value)
+        else:
+            first.value = resolve(first.value, duplicate.value)
+
+    left = union_nodes(first.left_child, lesser, resolve, swapped)
+    right = union_nodes(first.right_child, greater, resolve, swapped)
+    first.left_child = left
+    if left is not None:
+        left.parent = first
+    first.right_child = right
+    if right is not None:
+        right.parent = first
+    first.update()
+    first.parent = None
+    return first
+
+
+def difference_nodes(first: Optional[TreapNode], second: Optional[TreapNode]) -> Optional[TreapNode]:
+    """
+    Removes the keys of one subtreap from another, in expected O(m log(n/m + 1)) for sizes m <= n.
+
+    `first` is split around the key of `second`'s root, dropping a node with that key, and the halves have
+    the keys of `second`'s children removed before being merged back together. `second` is only read.
+    Returns the root of what is left of `first`, with no parent.
+    """
+    if first is None or second is None:
+        return first
+    lesser, _, greater = split_out_node(first, second.key)
+    left = difference_nodes(lesser, second.left_child)
+    right = difference_nodes(greater, second.right_child)
+    return merge_nodes(left, right)
+
+
+def intersection_nodes(
+    first: Optional[TreapNode], second: Optional[TreapNode], resolve: typing.Callable[[VT, VT], VT],
+    swapped: bool = False
+) -> Optional[TreapNode]:
+    """
+    Keeps the keys held by both subtreaps, in expected O(m log(n/m + 1)) for sizes m <= n.
+    Recurses like `union_nodes`, dropping the root when the other subtreap does not hold its key.
+    Each kept key has value resolve(value in first, value in second).
+    Returns the root of the intersection, with no parent.
+    """
+    if first is None or second is None:
+        return None
+    if first.priority < second.priority:
+        return intersection_nodes(second, first, resolve, not swapped)
+    first.push()
+
+    lesser, duplicate, greater = split_out_node(second, first.key)
+    left = intersection_nodes(first.left_child, lesser, resolve, swapped)
+    right = intersection_nodes(first.right_child, greater, resolve, swapped)
+    if duplicate is None:
+        return merge_nodes(left, right)
+
+    if swapped:
+        first.value = resolve(duplicate.value, first.value)
+    else:
+        first.value = resolve(first.value, duplicate.value)
+    first.left_child = left
+    if left is not None:
+        left.parent = first
+    first.right_child = right
+    if right is not None:
+        right.parent = first
+    first.update()
+    first.parent = None
+    return first
+
+
+def symmetric_difference_nodes(first: Optional[TreapNode], second: Optional[TreapNode]) -> Optional[TreapNode]:
+    """
+    Keeps the keys held by exactly one of the subtreaps, in expected O(m log(n/m + 1)) for sizes m <= n.
+    Recurses like `union_nodes`, dropping the root when the other subtreap also holds its key.
+    Returns the root of the symmetric difference, with no parent.
+    """
+    if first is None:
+        return second
+    if second is None:
+        return first
+    if first.priority < second.priority:
+        first, second = second, first
+    first.push()
+
+    lesser, duplicate, greater = split_out_node(second, first.key)
+    left = symmetric_difference_nodes(first.left_child, lesser)
+    right = symmetric_difference_nodes(first.right_child, greater)
+    if duplicate is not None:
+        return merge_nodes(left, right)
+
+    first.left_child = left
+    if left is not None:
+        left.parent = first
+    first.right_child = right
+    if right is not None:
+        right.parent = first
+    first.update()
+    first.parent = None
+    return first
@@ -0,0 +1,82 @@
+"""
+This module contains the keys, values and items views of a TreapMap.
+
+The views hold no state of their own beyond the treap they look at, so they
+always reflect its current contents and never materialize a list.
+"""
+
+from __future__ import annotations
+import typing
+from typing import Any, Tuple
+
+from py_treaps.comparable import KT, VT
+
+if typing.TYPE_CHECKING:
+    from py_treaps.treap_map import TreapMap
+
+
+class TreapView:
+    """
+    Base class for the views, sized by the treap they look at.
+    """
+
+    def __init__(self, treap: TreapMap[KT, VT]):
+        self.treap = treap
+
+    def __len__(self) -> int:
+        return len(self.treap)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)})"
+
+
+class TreapKeysView(TreapView):
+    """
+    The keys of a TreapMap, in sorted order.
+    """
+
+    def __iter__(self) -> typing.Iterator[KT]:
+        for node in self.treap.iter_nodes():
+            yield node.key
+
+    def __reversed__(self) -> typing.Iterator[KT]:
+        for node in self.treap.iter_nodes(reverse=True):
+            yield node.key
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.treap
+
+
+class TreapValuesView(TreapView):
+    """
+    The values of a TreapMap, in the sorted order of their keys.
+    """
+
+    def __iter__(self) -> typing.Iterator[VT]:
+        for node in self.treap.iter_nodes():
+            yield node.value
+
+    def __reversed__(self) -> typing.Iterator[VT]:
+        for node in self.treap.iter_nodes(reverse=True):
+            yield node.value
+
+    def __contains__(self, value: Any) -> bool:
+        return any(v == value for v in self)
+
+
+class TreapItemsView(TreapView):
+    """
+    The (key, value) pairs of a TreapMap, in sorted order of the keys.
+    """
+
+    def __iter__(self) -> typing.Iterator[Tuple[KT, VT]]:
+        for node in self.treap.iter_nodes():
+            yield node.key, node.value
+
+    def __reversed__(self) -> typing.Iterator[Tuple[KT, VT]]:
+        for node in self.treap.iter_nodes(reverse=True):
+            yield node.key, node.value
+
+    def __contains__(self, item: Any) -> bool:
+        key, value = item
+        return key in self.treap and self.treap.lookup(key) == value
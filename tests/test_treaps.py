@@ -1,7 +1,26 @@
 from py_treaps.treap_map import TreapMap
+from py_treaps.treap_node import TreapNode
+from py_treaps.persistent_treap_map import PersistentTreapMap
+from py_treaps.concurrent_treap_map import ConcurrentTreapMap, RWLock
+from py_treaps.implicit_treap import ImplicitTreap
+from py_treaps.augmented_treap_map import AugmentedTreapMap, Monoid, SUM, MIN, MAX, COUNT
+from py_treaps.lazy_treap_map import LazyTreapMap, Action, ADD, ASSIGN
+from py_treaps.adaptive_treap_map import AdaptiveTreapMap
+from py_treaps import serialization
+from py_treaps.disk_treap_map import DiskTreapMap
+from py_treaps import durable_treap_map
+from py_treaps.durable_treap_map import DurableTreapMap
+from py_treaps.indexed_treap_map import IndexedTreapMap
+from py_treaps.instrumented_treap_map import InstrumentedTreapMap, Instruments
+from py_treaps.priority import HashPriority, RandomPriority, MAX_PRIORITY
 from py_treaps.stack import Stack
 
+import io
+import os
 import pytest
+import random
+import threading
+import time
 from typing import Any
 
 
@@ -312,3 +331,1464 @@ def test_difference():
 
     for i in range(0, 51):
         assert i in t, "`Difference` did not function properly"
+
+
+def test_from_sorted() -> None:
+    """
+    Test the linear time bulk constructor on sorted input.
+    """
+    for _ in range(20):  # Run this test a bunch to account for randomness
+        t = TreapMap.from_sorted((i, str(i)) for i in range(200))
+
+        assert t.get_num_elements() == 200
+        assert t.get_root_node().parent is None
+        assert is_heap(t), "TreapMap does not obey heap property."
+        assert is_bst(t), "TreapMap did not obey BST property."
+        assert list(t) == list(range(200))
+        for i in range(200):
+            assert t.lookup(i) == str(i)
+
+    assert TreapMap.from_sorted([]).get_root_node() is None
+    with pytest.raises(ValueError):
+        TreapMap.from_sorted([(1, 1), (1, 2)])
+    with pytest.raises(ValueError):
+        TreapMap.from_sorted([(2, 2), (1, 1)])
+
+
+def test_from_items() -> None:
+    """
+    Test the bulk constructor on unsorted input with duplicated keys.
+    """
+    items = [(5, 'a'), (3, 'b'), (9, 'c'), (3, 'd'), (1, 'e')]
+    t = TreapMap.from_items(items)
+
+    assert list(t) == [1, 3, 5, 9]
+    assert t.lookup(3) == 'd'
+    assert t.get_num_elements() == 4
+    assert is_heap(t) and is_bst(t)
+
+    # Inserting into a bulk built treap still works
+    t.insert(4, 'f')
+    assert t.lookup(4) == 'f'
+    assert is_heap(t) and is_bst(t)
+
+
+def shape(node: TreapNode):
+    """
+    Returns a nested tuple describing the shape of the subtreap rooted at node.
+    """
+    if node is None:
+        return None
+    return node.key, shape(node.left_child), shape(node.right_child)
+
+
+def test_many_priorities() -> None:
+    """
+    Test that a treap larger than the old pool of 65535 priorities can be built.
+    """
+    t = TreapMap()
+    for i in range(70_000):
+        t.insert(i, i)
+    assert t.lookup(69_999) == 69_999
+    assert 0 <= t.get_root_node().priority < MAX_PRIORITY
+
+
+def test_seeded_priorities() -> None:
+    """
+    Test that seeded priority sources build the same treap shape every time.
+    """
+    shapes = set()
+    for _ in range(5):
+        t = TreapMap(priority_source=RandomPriority(seed=7))
+        for i in range(50):
+            t.insert(i, i)
+        shapes.add(shape(t.get_root_node()))
+    assert len(shapes) == 1
+
+
+def test_hash_priorities() -> None:
+    """
+    Test that hashed priorities make the shape independent of the insertion order.
+    """
+    forwards = TreapMap(priority_source=HashPriority())
+    backwards = TreapMap(priority_source=HashPriority())
+    for i in range(50):
+        forwards.insert(i, i)
+        backwards.insert(49 - i, i)
+    bulk = TreapMap.from_sorted(((i, i) for i in range(50)), priority_source=HashPriority())
+
+    assert shape(forwards.get_root_node()) == shape(backwards.get_root_node())
+    assert shape(forwards.get_root_node()) == shape(bulk.get_root_node())
+    assert is_heap(forwards) and is_bst(forwards)
+
+
+def test_node_slots() -> None:
+    """
+    Test that nodes do not carry a per instance __dict__.
+    """
+    node = TreapNode(1, 'one')
+    assert not hasattr(node, '__dict__')
+    with pytest.raises(AttributeError):
+        node.colour = 'red'
+
+
+def sizes_correct(node: TreapNode) -> bool:
+    """
+    Returns true if every node in the subtreap rooted at node stores its subtreap size.
+    """
+    if node is None:
+        return True
+    left = node.left_child.size if node.left_child is not None else 0
+    right = node.right_child.size if node.right_child is not None else 0
+    return node.size == 1 + left + right and sizes_correct(node.left_child) and sizes_correct(node.right_child)
+
+
+def test_len_tracking() -> None:
+    """
+    Test that the size of the treap is maintained through inserts, overwrites and removals.
+    """
+    t = TreapMap()
+    assert len(t) == 0
+    for i in range(30):
+        t.insert(i, i)
+    for i in range(10):
+        t.insert(i, -i)  # Overwrites do not add nodes
+    assert len(t) == t.get_num_elements() == 30
+    assert sizes_correct(t.get_root_node())
+
+    for i in range(0, 30, 3):
+        t.remove(i)
+    t.remove(100)
+    assert len(t) == 20
+    assert sizes_correct(t.get_root_node())
+
+    for i in list(t):
+        t.remove(i)
+    assert len(t) == 0
+    assert t.get_root_node() is None
+
+
+def test_len_split_join_meld() -> None:
+    """
+    Test that sizes are maintained through split, join, meld and difference.
+    """
+    t = TreapMap()
+    for i in range(40):
+        t.insert(i, i)
+    left, right = t.split(14.5)
+    assert len(left) == 15 and len(right) == 25
+    assert sizes_correct(left.get_root_node()) and sizes_correct(right.get_root_node())
+
+    left.join(right)
+    assert len(left) == 40
+    assert sizes_correct(left.get_root_node())
+
+    small = TreapMap()
+    for i in range(41, 100, 2):
+        small.insert(i, i)
+    small.meld(left)
+    assert len(small) == 70
+    assert sizes_correct(small.get_root_node())
+    assert is_heap(small) and is_bst(small)
+
+    other = TreapMap()
+    for i in range(0, 100, 5):
+        other.insert(i, i)
+    small.difference(other)
+    assert len(small) == len(list(small))
+    assert sizes_correct(small.get_root_node())
+
+
+def test_select_rank() -> None:
+    """
+    Test order statistics against a sorted list of the keys.
+    """
+    t = TreapMap()
+    keys = list(range(0, 200, 3))
+    for i in reversed(keys):
+        t.insert(i, i)
+
+    for position, key in enumerate(keys):
+        assert t.select(position) == key
+        assert t[position] == key
+        assert t.rank(key) == position
+        assert t.rank(key + 1) == position + 1
+    assert t[-1] == keys[-1]
+    assert t[5:20:4] == keys[5:20:4]
+    assert t.rank(-10) == 0
+    with pytest.raises(IndexError):
+        t.select(len(keys))
+    with pytest.raises(IndexError):
+        t[-len(keys) - 1]
+
+
+def test_positional_delete() -> None:
+    """
+    Test deleting keys by position and by slices of positions.
+    """
+    t = TreapMap()
+    keys = list(range(100))
+    for i in keys:
+        t.insert(i, i)
+
+    for index in (0, -1, 10, slice(20, 40), slice(None, 5), slice(50, 70, 3), slice(30, 30)):
+        del t[index]
+        del keys[index]
+        assert list(t) == keys
+        assert len(t) == len(keys)
+        assert sizes_correct(t.get_root_node())
+        assert is_heap(t) and is_bst(t)
+    assert t.get_root_node().parent is None
+
+    del t[:]
+    assert len(t) == 0 and t.get_root_node() is None
+
+
+def test_range() -> None:
+    """
+    Test bounded iteration against filtering a sorted list of the keys.
+    """
+    t = TreapMap()
+    keys = list(range(0, 100, 2))
+    for i in keys:
+        t.insert(i, i)
+
+    for lo, hi in [(10, 20), (11, 21), (None, 7), (93, None), (None, None), (30, 30), (40, 10), (-5, 500)]:
+        for lo_inc in (True, False):
+            for hi_inc in (True, False):
+                expected = [
+                    k for k in keys
+                    if (lo is None or k > lo or (lo_inc and k == lo)) and (hi is None or k < hi or (hi_inc and k == hi))
+                ]
+                assert list(t.range(lo, hi, inclusive=(lo_inc, hi_inc))) == expected
+                assert list(t.range(lo, hi, inclusive=(lo_inc, hi_inc), reverse=True)) == expected[::-1]
+                assert t.count_range(lo, hi, inclusive=(lo_inc, hi_inc)) == len(expected)
+
+    assert list(TreapMap().range(0, 10)) == []
+
+
+def test_delete_range() -> None:
+    """
+    Test removing a range of keys.
+    """
+    t = TreapMap()
+    for i in range(100):
+        t.insert(i, str(i))
+
+    assert t.delete_range(20, 40) == 20
+    assert t.delete_range(20, 40) == 0
+    assert t.delete_range(90, 95, inclusive=(False, True)) == 5
+    assert t.delete_range(None, 5) == 5
+    expected = [k for k in range(5, 100) if not 20 <= k < 40 and not 90 < k <= 95]
+    assert list(t) == expected
+    assert len(t) == len(expected)
+    assert sizes_correct(t.get_root_node())
+    assert is_heap(t) and is_bst(t)
+    assert t.lookup(40) == '40'
+
+    assert t.delete_range() == len(expected)
+    assert t.get_root_node() is None
+
+
+def test_iteration_orders() -> None:
+    """
+    Test forward and reverse iteration, including over a degenerate, path shaped treap.
+    """
+    t = TreapMap()
+    for i in range(100):
+        t.insert(i, str(i))
+    assert list(t) == list(range(100))
+    assert list(reversed(t)) == list(reversed(range(100)))
+
+    # A path deeper than the recursion limit
+    path = TreapMap.from_sorted(((i, i) for i in range(5_000)), priority_source=lambda key: -key)
+    assert list(path) == list(range(5_000))
+    assert list(reversed(path)) == list(reversed(range(5_000)))
+
+
+def test_views() -> None:
+    """
+    Test the keys, values and items views.
+    """
+    t = TreapMap()
+    for i in range(10):
+        t.insert(i, str(i))
+    keys, values, items = t.keys(), t.values(), t.items()
+
+    assert list(keys) == list(range(10))
+    assert list(values) == [str(i) for i in range(10)]
+    assert list(items) == [(i, str(i)) for i in range(10)]
+    assert list(reversed(items)) == [(i, str(i)) for i in reversed(range(10))]
+    assert 3 in keys and 30 not in keys
+    assert '3' in values and '30' not in values
+    assert (3, '3') in items and (3, '4') not in items
+
+    # Views reflect later changes
+    t.remove(3)
+    assert len(keys) == 9
+    assert 3 not in keys
+    assert dict(items) == {i: str(i) for i in range(10) if i != 3}
+
+
+def test_split_existing_threshold() -> None:
+    """
+    Test that splitting on a key in the treap keeps every node, with the threshold on the right.
+    """
+    for _ in range(20):  # Run this test a bunch to account for randomness
+        t = TreapMap()
+        for i in range(50):
+            t.insert(i, str(i))
+        left, right = t.split(20)
+
+        assert list(left) == list(range(20))
+        assert list(right) == list(range(20, 50))
+        assert right.lookup(20) == '20'
+        assert len(left) == 20 and len(right) == 30
+        assert sizes_correct(left.get_root_node()) and sizes_correct(right.get_root_node())
+        assert is_heap(left) and is_bst(left) and is_heap(right) and is_bst(right)
+        assert left.get_root_node().parent is None and right.get_root_node().parent is None
+        assert t.get_root_node() is None and len(t) == 0
+
+
+def test_split_edges() -> None:
+    """
+    Test splitting below, above and on an empty treap.
+    """
+    t = TreapMap()
+    for i in range(10):
+        t.insert(i, i)
+    left, right = t.split(-1)
+    assert left.get_root_node() is None and list(right) == list(range(10))
+    left, right = right.split(100)
+    assert list(left) == list(range(10)) and right.get_root_node() is None
+    left, right = TreapMap().split(0)
+    assert len(left) == len(right) == 0
+
+
+def test_split_at_rank() -> None:
+    """
+    Test splitting by position.
+    """
+    t = TreapMap()
+    for i in range(0, 60, 2):
+        t.insert(i, i)
+    left, right = t.split_at_rank(7)
+    assert list(left) == list(range(0, 14, 2))
+    assert list(right) == list(range(14, 60, 2))
+    assert len(left) == 7 and len(right) == 23
+    assert is_heap(left) and is_bst(right)
+
+
+def test_join_any_key_type() -> None:
+    """
+    Test joining treaps of string keys, and treaps holding the key 0, which the old sentinel clashed with.
+    """
+    t, t2 = TreapMap(), TreapMap()
+    for word in ('apple', 'banana', 'cherry'):
+        t.insert(word, len(word))
+    for word in ('date', 'elderberry', 'fig'):
+        t2.insert(word, len(word))
+    t2.join(t)  # The smaller keys may be on either side
+    assert list(t2) == ['apple', 'banana', 'cherry', 'date', 'elderberry', 'fig']
+    assert len(t2) == 6 and len(t) == 0 and t.get_root_node() is None
+
+    t, t2 = TreapMap(), TreapMap()
+    for i in range(-5, 1):
+        t.insert(i, i)
+    for i in range(1, 6):
+        t2.insert(i, i)
+    t.join(t2)
+    assert list(t) == list(range(-5, 6))
+    assert t.lookup(0) == 0
+    assert sizes_correct(t.get_root_node())
+    assert is_heap(t) and is_bst(t)
+
+
+def test_join_overlapping() -> None:
+    """
+    Test that joining treaps with interleaved keys is rejected unless validation is skipped.
+    """
+    t, t2 = TreapMap(), TreapMap()
+    for i in range(0, 10, 2):
+        t.insert(i, i)
+    for i in range(1, 10, 2):
+        t2.insert(i, i)
+    with pytest.raises(ValueError):
+        t.join(t2)
+    assert list(t) == list(range(0, 10, 2)) and list(t2) == list(range(1, 10, 2))
+
+    t3 = TreapMap()
+    t3.insert(20, 20)
+    t.join(t3, validate=False)
+    assert list(t) == [0, 2, 4, 6, 8, 20]
+
+
+def test_meld_random() -> None:
+    """
+    Test meld against dict union on random, overlapping key sets.
+    """
+    rng = random.Random(11)
+    for _ in range(50):
+        a = {k: ('a', k) for k in rng.sample(range(300), rng.randrange(0, 100))}
+        b = {k: ('b', k) for k in rng.sample(range(300), rng.randrange(0, 100))}
+        t, t2 = TreapMap.from_items(a.items()), TreapMap.from_items(b.items())
+
+        t.meld(t2)
+        expected = {**a, **b}
+        assert list(t) == sorted(expected)
+        assert all(t.lookup(k) == v for k, v in expected.items())
+        assert len(t) == len(expected)
+        assert len(t2) == 0 and t2.get_root_node() is None
+        if len(t):
+            assert is_heap(t) and is_bst(t) and sizes_correct(t.get_root_node())
+
+
+def test_meld_conflict_policies() -> None:
+    """
+    Test each way of resolving keys held by both treaps.
+    """
+    def pair():
+        t, t2 = TreapMap(), TreapMap()
+        for i in range(10):
+            t.insert(i, i)
+        for i in range(5, 15):
+            t2.insert(i, 100 * i)
+        return t, t2
+
+    t, t2 = pair()
+    t.meld(t2, on_conflict='left')
+    assert [t.lookup(i) for i in range(4, 11)] == [4, 5, 6, 7, 8, 9, 1000]
+
+    t, t2 = pair()
+    t.meld(t2, on_conflict='right')
+    assert [t.lookup(i) for i in range(4, 11)] == [4, 500, 600, 700, 800, 900, 1000]
+
+    t, t2 = pair()
+    t.meld(t2, on_conflict=lambda mine, theirs: mine + theirs)
+    assert [t.lookup(i) for i in range(4, 11)] == [4, 505, 606, 707, 808, 909, 1000]
+    assert len(t) == 15
+
+    with pytest.raises(ValueError):
+        t.meld(TreapMap(), on_conflict='middle')
+
+
+def test_set_operations_random() -> None:
+    """
+    Test the destructive set operations against python sets on random, overlapping key sets.
+    """
+    rng = random.Random(12)
+    operations = [
+        ('difference', lambda a, b: a - b),
+        ('intersection', lambda a, b: a & b),
+        ('symmetric_difference', lambda a, b: a ^ b),
+    ]
+    for _ in range(30):
+        a = set(rng.sample(range(200), rng.randrange(0, 80)))
+        b = set(rng.sample(range(200), rng.randrange(0, 80)))
+        for name, expected in operations:
+            t = TreapMap.from_items((k, 'a') for k in a)
+            t2 = TreapMap.from_items((k, 'b') for k in b)
+            getattr(t, name)(t2)
+
+            assert list(t) == sorted(expected(a, b)), name
+            assert len(t) == len(expected(a, b))
+            if len(t):
+                assert is_heap(t) and is_bst(t) and sizes_correct(t.get_root_node())
+            assert all(t.lookup(k) == ('a' if k in a else 'b') for k in t)
+
+
+def test_set_operations_detach_root() -> None:
+    """
+    Test that the set operations leave a root without a parent when they drop the root of a small treap,
+    which can leave a child of the dropped node to be returned by `merge_nodes` as the new root.
+    """
+    t = TreapMap.from_items([(k, 1) for k in (0, 3, 10, 19)], RandomPriority(0))
+    t.symmetric_difference(TreapMap.from_items([(19, 2)], RandomPriority(0)))
+    assert t.get_root_node().parent is None and list(t) == [0, 3, 10] and len(t) == 3
+
+    rng = random.Random(13)
+    for seed in range(300):
+        a = set(rng.sample(range(20), rng.randrange(1, 6)))
+        b = set(rng.sample(sorted(a), 1)) | set(rng.sample(range(20), rng.randrange(0, 2)))
+        for name, expected in (('symmetric_difference', a ^ b), ('intersection', a & b), ('difference', a - b)):
+            t = TreapMap.from_items(((k, 'a') for k in a), RandomPriority(seed))
+            getattr(t, name)(TreapMap.from_items(((k, 'b') for k in b), RandomPriority(seed)))
+            assert t.get_root_node() is None or t.get_root_node().parent is None, name
+            assert list(t) == sorted(expected) and len(t) == len(expected), name
+
+
+def test_set_operations_with_itself() -> None:
+    """
+    Test the set operations given the Treap itself as the other Treap.
+    """
+    for cls in (TreapMap, IndexedTreapMap, AugmentedTreapMap, LazyTreapMap, InstrumentedTreapMap):
+        items = [(k, k) for k in range(10)]
+        for name, on_conflict, expected in (
+            ('meld', 'right', items),
+            ('meld', lambda a, b: a + b, [(k, 2 * k) for k in range(10)]),
+            ('intersection', 'left', items),
+            ('intersection', lambda a, b: a * b, [(k, k * k) for k in range(10)]),
+            ('difference', None, []),
+            ('symmetric_difference', None, []),
+        ):
+            t = cls.from_items(items)
+            if on_conflict is None:
+                getattr(t, name)(t)
+            else:
+                getattr(t, name)(t, on_conflict)
+            assert list(t.items()) == expected and len(t) == len(expected), (cls, name)
+            if expected:
+                assert is_heap(t) and is_bst(t) and sizes_correct(t.get_root_node())
+            if cls is IndexedTreapMap:
+                assert index_correct(t)
+            if cls is AugmentedTreapMap:
+                assert t.aggregate() == sum(v for _, v in expected)
+
+
+def test_set_operators() -> None:
+    """
+    Test that the operators return new treaps and leave their operands untouched.
+    """
+    t = TreapMap.from_items((i, 'left') for i in range(0, 20, 2))
+    t2 = TreapMap.from_items((i, 'right') for i in range(0, 20, 3))
+
+    assert list(t | t2) == sorted(set(range(0, 20, 2)) | set(range(0, 20, 3)))
+    assert (t | t2).lookup(6) == 'right'
+    assert list(t & t2) == [0, 6, 12, 18]
+    assert (t & t2).lookup(6) == 'left'
+    assert list(t - t2) == [2, 4, 8, 10, 14, 16]
+    assert list(t ^ t2) == [2, 3, 4, 8, 9, 10, 14, 15, 16]
+
+    assert list(t) == list(range(0, 20, 2)) and len(t) == 10
+    assert list(t2) == list(range(0, 20, 3)) and len(t2) == 7
+    assert is_heap(t) and is_bst(t) and sizes_correct(t.get_root_node())
+
+
+def test_copy() -> None:
+    """
+    Test that copies keep the shape and are independent of the original.
+    """
+    t = TreapMap()
+    for i in range(50):
+        t.insert(i, i)
+    c = t.copy()
+    assert shape(c.get_root_node()) == shape(t.get_root_node())
+    assert sizes_correct(c.get_root_node())
+    c.remove(10)
+    assert 10 in t and 10 not in c
+
+
+def test_persistent_snapshots() -> None:
+    """
+    Test that snapshots of a persistent treap are unaffected by later updates.
+    """
+    t = PersistentTreapMap()
+    for i in range(50):
+        t.insert(i, str(i))
+    snap = t.snapshot()
+
+    for i in range(0, 50, 2):
+        t.remove(i)
+    for i in range(50, 60):
+        t.insert(i, str(i))
+    t.insert(1, 'one')
+
+    assert list(snap) == list(range(50))
+    assert len(snap) == 50
+    assert snap.lookup(1) == '1' and snap.lookup(2) == '2'
+    assert list(t) == list(range(1, 50, 2)) + list(range(50, 60))
+    assert t.lookup(1) == 'one' and t.lookup(2) is None
+    assert is_heap(t) and is_bst(t) and is_heap(snap) and is_bst(snap)
+    assert t.remove(1000) is None
+
+
+def test_persistent_split_join() -> None:
+    """
+    Test that split and join leave their inputs intact and share structure.
+    """
+    t = PersistentTreapMap.from_sorted((i, i) for i in range(40))
+    left, right = t.split(15)
+    assert list(left) == list(range(15)) and list(right) == list(range(15, 40))
+    assert list(t) == list(range(40))
+
+    right.join(left)
+    assert list(right) == list(range(40))
+    assert list(left) == list(range(15))
+    with pytest.raises(ValueError):
+        right.join(left)
+
+    # Only the nodes on the updated path are copied, the rest are shared between versions
+    before = t.snapshot()
+    t.insert(100, 100)
+    shared = {id(node) for node in before.iter_nodes()} & {id(node) for node in t.iter_nodes()}
+    assert len(shared) >= 40 - 20
+
+
+def test_persistent_meld_difference() -> None:
+    """
+    Test the persistent set operations against python dicts.
+    """
+    rng = random.Random(13)
+    a = {k: 'a' for k in rng.sample(range(200), 60)}
+    b = {k: 'b' for k in rng.sample(range(200), 60)}
+    t = PersistentTreapMap.from_sorted(sorted(a.items()))
+    t2 = PersistentTreapMap.from_sorted(sorted(b.items()))
+
+    melded = t.snapshot()
+    melded.meld(t2)
+    assert list(melded.items()) == sorted({**a, **b}.items())
+    assert is_heap(melded) and is_bst(melded)
+
+    t.difference(t2)
+    assert list(t) == sorted(set(a) - set(b))
+    assert list(t2) == sorted(b)
+
+
+def test_concurrent_batches() -> None:
+    """
+    Test batched commits and the contention counters of the concurrent wrapper.
+    """
+    for treap in (TreapMap(), PersistentTreapMap()):
+        cmap = ConcurrentTreapMap(treap)
+        with cmap.batch() as batch:
+            for i in range(10):
+                batch.insert(i, i)
+            batch.remove(3)
+        assert list(cmap) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+
+        with pytest.raises(RuntimeError):
+            with cmap.batch() as batch:
+                batch.insert(100, 100)
+                raise RuntimeError
+        assert 100 not in cmap and len(cmap) == 9
+
+        stats = cmap.stats()
+        assert stats['batches'] == 1 and stats['batched_operations'] == 11
+        assert stats['write_acquisitions'] == 1
+
+
+def test_rwlock_excludes_writers() -> None:
+    """
+    Test that a writer waits for the readers holding the lock.
+    """
+    lock = RWLock()
+    events = []
+    lock.acquire_read()
+    lock.acquire_read()
+
+    def write() -> None:
+        with lock.write_locked():
+            events.append('write')
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    deadline = time.monotonic() + 10
+    while not lock._waiting_writers:  # Wait until the writer is queued behind the readers
+        assert time.monotonic() < deadline, "The writer never queued for the lock."
+        time.sleep(0.001)
+    events.append('read done')
+    lock.release_read()
+    lock.release_read()
+    writer.join()
+
+    assert events == ['read done', 'write']
+    assert lock.contended_writes == 1
+
+
+def test_concurrent_snapshot_keeps_priorities() -> None:
+    """
+    Test that snapshots of a non persistent treap keep its shape and draw no priorities from its source,
+    so seeded runs stay reproducible.
+    """
+    runs = []
+    for take_snapshots in (False, True):
+        cmap = ConcurrentTreapMap(TreapMap(priority_source=RandomPriority(14)))
+        for i in range(200):
+            cmap.insert(i, i)
+            if take_snapshots:
+                snapshot = cmap.snapshot()
+                assert list(snapshot) == list(range(i + 1))
+                assert snapshot.get_root_node().priority == cmap.treap.get_root_node().priority
+                list(cmap)
+        runs.append(shape(cmap.treap.get_root_node()))
+    assert runs[0] == runs[1]
+
+
+def test_concurrent_readers_and_writer() -> None:
+    """
+    Test that readers running alongside a writer always find the keys the writer does not touch.
+    """
+    for treap in (TreapMap(), PersistentTreapMap()):
+        cmap = ConcurrentTreapMap(treap)
+        for i in range(500):
+            cmap.insert(i, i)
+        misses = []
+
+        def read() -> None:
+            rng = random.Random()
+            for _ in range(2_000):
+                k = rng.randrange(500)
+                if cmap.lookup(k) != k:
+                    misses.append(k)
+
+        def write() -> None:
+            for i in range(500, 1_000):
+                with cmap.batch() as batch:
+                    batch.insert(i, i)
+                    batch.remove(i - 1 if i > 500 else 1_000)
+
+        threads = [threading.Thread(target=read) for _ in range(4)] + [threading.Thread(target=write)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not misses
+        assert list(cmap) == list(range(500)) + [999]
+
+
+def test_concurrent_mutating_reads() -> None:
+    """
+    Test that treaps whose reads rotate or push tags are read under the write lock, one reader at a time.
+    """
+    lazy = LazyTreapMap.from_items((i, i) for i in range(500))
+    lazy.update_range(100, 400, tag=1)  # Pending tags, pushed by the first reads
+    cases = [
+        (AdaptiveTreapMap.from_items((i, i) for i in range(500)), {i: i for i in range(500)}),
+        (lazy, {i: i + (100 <= i < 400) for i in range(500)}),
+    ]
+    for treap, expected in cases:
+        cmap = ConcurrentTreapMap(treap)
+        misses = []
+
+        def read() -> None:
+            rng = random.Random()
+            for _ in range(2_000):
+                k = rng.randrange(500)
+                if cmap.lookup(k) != expected[k]:
+                    misses.append(k)
+            with cmap.read() as t:
+                if dict(t.items()) != expected:
+                    misses.append(None)
+
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not misses and cmap.lock.read_acquisitions == 0
+        assert is_heap(treap) and is_bst(treap) and sizes_correct(treap.get_root_node())
+        assert dict(cmap.snapshot().items()) == expected
+    assert not ConcurrentTreapMap(TreapMap()).exclusive_reads
+
+
+def test_lookup_many() -> None:
+    """
+    Test batch lookup of unsorted keys, with duplicates and missing keys.
+    """
+    t = TreapMap()
+    for i in range(0, 1000, 2):
+        t.insert(i, str(i))
+    rng = random.Random(15)
+    keys = [rng.randrange(-10, 1010) for _ in range(300)] + [0, 998, 4, 4]
+    assert t.lookup_many(keys) == [t.lookup(k) for k in keys]
+    assert t.lookup_many([]) == []
+    assert TreapMap().lookup_many([1, 2]) == [None, None]
+
+
+def test_finger_search() -> None:
+    """
+    Test that a finger search from every node finds every larger key.
+    """
+    t = TreapMap()
+    keys = list(range(0, 60, 3))
+    for i in keys:
+        t.insert(i, i)
+    for start in t.iter_nodes():
+        for key in range(start.key, 65):
+            node, floor = t.finger_search(start, key)
+            assert (node.key if node is not None else None) == (key if key in keys else None)
+            assert floor.key == max(k for k in keys if k <= key)
+
+
+def test_insert_many() -> None:
+    """
+    Test batch insert, including overwrites and keys repeated within the batch.
+    """
+    t = TreapMap()
+    for i in range(0, 100, 2):
+        t.insert(i, 'old')
+    t.insert_many([(i, 'new') for i in range(50, 150, 5)] + [(55, 'last')])
+
+    expected = {**{i: 'old' for i in range(0, 100, 2)}, **{i: 'new' for i in range(50, 150, 5)}, 55: 'last'}
+    assert list(t.items()) == sorted(expected.items())
+    assert len(t) == len(expected)
+    assert is_heap(t) and is_bst(t) and sizes_correct(t.get_root_node())
+
+
+def test_implicit_treap_random() -> None:
+    """
+    Test the implicit treap against a python list under random edits.
+    """
+    rng = random.Random(16)
+    seq = ImplicitTreap(range(50))
+    expected = list(range(50))
+    for step in range(600):
+        op = rng.randrange(6)
+        i = rng.randrange(-len(expected), len(expected)) if expected else 0
+        j = rng.randrange(0, len(expected) + 1)
+        if op == 0:
+            seq.insert(i, step)
+            expected.insert(i, step)
+        elif op == 1 and expected:
+            assert seq.pop(i) == expected.pop(i)
+        elif op == 2:
+            seq.reverse(min(i % (len(expected) + 1), j), j)
+            lo = min(i % (len(expected) + 1), j)
+            expected[lo:j] = expected[lo:j][::-1]
+        elif op == 3 and expected:
+            seq[i] = -step
+            expected[i] = -step
+        elif op == 4:
+            del seq[j // 2:j]
+            del expected[j // 2:j]
+        else:
+            seq.append(step)
+            expected.append(step)
+        assert len(seq) == len(expected)
+    assert list(seq) == expected
+    assert seq[3:40] == expected[3:40]
+    assert seq[::-3] == expected[::-3]
+    assert [seq[i] for i in range(-len(expected), len(expected))] == expected + expected
+    assert sizes_correct(seq.get_root_node())
+
+
+def test_implicit_treap_split_concat() -> None:
+    """
+    Test splitting and concatenating sequences, including reversed ones.
+    """
+    seq = ImplicitTreap('abcdefghij')
+    seq.reverse(2, 8)
+    assert ''.join(seq) == 'abhgfedcij'
+
+    left, right = seq.split(4)
+    assert ''.join(left) == 'abhg' and ''.join(right) == 'fedcij'
+    assert len(seq) == 0
+
+    right.reverse()
+    right.concat(left)
+    assert ''.join(right) == 'jicdefabhg'
+    assert len(left) == 0
+    with pytest.raises(IndexError):
+        right[10]
+
+
+def aggregates_correct(node: TreapNode) -> bool:
+    """
+    Returns true if every node in the subtreap rooted at node stores the aggregate of its subtreap.
+    """
+    if node is None:
+        return True
+    monoid = node.monoid
+    total = monoid.measure(node.key, node.value)
+    if node.left_child is not None:
+        total = monoid.combine(node.left_child.aggregate, total)
+    if node.right_child is not None:
+        total = monoid.combine(total, node.right_child.aggregate)
+    return node.aggregate == total and aggregates_correct(node.left_child) and aggregates_correct(node.right_child)
+
+
+def test_aggregate_random() -> None:
+    """
+    Test `aggregate` over random ranges against a scan, for each built-in monoid.
+    """
+    rng = random.Random(17)
+    for monoid, brute in ((SUM, sum), (COUNT, len), (MIN, lambda vs: min(vs, default=None)),
+                          (MAX, lambda vs: max(vs, default=None))):
+        treap = AugmentedTreapMap(priority_source=RandomPriority(17), monoid=monoid)
+        expected = {}
+        for _ in range(400):
+            key = rng.randrange(200)
+            if rng.random() < 0.3:
+                treap.remove(key)
+                expected.pop(key, None)
+            else:
+                value = rng.randrange(-50, 50)
+                treap.insert(key, value)
+                expected[key] = value
+        assert aggregates_correct(treap.get_root_node())
+        for _ in range(100):
+            lo, hi = sorted(rng.randrange(-10, 210) for _ in range(2))
+            inclusive = (rng.random() < 0.5, rng.random() < 0.5)
+            values = [v for k, v in expected.items()
+                      if (lo < k or (inclusive[0] and k == lo)) and (k < hi or (inclusive[1] and k == hi))]
+            assert treap.aggregate(lo, hi, inclusive) == brute(values)
+        assert treap.aggregate() == brute(list(expected.values()))
+        assert treap.aggregate(hi=50) == brute([v for k, v in expected.items() if k < 50])
+
+
+def test_aggregate_through_split_join_meld() -> None:
+    """
+    Test that the aggregates survive split, join, meld and the set operations.
+    """
+    treap = AugmentedTreapMap.from_items(((i, i) for i in range(100)), monoid=SUM)
+    left, right = treap.split(40)
+    assert type(left) is AugmentedTreapMap and left.monoid is SUM
+    assert left.aggregate() == sum(range(40)) and right.aggregate() == sum(range(40, 100))
+    assert right.aggregate(50, 60) == sum(range(50, 60))
+
+    left.join(right)
+    assert left.aggregate() == sum(range(100))
+    assert aggregates_correct(left.get_root_node())
+
+    other = AugmentedTreapMap.from_items(((i, 1000) for i in range(90, 110)))
+    left.meld(other)
+    assert left.aggregate() == sum(range(90)) + 1000 * 20
+    assert aggregates_correct(left.get_root_node())
+
+    left.insert(0, 7)
+    left.insert_many([(200, 1), (201, 2)])
+    assert left.aggregate(hi=1) == 7
+    assert left.aggregate(200) == 3
+    left.difference(AugmentedTreapMap.from_items((i, 0) for i in range(0, 200, 2)))
+    assert left.aggregate() == sum(v for k, v in left.items())
+    assert aggregates_correct(left.get_root_node())
+    assert (left | left.copy()).aggregate() == left.aggregate()
+
+    # Non commutative monoids are combined in key order
+    concat = AugmentedTreapMap.from_items(((c, c) for c in 'treap'), monoid=Monoid(lambda a, b: a + b, ''))
+    assert concat.aggregate() == 'aeprt'
+    assert concat.aggregate('b', 'r') == 'ep'
+
+
+def test_update_range_random() -> None:
+    """
+    Test `update_range` with the built-in actions, mixed with lookups, inserts, removes and aggregates.
+    """
+    rng = random.Random(18)
+    for monoid, brute in ((SUM, sum), (MIN, lambda vs: min(vs, default=None)), (MAX, lambda vs: max(vs, default=None))):
+        for action in (ADD, ASSIGN):
+            treap = LazyTreapMap(priority_source=RandomPriority(18), monoid=monoid, action=action)
+            expected = {}
+            for _ in range(600):
+                key = rng.randrange(100)
+                op = rng.random()
+                if op < 0.3:
+                    value = rng.randrange(-50, 50)
+                    treap.insert(key, value)
+                    expected[key] = value
+                elif op < 0.4:
+                    assert treap.remove(key) == expected.pop(key, None)
+                elif op < 0.6:
+                    lo, hi = sorted(rng.randrange(100) for _ in range(2))
+                    tag = rng.randrange(-5, 6)
+                    treap.update_range(lo, hi, tag)
+                    for k in expected:
+                        if lo <= k < hi:
+                            expected[k] = expected[k] + tag if action is ADD else tag
+                elif op < 0.8:
+                    assert treap.lookup(key) == expected.get(key)
+                else:
+                    lo, hi = sorted(rng.randrange(100) for _ in range(2))
+                    assert treap.aggregate(lo, hi) == brute([v for k, v in expected.items() if lo <= k < hi])
+            assert dict(treap.items()) == expected
+            assert list(treap.values()) == [expected[k] for k in sorted(expected)]
+            assert is_heap(treap) and sizes_correct(treap.get_root_node())
+
+
+def test_update_range_split_join_meld() -> None:
+    """
+    Test that pending updates carry through split, join and meld, and a user-defined action.
+    """
+    treap = LazyTreapMap.from_items((i, i) for i in range(100))
+    treap.update_range(20, 80, 1000)
+    left, right = treap.split(50)
+    assert left.aggregate() == sum(range(50)) + 1000 * 30
+    assert list(right.values())[:3] == [1050, 1051, 1052]
+    left.update_range(tag=1)
+    left.join(right)
+    assert left.lookup(10) == 11 and left.lookup(30) == 1031 and left.lookup(60) == 1060
+    left.meld(LazyTreapMap.from_items((i, -i) for i in range(95, 105)))
+    left.update_range(90, None, 2, inclusive=(False, False))
+    assert [left.lookup(k) for k in (90, 91, 99, 104)] == [90, 93, -97, -102]
+    assert left.aggregate() == sum(left.values())
+
+    # Affine maps value -> a * value + b compose into one affine map
+    affine = Action(
+        lambda tag, value: tag[0] * value + tag[1],
+        lambda tag, pending: (tag[0] * pending[0], tag[0] * pending[1] + tag[1]),
+        lambda monoid, tag, aggregate, size: tag[0] * aggregate + tag[1] * size,
+    )
+    treap = LazyTreapMap.from_items(((i, i) for i in range(10)), action=affine)
+    treap.update_range(0, 5, (2, 1))
+    treap.update_range(3, 8, (3, 0))
+    assert list(treap.values()) == [1, 3, 5, 21, 27, 15, 18, 21, 8, 9]
+    assert treap.aggregate(2, 7) == 5 + 21 + 27 + 15 + 18
+
+
+def test_adaptive_promotes_hot_keys() -> None:
+    """
+    Test that frequently looked up keys move towards the root, keeping the treap valid.
+    """
+    rng = random.Random(19)
+    for promotion in ('count', 'random'):
+        treap = AdaptiveTreapMap.from_sorted(
+            ((i, str(i)) for i in range(2000)), RandomPriority(19), promotion=promotion
+        )
+        hot = [rng.randrange(2000) for _ in range(5)]
+        before = sum(treap.depth(k) for k in hot)
+        for _ in range(200):
+            for k in hot:
+                assert treap.lookup(k) == str(k)
+            treap.lookup(rng.randrange(2000))
+        assert sum(treap.depth(k) for k in hot) < before
+        assert sum(treap.depth(k) for k in hot) <= 5 * 6
+        assert is_heap(treap) and is_bst(treap) and sizes_correct(treap.get_root_node())
+        assert list(treap) == list(range(2000))
+
+        # Overwriting a key counts as an access
+        treap.insert(hot[0], 'hot')
+        assert treap.find_node(hot[0]).count >= 202
+        assert treap.lookup(hot[0]) == 'hot' and treap.lookup(-1) is None
+
+    with pytest.raises(ValueError):
+        AdaptiveTreapMap(promotion='splay')
+
+
+def extremes_cached(t: TreapMap) -> bool:
+    """
+    Returns true if the cached smallest and largest nodes of t are its first and last nodes.
+    """
+    return t.min_node is t.first_node() and t.max_node is t.last_node()
+
+
+def test_floor_ceiling_random() -> None:
+    """
+    Test floor, ceiling, lower and higher against bisect on a sorted list, and the cached extremes.
+    """
+    import bisect
+    rng = random.Random(20)
+    treap = TreapMap()
+    assert treap.min_item() is None and treap.floor(3) is None
+    keys = set()
+    for _ in range(500):
+        key = rng.randrange(0, 400, 2)
+        if rng.random() < 0.3:
+            treap.remove(key)
+            keys.discard(key)
+        else:
+            treap.insert(key, -key)
+            keys.add(key)
+        assert extremes_cached(treap)
+
+    ordered = sorted(keys)
+    for probe in range(-2, 403):
+        i = bisect.bisect_right(ordered, probe)
+        j = bisect.bisect_left(ordered, probe)
+        assert treap.floor(probe) == (ordered[i - 1] if i > 0 else None)
+        assert treap.lower(probe) == (ordered[j - 1] if j > 0 else None)
+        assert treap.ceiling(probe) == (ordered[j] if j < len(ordered) else None)
+        assert treap.higher(probe) == (ordered[i] if i < len(ordered) else None)
+    assert treap.min_item() == (ordered[0], -ordered[0])
+    assert treap.max_item() == (ordered[-1], -ordered[-1])
+
+
+def test_extremes_through_operations() -> None:
+    """
+    Test that the cached extremes follow pops, splits, joins, melds and range deletions.
+    """
+    treap = TreapMap.from_items((i, str(i)) for i in range(100))
+    assert treap.pop_min() == (0, '0') and treap.pop_max() == (99, '99')
+    assert treap.min_item() == (1, '1') and treap.max_item() == (98, '98')
+
+    left, right = treap.split(50)
+    assert extremes_cached(left) and extremes_cached(right) and extremes_cached(treap)
+    assert left.max_item() == (49, '49') and right.min_item() == (50, '50')
+    right.join(left)
+    assert extremes_cached(right) and right.min_item() == (1, '1')
+
+    right.meld(TreapMap.from_items([(-5, 'a'), (200, 'b')]))
+    assert extremes_cached(right) and right.min_item() == (-5, 'a') and right.max_item() == (200, 'b')
+    right.delete_range(100)
+    del right[:2]
+    assert extremes_cached(right) and right.min_item() == (2, '2') and right.max_item() == (98, '98')
+    right.difference(TreapMap.from_items([(2, None), (98, None)]))
+    assert extremes_cached(right)
+
+    empty = TreapMap()
+    with pytest.raises(KeyError):
+        empty.pop_min()
+    while right:
+        right.pop_max()
+        assert extremes_cached(right)
+    assert right.max_item() is None
+
+    lazy = LazyTreapMap.from_items((i, i) for i in range(10))
+    lazy.update_range(tag=5)
+    assert lazy.min_item() == (0, 5) and lazy.max_item() == (9, 14) and lazy.pop_min() == (0, 5)
+
+
+def test_dump_load_roundtrip(monkeypatch) -> None:
+    """
+    Test that `load` rebuilds the exact shape, priorities and items written by `dump`, over several chunks.
+    """
+    monkeypatch.setattr(serialization, 'CHUNK_ENTRIES', 7)
+    treap = TreapMap(priority_source=RandomPriority(21))
+    for k in random.Random(21).sample(range(1000), 100):
+        treap.insert(f"key{k:04}", (k, [k]))
+    buffer = io.BytesIO()
+    treap.dump(buffer)
+    loaded = TreapMap.load(io.BytesIO(buffer.getvalue()))
+    assert shape(loaded.get_root_node()) == shape(treap.get_root_node())
+    assert [n.priority for n in loaded.iter_nodes()] == [n.priority for n in treap.iter_nodes()]
+    assert list(loaded.items()) == list(treap.items())
+    assert sizes_correct(loaded.get_root_node()) and extremes_cached(loaded)
+
+    # Values marshal cannot write fall back to pickle, subclasses load their own nodes
+    buffer = io.BytesIO()
+    TreapMap.from_items((i, RandomPriority(i)) for i in range(20)).dump(buffer)
+    assert [v.seed for v in TreapMap.load(io.BytesIO(buffer.getvalue())).values()] == list(range(20))
+    buffer = io.BytesIO()
+    TreapMap.from_items((i, i) for i in range(20)).dump(buffer)
+    augmented = AugmentedTreapMap.load(io.BytesIO(buffer.getvalue()), monoid=MAX)
+    assert augmented.aggregate(3, 8) == 7
+
+    buffer = io.BytesIO()
+    TreapMap().dump(buffer)
+    assert len(TreapMap.load(io.BytesIO(buffer.getvalue()))) == 0
+    with pytest.raises(ValueError):
+        TreapMap.load(io.BytesIO(b'not a treap dump'))
+    buffer = io.BytesIO()
+    treap.dump(buffer)
+    with pytest.raises(ValueError):
+        TreapMap.load(io.BytesIO(buffer.getvalue()[:-5]))
+
+
+def test_disk_treap_random(tmp_path) -> None:
+    """
+    Test DiskTreapMap against a dict through random inserts, removes and lookups, and after reopening the file.
+    """
+    path = tmp_path / 'treap.db'
+    rng = random.Random(22)
+    expected = {}
+    with DiskTreapMap(path, priority_source=RandomPriority(22), cache_levels=3) as treap:
+        for _ in range(3000):
+            key = rng.randrange(500)
+            if rng.random() < 0.4:
+                assert treap.remove(key) == expected.pop(key, None)
+            else:
+                value = rng.randrange(-10 ** 12, 10 ** 12)
+                treap.insert(key, value)
+                expected[key] = value
+            probe = rng.randrange(500)
+            assert treap.lookup(probe) == expected.get(probe)
+        assert list(treap.items()) == sorted(expected.items())
+        assert len(treap) == len(expected)
+        root = treap.get_root_node()
+        assert all(node.priority <= root.priority for node in treap.iter_nodes())
+        size = path.stat().st_size
+
+    with DiskTreapMap(path) as treap:
+        assert dict(treap.items()) == expected
+        assert list(reversed(treap)) == sorted(expected, reverse=True)
+        # Removed records are reused before the file grows
+        for key in list(expected)[:50]:
+            treap.remove(key)
+        for key in range(1000, 1050):
+            treap.insert(key, key)
+    assert path.stat().st_size == size
+
+
+def disk_heap_ordered(treap: DiskTreapMap) -> bool:
+    """
+    Returns true if no record of treap has a higher priority than its parent.
+    """
+    for node in treap.iter_nodes():
+        for child in (node.left, node.right):
+            if child and treap.read(child)[0] > node.priority:
+                return False
+    return True
+
+
+def test_disk_treap_split_join(tmp_path) -> None:
+    """
+    Test splitting a DiskTreapMap into a second file and joining it back, from either side.
+    """
+    rng = random.Random(23)
+    expected = {k: -k for k in rng.sample(range(1000), 400)}
+    with DiskTreapMap(tmp_path / 'treap.db', priority_source=RandomPriority(23), cache_levels=3) as treap:
+        for key, value in expected.items():
+            treap.insert(key, value)
+        for i, threshold in enumerate((500, -1, 2000, 250.5)):
+            left, right = treap.split(threshold, tmp_path / f'upper{i}.db')
+            assert left is treap
+            assert list(left.items()) == sorted((k, v) for k, v in expected.items() if k < threshold)
+            assert list(right.items()) == sorted((k, v) for k, v in expected.items() if k >= threshold)
+            assert len(left) + len(right) == len(expected)
+            assert disk_heap_ordered(left) and disk_heap_ordered(right)
+            right.close()
+
+            with DiskTreapMap(tmp_path / f'upper{i}.db') as right:
+                if threshold == 250.5:  # Join from the other side: the lower keys into the upper file
+                    right.join(treap)
+                    assert len(treap) == 0
+                    right.join(treap)  # Joining an empty map changes nothing
+                    treap.join(right)
+                else:
+                    treap.join(right)
+                assert len(right) == 0
+            assert list(treap.items()) == sorted(expected.items()) and disk_heap_ordered(treap)
+            assert all(treap.lookup(k) == v for k, v in expected.items())
+
+        other = DiskTreapMap(tmp_path / 'other.db')
+        other.insert(500, 0)
+        with pytest.raises(ValueError):
+            treap.join(other)
+        with pytest.raises(ValueError):
+            treap.join(TreapMap())
+        other.close()
+        with pytest.raises(ValueError):
+            treap.split(10, tmp_path / 'other.db')
+        with pytest.raises(ValueError):  # Even an empty map is not overwritten
+            treap.split(10, tmp_path / 'upper0.db')
+        assert list(treap.items()) == sorted(expected.items())
+        for key in list(expected)[:100]:
+            assert treap.remove(key) == expected.pop(key)
+        assert list(treap.items()) == sorted(expected.items()) and disk_heap_ordered(treap)
+
+
+def test_disk_treap_split_default_paths(tmp_path) -> None:
+    """
+    Test that repeated splits with the default path each get a file of their own, which can be reopened.
+    """
+    with DiskTreapMap(tmp_path / 'treap.db', priority_source=RandomPriority(29)) as treap:
+        for k in range(100):
+            treap.insert(k, -k)
+        a, b = treap.split(50)
+        c, d = a.split(25)
+        assert c is a is treap
+        assert len({os.fspath(tmp_path / 'treap.db'), b.path, d.path}) == 3
+        assert list(treap.keys()) == list(range(25))
+        assert list(b.keys()) == list(range(50, 100)) and disk_heap_ordered(b)
+        assert list(d.keys()) == list(range(25, 50)) and disk_heap_ordered(d)
+        with DiskTreapMap(b.path) as reopened:  # The header is written by the split, before any close
+            assert list(reopened.items()) == [(k, -k) for k in range(50, 100)]
+        b.close()
+        d.close()
+
+
+def test_disk_treap_formats(tmp_path) -> None:
+    """
+    Test byte string keys and float values, and the checks made when opening a file.
+    """
+    path = tmp_path / 'words.db'
+    words = ['treap', 'heap', 'tree', 'key', 'priority', 'rotation']
+    with DiskTreapMap(path, key_format='8s', value_format='d') as treap:
+        for i, word in enumerate(words):
+            treap.insert(word.encode(), i / 2)
+        assert treap.lookup(b'heap') == 0.5 and treap.lookup(b'he') is None
+        assert treap.remove(b'tree') == 1.0
+    with DiskTreapMap(path) as treap:
+        assert list(treap) == sorted(w.encode() for w in words if w != 'tree')
+        with pytest.raises(AttributeError):
+            treap.meld(TreapMap())
+    with pytest.raises(ValueError):
+        DiskTreapMap(path, key_format='q')
+
+    with DiskTreapMap(tmp_path / 'short.db', key_format='4s', value_format='2s') as treap:
+        treap.insert(b'abcd', b'ok')
+        for key, value in ((b'abcdZ', b'no'), (b'ab\0', b'no'), (b'abc', b'toolong'), (b'abc', b'a\0')):
+            with pytest.raises(ValueError):
+                treap.insert(key, value)
+        assert list(treap.items()) == [(b'abcd', b'ok')]
+    (tmp_path / 'other.db').write_bytes(b'not a treap' * 20)
+    with pytest.raises(ValueError):
+        DiskTreapMap(tmp_path / 'other.db')
+
+
+def test_durable_recovery(tmp_path) -> None:
+    """
+    Test that committed updates survive reopening without a close, and that a torn log record is dropped.
+    """
+    rng = random.Random(23)
+    expected = {}
+    durable = DurableTreapMap(tmp_path, group_size=16, fsync=False)
+    for _ in range(500):
+        key = rng.randrange(200)
+        if rng.random() < 0.3:
+            assert durable.remove(key) == expected.pop(key, None)
+        else:
+            durable.insert(key, str(key))
+            expected[key] = str(key)
+    durable.delete_range(10, 20)
+    expected = {k: v for k, v in expected.items() if not 10 <= k < 20}
+    durable.meld(TreapMap.from_items([(1, 'one'), (1000, 'thousand')]), on_conflict='right')
+    expected.update({1: 'one', 1000: 'thousand'})
+    durable.join(TreapMap.from_items([(2000, 'x')]))
+    durable.difference(TreapMap.from_items([(2000, None), (1, None)]))
+    del expected[1]
+    durable.commit()
+    durable.insert(5000, 'uncommitted')  # Lost, as if the process crashed before the group filled up
+
+    with open(durable.log_path(durable.generation), 'ab') as fp:
+        fp.write(b'\x10\x00\x00\x00torn')
+    recovered = DurableTreapMap(tmp_path, fsync=False)
+    assert dict(recovered.items()) == expected
+    recovered.insert(3000, 'after')
+    recovered.close()
+
+    with DurableTreapMap(tmp_path, fsync=False) as durable:
+        assert durable.lookup(3000) == 'after'
+        halves = durable.split(100)
+        assert sum(len(half) for half in halves) == len(expected) + 1
+    assert len(DurableTreapMap(tmp_path, fsync=False)) == 0
+
+
+def test_durable_syncs_new_logs(tmp_path, monkeypatch) -> None:
+    """
+    Test that the directory is synced once each new log exists, before any record is committed to it.
+    """
+    synced = []
+
+    def sync_directory(directory: str) -> None:
+        synced.append(sorted(os.listdir(directory)))
+
+    monkeypatch.setattr(durable_treap_map, 'sync_directory', sync_directory)
+    durable = DurableTreapMap(tmp_path, group_size=1)
+    assert synced == [['log.0000000000']]
+    durable.insert(1, 'one')
+    durable.compact()
+    assert ['log.0000000000', 'log.0000000001'] in synced
+    durable.close()
+
+
+def test_durable_compaction(tmp_path) -> None:
+    """
+    Test compaction, directly and from the background thread, and recovery from the snapshot and the new log.
+    """
+    with DurableTreapMap(tmp_path, group_size=8, fsync=False, priority_source=RandomPriority(23)) as durable:
+        for i in range(100):
+            durable.insert(i, i)
+        durable.compact()
+        durable.remove(0)
+        assert durable.log_generations() == [durable.generation]
+
+    recovered = DurableTreapMap(tmp_path, fsync=False)
+    assert list(recovered) == list(range(1, 100))
+    recovered.close()
+
+    with DurableTreapMap(tmp_path, group_size=1000, fsync=False, flush_interval=0.01, compact_bytes=500) as durable:
+        for i in range(100, 300):
+            durable.insert(i, -i)
+        deadline = time.time() + 5
+        while durable.compactions == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        assert durable.compactions > 0
+    recovered = DurableTreapMap(tmp_path, fsync=False)
+    assert len(recovered) == 299 and recovered.lookup(299) == -299
+    recovered.close()
+
+
+def index_correct(t: IndexedTreapMap) -> bool:
+    """
+    Returns true if the index of t maps exactly the keys of t to their nodes.
+    """
+    return len(t.index) == len(t) and all(t.index.get(node.key) is node for node in t.iter_nodes())
+
+
+def test_indexed_random() -> None:
+    """
+    Test IndexedTreapMap against a dict through random inserts, overwrites, removals and range deletions.
+    """
+    rng = random.Random(24)
+    treap: IndexedTreapMap[int, int] = IndexedTreapMap()
+    expected = {}
+    for _ in range(2000):
+        key, op = rng.randrange(300), rng.random()
+        if op < 0.6:
+            treap.insert(key, -key)
+            expected[key] = -key
+        elif op < 0.95:
+            assert treap.remove(key) == expected.pop(key, None)
+        else:
+            hi = key + rng.randrange(20)
+            treap.delete_range(key, hi)
+            expected = {k: v for k, v in expected.items() if not key <= k < hi}
+        assert treap.lookup(key) == expected.get(key) and (key in treap) == (key in expected)
+    assert index_correct(treap) and is_heap(treap) and is_bst(treap) and sizes_correct(treap.get_root_node())
+    assert list(treap.items()) == sorted(expected.items())
+    assert treap.lookup_many([1, 2, 300]) == [expected.get(1), expected.get(2), None]
+
+
+def test_indexed_split_join_meld_difference() -> None:
+    """
+    Test that the indexes follow the nodes through splits, joins, melds and differences, with plain TreapMaps too.
+    """
+    treap = IndexedTreapMap.from_items((i, i) for i in range(100))
+    left, right = treap.split(30)
+    assert len(treap.index) == 0 and index_correct(left) and index_correct(right)
+    assert 29 in left and 30 not in left and right.lookup(30) == 30
+
+    right.join(left)
+    assert index_correct(right) and len(right) == 100 and len(left.index) == 0
+    right.join(TreapMap.from_items((i, i) for i in range(100, 110)))
+    assert index_correct(right) and right.lookup(105) == 105
+
+    rng = random.Random(25)
+    for small, large in ((right, IndexedTreapMap.from_items((i, 'b') for i in range(50, 400))),
+                         (IndexedTreapMap.from_items((i, 'b') for i in range(50, 60)), right)):
+        expected = {**dict(small.items()), **dict(large.items())}
+        small.meld(large)
+        assert index_correct(small) and dict(small.items()) == expected and len(large.index) == 0
+        right = small
+    right.meld(TreapMap.from_items((i, 'c') for i in rng.sample(range(400, 500), 50)))
+    assert index_correct(right) and len(right) == 450
+
+    right.difference(IndexedTreapMap.from_items((i, None) for i in range(0, 500, 2)))
+    right.difference(TreapMap.from_items((i, None) for i in range(1, 100, 2)))
+    assert index_correct(right) and list(right.range(hi=400)) == list(range(101, 400, 2))
+    right.intersection(TreapMap.from_items((i, None) for i in range(300)))
+    del right[:10]
+    assert index_correct(right) and right.lookup(119) is None and right.lookup(121) == 'b'
+
+
+def test_instrumented_counts() -> None:
+    """
+    Test that InstrumentedTreapMap behaves as TreapMap, and that its counts match the work done.
+    """
+    seen = []
+    treap = InstrumentedTreapMap(priority_source=HashPriority(), instruments=Instruments(seen.append))
+    plain = TreapMap(priority_source=HashPriority())
+    rotations = 0
+    for k in random.Random(25).sample(range(1000), 300):
+        treap.insert(k, k)
+        plain.insert(k, k)
+        rotations += seen[-1].left_rotations + seen[-1].right_rotations
+        assert seen[-1].operation == 'insert' and seen[-1].elapsed >= 0
+    assert shape(treap.get_root_node()) == shape(plain.get_root_node())
+    totals = treap.instruments.totals['insert']
+    assert totals.calls == 300 == len(seen) and totals.left_rotations + totals.right_rotations == rotations > 0
+
+    key = treap.get_root_node().left_child.key
+    assert treap.lookup(key) == key
+    stats = seen[-1]
+    assert stats.operation == 'lookup' and stats.comparisons == stats.nodes_visited + 1 == stats.depth + 2
+    assert sum(treap.instruments.search_depths()) == 300
+    assert 'find_node' not in treap.instruments.totals  # Counted as part of `lookup`
+
+    treap.pop_min()
+    assert seen[-1].operation == 'remove' and seen[-1].left_rotations + seen[-1].right_rotations > 0
+
+    left, right = treap.split(500)
+    stats = seen[-1]
+    assert stats.operation == 'split' and 0 < stats.nodes_visited <= stats.comparisons <= 2 * stats.nodes_visited
+    assert left.instruments is right.instruments is treap.instruments
+    left.join(right)
+    left.meld(InstrumentedTreapMap.from_items((k, k) for k in range(0, 1000, 7)))
+    assert [s.operation for s in seen[-2:]] == ['join', 'meld'] and seen[-1].nodes_visited > 0
+    assert left.delete_range(100, 200) > 0 and seen[-1].comparisons > 0
+    assert is_heap(left) and is_bst(left) and sizes_correct(left.get_root_node())
+
+    treap.instruments.reset()
+    assert not treap.instruments.totals and treap.instruments.search_depths() == []